@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: benchmark the fused derived-variable engine against the DataClass operator chains
+'''
+
+# Usage: python bench_derived.py [--nz 50 --ny 222 --nx 360 --repeat 3]
+# Peak memory is the tracemalloc peak of numpy allocations above the inputs,
+# i.e. outputs plus every temporary created during the evaluation.
+
+import argparse
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import numpy as np
+
+from pyWRF.data import DataClass
+from pyWRF.derived_vars import FusedEngine, get_base_fields, HYDROMETEORS
+from pyWRF.kernels import WRF_R_D, WRF_RVD_M_O, WRF_G
+
+VARNAMES = ['P', 'T', 'Pw', 'RHO', 'N', 'Zw', 'Zm', 'QR_v', 'QS_v']
+
+def make_fields(nz, ny, nx, seed=0):
+    rng = np.random.default_rng(seed)
+    shape, shape_w = (nz, ny, nx), (nz+1, ny, nx)
+    eta = np.linspace(1., 0.05, nz+1)
+    eta_m = 0.5 * (eta[1:] + eta[:-1])
+    fields = {
+        'PB': np.broadcast_to(1e5*eta_m[:,None,None], shape).astype('float32'),
+        'Pp': rng.normal(0., 100., shape).astype('float32'),
+        'Thetap': rng.normal(10., 2., shape).astype('float32'),
+        'T00': np.array(290., dtype='float32'),
+        'P00': np.array(1e5, dtype='float32'),
+        'PHB': np.broadcast_to(WRF_G*(200.-7000.*np.log(eta))[:,None,None], shape_w).astype('float32'),
+        'PH': rng.normal(0., 10., shape_w).astype('float32'),
+    }
+    for q in ['QV'] + HYDROMETEORS:
+        fields[q] = np.abs(rng.normal(1e-3, 1e-4, shape)).astype('float32')
+    return fields
+
+def to_dataclass(name, arr):
+    var = DataClass()
+    var.file, var.name, var.data, var.dim = None, name, arr, arr.ndim
+    var.dimensions = ('bottom_top_stag',) if arr.shape and name in ['PHB', 'PH'] else ('bottom_top',)
+    var.dimensions += ('south_north', 'west_east')[:max(arr.ndim-1, 0)]
+    var.coordinates = OrderedDict((dim, np.arange(n)) for dim, n in zip(var.dimensions, arr.shape))
+    var.attributes = {'time':'2013-10-06 00:00:00'}
+    return var
+
+def operator_chain(d):
+    # the formulas of get_derived_var written as chains of DataClass operators
+    r = {}
+    r['P'] = d['Pp'] + d['PB']
+    r['T'] = (d['Thetap'] + d['T00'].data) * ((r['P'] / d['P00'].data)**0.2857)
+    r['Pw'] = (r['P'] * d['QV']) / (d['QV'] * (1 - 0.6357) + 0.6357)
+    r['RHO'] = r['P'] / (r['T'] * WRF_R_D * ((d['QV'] * WRF_RVD_M_O
+        - d['QR'] - d['QC'] - d['QI'] - d['QS'] - d['QG']) + 1.0))
+    r['N'] = (77.6 / r['T']) * (0.01 * r['P'] + 4810 * (0.01 * r['Pw']) / r['T'])
+    r['Zw'] = (d['PHB'] + d['PH']) / WRF_G
+    Zw1, Zw2 = r['Zw'].get_vertical_slice((slice(0, -1),)), r['Zw'].get_vertical_slice((slice(1, None),))
+    Rv = WRF_R_D * (1 + 0.378 * r['Pw'] / r['P'])
+    a = WRF_G / Rv / r['T']
+    s = 2. / (1. / np.e**(a * Zw1) + 1. / np.e**(a * Zw2))
+    r['Zm'] = 1. / a * s.log()
+    r['QR_v'] = d['QR'] * r['RHO']
+    r['QS_v'] = d['QS'] * r['RHO']
+    return r
+
+def measure(func, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+        del result
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='fused engine vs DataClass operators')
+    parser.add_argument('--nz', type=int, default=50)
+    parser.add_argument('--ny', type=int, default=222)
+    parser.add_argument('--nx', type=int, default=360)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    fields = make_fields(args.nz, args.ny, args.nx)
+    fields = dict((name, fields[name]) for name in get_base_fields(VARNAMES))
+    dvars = dict((name, to_dataclass(name, arr)) for name, arr in fields.items())
+    field_bytes = args.nz * args.ny * args.nx * 4
+
+    t_op, peak_op, r_op = measure(lambda: operator_chain(dvars), args.repeat)
+    t_fu, peak_fu, r_fu = measure(lambda: FusedEngine(fields).evaluate(VARNAMES), args.repeat)
+
+    print('domain {}x{}x{}, {} derived variables'.format(args.nz, args.ny, args.nx, len(VARNAMES)))
+    # temporaries: what is allocated on top of the outputs, in units of one 3-D field
+    output_bytes = sum(r_fu[name].nbytes for name in VARNAMES)
+    print('{:>20s} {:>10s} {:>12s} {:>12s}'.format('', 'time [s]', 'peak [MiB]', 'temporaries'))
+    for label, t, peak in [('operator chain', t_op, peak_op), ('fused engine', t_fu, peak_fu)]:
+        print('{:>20s} {:10.3f} {:12.1f} {:12.1f}'.format(label, t, peak / 1024.**2, float(peak - output_bytes) / field_bytes))
+    print('speed-up {:.2f}x, peak memory reduced {:.2f}x'.format(t_op / t_fu, float(peak_op) / peak_fu))
+
+    for name in VARNAMES:
+        err = np.max(np.abs(r_op[name].data - r_fu[name]) / np.maximum(np.abs(r_fu[name]), 1e-30))
+        print('  {:>5s} max relative difference {:.2e}'.format(name, err))
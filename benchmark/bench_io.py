@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: benchmark the reading, derived variables, heights and interpolation paths of pyWRF
+'''
+
+# Usage: python bench_io.py [--sizes 60x40x20 360x222x50 --cases all --repeat 3 --dir /tmp --json out.json]
+# A synthetic wrfout file is written for each size (nx x ny x nz), see make_wrfout.py.
+# Every case runs in its own process: the wall time is the best of repeat runs, each on a newly
+# opened file, and the peak RSS (resource.getrusage) is that of the process, the RSS of the
+# interpreter with pyWRF imported is given by the case 'import'.
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from make_wrfout import make_wrfout
+
+import pyWRF as pw
+from pyWRF.interp import interpolate_points
+
+def case_import(fname):
+    return lambda: None
+
+def case_open_file(fname):
+    return lambda: pw.open_file(fname).close()
+
+def case_base(fname):
+    return lambda: pw.open_file(fname).get_variable(['U', 'V', 'W', 'QV', 'QR'], itime=1)
+
+def case_derived(fname):
+    return lambda: pw.open_file(fname).get_variable(['RHO', 'N', 'QR_v', 'QS_v', 'Zm'], itime=1)
+
+def case_heights(fname):
+    return lambda: pw.open_file(fname).get_variable(['P', 'T', 'U', 'V', 'W', 'QR_v'], itime=1, assign_heights=True)
+
+def case_wgs_to_wrf(fname):
+    f = pw.open_file(fname)
+    proj_info = f.get_projection()
+    lat, lon = f.get_variable('XLAT').data, f.get_variable('XLONG').data
+    rng = np.random.default_rng(0)
+    coords = np.vstack([rng.uniform(lat.min(), lat.max(), 10**6), rng.uniform(lon.min(), lon.max(), 10**6)]).T
+    return lambda: pw.WGS_to_WRF(coords, proj_info)
+
+def get_points(fname, npts):
+    f = pw.open_file(fname)
+    lat, lon = f.get_variable('XLAT').data, f.get_variable('XLONG').data
+    rng = np.random.default_rng(0)
+    return rng.uniform(lat.min(), lat.max(), npts), rng.uniform(lon.min(), lon.max(), npts), rng.uniform(500., 10000., npts)
+
+def case_interp_points(fname):
+    lat, lon, heights = get_points(fname, 10**5)
+    return lambda: interpolate_points(pw.open_file(fname), ['T', 'RHO', 'U'], lat, lon, heights, itime=1)
+
+def case_interp_levels(fname):
+    levels = [92500., 85000., 70000., 50000., 30000.]
+    return lambda: pw.open_file(fname).get_variable_on_levels(['T', 'QV', 'RHO'], levels, coordinate='P', itime=1)
+
+CASES = OrderedDict([('import', case_import), ('open_file', case_open_file), ('base', case_base),
+                     ('derived', case_derived), ('heights', case_heights), ('wgs_to_wrf', case_wgs_to_wrf),
+                     ('interp_points', case_interp_points), ('interp_levels', case_interp_levels)])
+
+def get_peak_rss():
+    # in bytes, ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def run_case(name, fname, repeat):
+    # in the process of the case
+    func = CASES[name](fname)
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+        del result
+    return {'case':name, 'time':best, 'peak_rss':get_peak_rss()}
+
+def get_file(directory, size):
+    nx, ny, nz = [int(n) for n in size.split('x')]
+    fname = os.path.join(directory, 'wrfout_bench_{}x{}x{}.nc'.format(nx, ny, nz))
+    if not os.path.exists(fname): # written by a child process, the cases would inherit its peak RSS
+        subprocess.check_call([sys.executable, os.path.abspath(__file__), '--make', size, fname])
+    return fname
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark pyWRF on synthetic wrfout files')
+    parser.add_argument('--sizes', nargs='+', default=['60x40x20', '180x120x40', '360x222x50'], help='nx x ny x nz')
+    parser.add_argument('--cases', nargs='+', default=list(CASES.keys()), choices=list(CASES.keys()))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--dir', default=None, help='directory of the synthetic files (default: temporary)')
+    parser.add_argument('--json', default=None, help='write the results to this file')
+    parser.add_argument('--run', nargs=2, metavar=('CASE', 'FILE'), help=argparse.SUPPRESS)
+    parser.add_argument('--make', nargs=2, metavar=('SIZE', 'FILE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.make is not None: # write a synthetic file, in a child process
+        nx, ny, nz = [int(n) for n in args.make[0].split('x')]
+        make_wrfout(args.make[1], nx=nx, ny=ny, nz=nz, ntimes=2)
+        sys.exit(0)
+
+    if args.run is not None: # a single case, in a child process
+        print(json.dumps(run_case(args.run[0], args.run[1], args.repeat)))
+        sys.exit(0)
+
+    directory = args.dir if args.dir is not None else tempfile.mkdtemp(prefix='pyWRF_bench_')
+    results = []
+    print('{:>14s} {:>14s} {:>10s} {:>14s}'.format('size', 'case', 'time [s]', 'peak RSS [MiB]'))
+    for size in args.sizes:
+        fname = get_file(directory, size)
+        for name in args.cases:
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--repeat', str(args.repeat),
+                                              '--run', name, fname], universal_newlines=True)
+            result = json.loads(output.strip().splitlines()[-1])
+            result['size'] = size
+            results.append(result)
+            print('{:>14s} {:>14s} {:10.4f} {:14.1f}'.format(size, name, result['time'], result['peak_rss'] / 1024.**2))
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
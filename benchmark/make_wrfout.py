@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: write synthetic wrfout files for the benchmarks
+'''
+
+# Usage: python make_wrfout.py [--nx 360 --ny 222 --nz 50 --ntimes 4 --nfiles 1 --dir .]
+# The files have the dimensions, variables and global attributes read by pyWRF:
+# terrain, hydrostatic base state (PB, PHB) of a standard atmosphere, perturbations
+# P, PH, T of a moving warm bubble, moisture, hydrometeors in its cloud, winds and XTIME.
+# Memory is one time step: the frames are written one after the other.
+
+import argparse
+import datetime
+import os
+
+import numpy as np
+import netCDF4 as nc
+
+from pyWRF.utilities import get_projector
+from pyWRF.kernels import WRF_R_D, WRF_G
+
+# the projection of the benchmarks, a Lambert conformal grid over East China
+PROJ_INFO = {'TRUELAT1':30., 'TRUELAT2':60., 'MOAD_CEN_LAT':30., 'STAND_LON':125.,
+             'CEN_LAT':28.8117, 'CEN_LON':123.2079, 'DX':3000., 'DY':3000.}
+
+P_TOP = 5000.
+T00 = 290.
+P00 = 1e5
+
+def get_fname(directory, start, domain=1):
+    return os.path.join(directory, 'wrfout_d{:02d}_{}'.format(domain, start.strftime('%Y-%m-%d_%H_%M_%S')))
+
+def standard_temperature(p):
+    # temperature of the standard atmosphere at pressure p, isothermal above the tropopause
+    return np.maximum(288.15 * (p / 101325.)**0.190263, 216.65)
+
+def saturation_mixing_ratio(T, p):
+    es = 611.2 * np.exp(17.67 * (T - 273.15) / (T - 29.65))
+    return 0.622 * es / np.maximum(p - es, 1.)
+
+def create_file(fname, nx, ny, nz, start, proj_info):
+    f = nc.Dataset(fname, 'w', format='NETCDF4')
+    f.TITLE = ' OUTPUT FROM SYNTHETIC WRF'
+    f.START_DATE = f.SIMULATION_START_DATE = start.strftime('%Y-%m-%d_%H:%M:%S')
+    f.setncattr('WEST-EAST_GRID_DIMENSION', np.int32(nx+1))
+    f.setncattr('SOUTH-NORTH_GRID_DIMENSION', np.int32(ny+1))
+    f.setncattr('BOTTOM-TOP_GRID_DIMENSION', np.int32(nz+1))
+    f.MAP_PROJ = np.int32(1)
+    for att, value in proj_info.items():
+        f.setncattr(att, np.float32(value))
+
+    for dim, n in [('Time', None), ('DateStrLen', 19), ('bottom_top', nz), ('bottom_top_stag', nz+1),
+                   ('south_north', ny), ('south_north_stag', ny+1), ('west_east', nx), ('west_east_stag', nx+1)]:
+        f.createDimension(dim, n)
+    f.createVariable('Times', 'S1', ('Time', 'DateStrLen'))
+    xtime = f.createVariable('XTIME', 'f4', ('Time',))
+    xtime.units = 'minutes since ' + start.strftime('%Y-%m-%d %H:%M:%S')
+
+    mass = ('Time', 'bottom_top', 'south_north', 'west_east')
+    variables = [
+        ('XLAT', ('Time', 'south_north', 'west_east'), 'LATITUDE, SOUTH IS NEGATIVE', 'degree_north', ''),
+        ('XLONG', ('Time', 'south_north', 'west_east'), 'LONGITUDE, WEST IS NEGATIVE', 'degree_east', ''),
+        ('HGT', ('Time', 'south_north', 'west_east'), 'Terrain Height', 'm', ''),
+        ('T00', ('Time',), 'BASE STATE TEMPERATURE', 'K', ''),
+        ('P00', ('Time',), 'BASE STATE PRESSURE', 'Pa', ''),
+        ('PB', mass, 'BASE STATE PRESSURE', 'Pa', ''),
+        ('P', mass, 'perturbation pressure', 'Pa', ''),
+        ('T', mass, 'perturbation potential temperature (theta-t0)', 'K', ''),
+        ('PHB', ('Time', 'bottom_top_stag', 'south_north', 'west_east'), 'base-state geopotential', 'm2 s-2', 'Z'),
+        ('PH', ('Time', 'bottom_top_stag', 'south_north', 'west_east'), 'perturbation geopotential', 'm2 s-2', 'Z'),
+        ('U', ('Time', 'bottom_top', 'south_north', 'west_east_stag'), 'x-wind component', 'm s-1', 'X'),
+        ('V', ('Time', 'bottom_top', 'south_north_stag', 'west_east'), 'y-wind component', 'm s-1', 'Y'),
+        ('W', ('Time', 'bottom_top_stag', 'south_north', 'west_east'), 'z-wind component', 'm s-1', 'Z'),
+        ('QVAPOR', mass, 'Water vapor mixing ratio', 'kg kg-1', ''),
+        ('QCLOUD', mass, 'Cloud water mixing ratio', 'kg kg-1', ''),
+        ('QRAIN', mass, 'Rain water mixing ratio', 'kg kg-1', ''),
+        ('QICE', mass, 'Ice mixing ratio', 'kg kg-1', ''),
+        ('QSNOW', mass, 'Snow mixing ratio', 'kg kg-1', ''),
+        ('QGRAUP', mass, 'Graupel mixing ratio', 'kg kg-1', ''),
+    ]
+    for name, dims, description, units, stagger in variables:
+        chunksizes = [1] + [len(f.dimensions[dim]) for dim in dims[1:]]
+        var = f.createVariable(name, 'f4', dims, chunksizes=chunksizes)
+        var.FieldType = np.int32(104)
+        var.MemoryOrder = 'XYZ'[:len(dims)-1] if len(dims) > 1 else '0  '
+        var.description = description
+        var.units = units
+        var.stagger = stagger
+    return f
+
+def get_frame(nx, ny, nz, minutes, lat, lon, seed=0):
+    # all the variables of one time step
+    rng = np.random.default_rng(seed)
+    x = np.arange(nx)[None, None, :] / float(nx)
+    y = np.arange(ny)[None, :, None] / float(ny)
+
+    # [A]. terrain: a hill in the west of the domain
+    hgt = 1500. * np.exp(-((x[0]-0.3)**2 + (y[0]-0.5)**2) / 0.02)
+
+    # [B]. hydrostatic base state on eta levels
+    eta_w = (1. - np.linspace(0., 1., nz+1)**1.3)[:, None, None]
+    eta_m = 0.5 * (eta_w[1:] + eta_w[:-1])
+    ps = 101325. * np.exp(-hgt / 8000.)
+    pw = eta_w * (ps - P_TOP) + P_TOP
+    pb = eta_m * (ps - P_TOP) + P_TOP
+    Tm = standard_temperature(pb)
+    dz = WRF_R_D * Tm / WRF_G * np.log(pw[:-1] / pw[1:])
+    zw = np.concatenate([hgt[None], hgt[None] + np.cumsum(dz, axis=0)], axis=0)
+    zm = 0.5 * (zw[1:] + zw[:-1])
+
+    # [C]. perturbations: a warm moist bubble moving east with the mean wind
+    xc = (0.2 + minutes / 1440.) % 1.
+    bubble = np.exp(-((x-xc)**2 + (y-0.5)**2) / 0.01 - ((zm-3000.)/2500.)**2)
+    theta = Tm * (P00 / pb)**0.2857 + 2. * bubble
+    p = -30. * bubble + rng.normal(0., 1., pb.shape)
+    ph = WRF_G * 20. * np.exp(-((x-xc)**2 + (y-0.5)**2) / 0.01) * np.linspace(0., 1., nz+1)[:, None, None]
+    T = (theta - T00) * np.ones_like(pb)
+
+    # [D]. moisture and the hydrometeors of the bubble, liquid below and ice above the freezing level
+    tk = theta * ((pb + p) / P00)**0.2857
+    rh = 0.8 * (pb / ps)**3 + 0.15 * bubble
+    qv = rh * saturation_mixing_ratio(tk, pb + p)
+    cloud = 2e-3 * bubble
+    warm = (tk > 273.15).astype('float64')
+    qc, qr = 0.4 * cloud * warm, 0.6 * cloud * warm
+    qi, qs, qg = 0.2 * cloud * (1.-warm), 0.5 * cloud * (1.-warm), 0.3 * cloud * (1.-warm)
+
+    # [E]. winds: a westerly jet and the updraft of the bubble
+    zs = np.concatenate([zm[:, :, :1], 0.5*(zm[:, :, 1:] + zm[:, :, :-1]), zm[:, :, -1:]], axis=2)
+    u = 10. + 20. * np.sin(np.pi * np.minimum(zs, 12000.) / 24000.)
+    zs = np.concatenate([zm[:, :1], 0.5*(zm[:, 1:] + zm[:, :-1]), zm[:, -1:]], axis=1)
+    v = 5. * np.cos(np.pi * np.minimum(zs, 12000.) / 12000.)
+    w = 5. * np.exp(-((x-xc)**2 + (y-0.5)**2) / 0.01 - ((zw-5000.)/4000.)**2)
+
+    return {'XLAT':lat, 'XLONG':lon, 'HGT':hgt, 'T00':T00, 'P00':P00, 'PB':pb, 'P':p, 'T':T,
+            'PHB':WRF_G * zw, 'PH':ph, 'U':u, 'V':v, 'W':w, 'QVAPOR':qv, 'QCLOUD':qc, 'QRAIN':qr,
+            'QICE':qi, 'QSNOW':qs, 'QGRAUP':qg}
+
+def make_wrfout(fname, nx=360, ny=222, nz=50, ntimes=4, start=datetime.datetime(2013, 10, 6),
+                first_minutes=0., interval=60., proj_info=PROJ_INFO, seed=0):
+    # a wrfout file of ntimes frames every interval minutes, from first_minutes after start
+    iy, ix = np.mgrid[0:ny, 0:nx]
+    lat, lon = get_projector(dict(proj_info, nI=nx, nJ=ny)).to_wgs(ix.astype('float64'), iy.astype('float64'))
+
+    f = create_file(fname, nx, ny, nz, start, proj_info)
+    try:
+        for itime in range(ntimes):
+            minutes = first_minutes + itime * interval
+            f.variables['XTIME'][itime] = minutes
+            valid = start + datetime.timedelta(minutes=minutes)
+            f.variables['Times'][itime] = list(valid.strftime('%Y-%m-%d_%H:%M:%S'))
+            for name, value in get_frame(nx, ny, nz, minutes, lat, lon, seed+itime).items():
+                f.variables[name][itime] = value
+    finally:
+        f.close()
+    return fname
+
+def make_series(directory, nfiles=2, ntimes=4, interval=60., start=datetime.datetime(2013, 10, 6), **kwargs):
+    # nfiles consecutive wrfout files of ntimes frames, all with the same START_DATE
+    fnames = []
+    for ifile in range(nfiles):
+        first_minutes = ifile * ntimes * interval
+        fname = get_fname(directory, start + datetime.timedelta(minutes=first_minutes))
+        fnames.append(make_wrfout(fname, ntimes=ntimes, start=start, first_minutes=first_minutes,
+                                  interval=interval, **kwargs))
+    return fnames
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='write synthetic wrfout files')
+    parser.add_argument('--nx', type=int, default=360)
+    parser.add_argument('--ny', type=int, default=222)
+    parser.add_argument('--nz', type=int, default=50)
+    parser.add_argument('--ntimes', type=int, default=4)
+    parser.add_argument('--nfiles', type=int, default=1)
+    parser.add_argument('--interval', type=float, default=60., help='minutes between frames')
+    parser.add_argument('--dir', default='.')
+    args = parser.parse_args()
+
+    for fname in make_series(args.dir, args.nfiles, args.ntimes, args.interval, nx=args.nx, ny=args.ny, nz=args.nz):
+        print(fname)
@@ -42,4 +42,5 @@ file_h = pw.open_file('../../cosmo_pol/pathos/WRF/wsm6/wrfout_d03_2013-10-06_00_
 
 # [6]. Time test
 d = file_h.get_variable(['U'], itime=10, assign_heights=True)
-print(file_h.dic_variables['T'].attributes['time'])
+print(d['U'].attributes['time'])
+print(file_h.cache_info())
@@ -14,10 +14,24 @@ import numpy as np
 import os
 import gc
 import warnings
+import logging
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # local import
-from pyWRF.derived_vars import DERIVED_VARS, get_derived_var
+from pyWRF.derived_vars import DERIVED_VARS, DERIVED_REGISTRY, get_input_vars, compute_derived_var, get_base_fields, FusedEngine, \
+    get_formula_version
 import pyWRF.data as d
+from pyWRF.utilities import WGS_to_WRF, get_window_slice, set_window_range
+from pyWRF.cache import VariableCache, DiskCache, DEFAULT_CACHE_SIZE, get_cache_key
+from pyWRF.interp import VerticalInterpolator, LEVEL_COORDINATES
+from pyWRF.writer import write_frames, DERIVED_ATTRIBUTE
+from pyWRF.profiler import Profiler, get_timer
+from pyWRF.readers import ReaderPool, read_hyperslab
+from pyWRF.stations import StationColumns, read_station_series
+
+logger = logging.getLogger(__name__)
 
 # netcdf attributes
 _nc_builtins = ['__class__', '__delattr__', '__doc__', '__getattribute__', '__hash__', '__dict__',\
@@ -26,27 +40,40 @@ _nc_builtins = ['__class__', '__delattr__', '__doc__', '__getattribute__', '__ha
 
 _nc_localatts = ['variables', 'dimensions', 'groups']
 
-def open_file(fname): # Just create a file_instance class
-    return FileClass(fname)
+# variables which do not change with time in a wrfout file (for a fixed domain),
+# they are read once and carried forward by FileClass.iter_frames
+TIME_INVARIANT_VARS = ['HGT', 'PHB', 'PB', 'T00', 'P00']
+
+# global attributes of the WRF projection
+_proj_atts = ['TRUELAT1', 'TRUELAT2', 'MOAD_CEN_LAT', 'STAND_LON', 'CEN_LAT', 'CEN_LON', 'DX', 'DY']
+
+def open_file(fname, cache_size=DEFAULT_CACHE_SIZE, disk_cache=None): # Just create a file_instance class
+    return FileClass(fname, cache_size=cache_size, disk_cache=disk_cache)
+
+# alias table, read once per process by get_alias_dic
+_alias_dic = None
 
 def get_alias_dic():
-    cur_path=os.path.dirname(os.path.realpath(__file__))
-    f = open(cur_path+'/WRF_modelvar_alias.txt', 'r')
-    dic={}
-    for line in f:
-        line=line.strip('\n')
-        line=line.split(',')
-        dic[line[0]]=line[1]
-    return dic
+    # shared by all the files, must not be modified
+    global _alias_dic
+    if _alias_dic is None:
+        cur_path=os.path.dirname(os.path.realpath(__file__))
+        dic={}
+        with open(cur_path+'/WRF_modelvar_alias.txt', 'r') as f:
+            for line in f:
+                line=line.strip('\n')
+                line=line.split(',')
+                dic[line[0]]=line[1]
+        _alias_dic = dic
+    return _alias_dic
 
 class FileClass(object):
-    def __init__(self, fname):
+    def __init__(self, fname, cache_size=DEFAULT_CACHE_SIZE, disk_cache=None):
         bname = os.path.basename(fname)
         name, extname = os.path.splitext(bname)
 
 
-        print('--------------------------')
-        print('Reading file '+ fname)
+        logger.info('Reading file %s', fname)
 
         # check if the file exists
         if not os.path.exists(fname):
@@ -55,10 +82,10 @@ class FileClass(object):
         
         # check the file extension name
         if extname == '':
-            print('Input file has no extension, assuming it is NetCDF...')
+            logger.debug('Input file has no extension, assuming it is NetCDF...')
             file_format = 'ncdf'
         elif extname in ['.nc', '.cdf', '.netcdf', '.nc3', '.nc4']:
-            print('Input file is NetCDF file')
+            logger.debug('Input file is NetCDF file')
             file_format = 'ncdf'
         else:
             warnings.warn('Invalid data type, must be GRIB or NetCDF, aborting...' )
@@ -70,11 +97,40 @@ class FileClass(object):
         self._handle = _fhandle
         self.name = fname
         self.format = file_format
-        self.dic_variables = {}
+        # variables cached by (name, itime, options), bounded by cache_size in bytes
+        self.dic_variables = VariableCache(cache_size)
+        # derived variables and heights persisted across runs: a directory or a DiskCache,
+        # the entries of this file are identified by its path, modification time and size
+        self.disk_cache = DiskCache(disk_cache) if isinstance(disk_cache, str) else disk_cache
+        stat = os.stat(fname)
+        self._source_id = (os.path.realpath(fname), stat.st_mtime, stat.st_size)
+
+        # file metadata, read once
+        self.global_attributes = _fhandle.__dict__
+        self._xtime = None
+        self._nc_varnames = None
+        self._var_attributes = {}
+        self._var_layouts = {}
+        self._dim_sizes = {}
+        self._stored_derived = None
+        self._varname_index = None
+        self._projections = {}
 
-        print('File ' + fname + ' read successfully')
-        print('--------------------------')
-        print('')
+        # time-invariant slabs carried forward and slabs prefetched by iter_frames
+        self._static_vars = set()
+        self._static_slabs = {}
+        self._prefetched = {}
+        # every access to the netCDF handle (reads and metadata) holds this lock,
+        # the library is not thread-safe, see iter_frames
+        self._lock = threading.RLock()
+        # concurrent readers with their own handles and their reads in flight, see enable_readers
+        self.readers = None
+        self._pending = {}
+
+        # statistics of the reads and computations, see enable_profiler
+        self.profiler = None
+
+        logger.info('File %s read successfully', fname)
     
     def __getattribute__(self, attrib):
         if attrib in _nc_localatts or attrib in _nc_builtins:
@@ -82,89 +138,627 @@ class FileClass(object):
         else:
             return object.__getattribute__(self,attrib)
     
+    def enable_profiler(self, profiler=None):
+        # record the reads and computations of this file in profiler (default: a new Profiler)
+        self.profiler = profiler if profiler is not None else Profiler()
+        return self.profiler
+
+    def disable_profiler(self):
+        self.profiler = None
+
+    def enable_readers(self, nreaders=None, kind='process'):
+        # decode the netCDF variables of a request concurrently with a pool of readers, see readers.ReaderPool,
+        # the derived variables are computed as soon as their inputs are read
+        self.disable_readers()
+        self.readers = ReaderPool(self.name, nreaders, kind)
+        return self.readers
+
+    def disable_readers(self):
+        if self.readers is not None:
+            self.readers.close()
+        self.readers = None
+        self._pending.clear()
+
+    def cache_info(self):
+        return self.dic_variables.stats()
+
     def close(self):
+        self.disable_readers()
         del self.dic_variables
         self._handle.close()
         gc.collect() # Force garbage collection
 
+    def get_varname_index(self):
+        # {name: variable name in the file} of all the names accepted by check_varname, built once:
+        # the model variables and the derived variables are themselves, the aliases are resolved
+        if self._varname_index is None:
+            index = dict(get_alias_dic())
+            index.update((v, v) for v in DERIVED_VARS)
+            index.update((v, v) for v in self.get_nc_varnames())
+            self._varname_index = index
+        return self._varname_index
+
     def check_varname(self, varname):
-        varname_checked = ''
+        # the variable name in the file (or the derived variable) of varname, '' if unknown
+        return self.get_varname_index().get(varname, '')
 
-        # first check if the varname is in modelvar
-        list_vars = self.variables.keys()
+    def check_varnames(self, varnames):
+        # batch form of check_varname: {varname: varname_checked}
+        index = self.get_varname_index()
+        return dict((v, index.get(v, '')) for v in varnames)
 
-        if varname in list_vars or varname in DERIVED_VARS:
-            varname_checked = varname
-        else:
-            dic = get_alias_dic()
-            if varname in dic.keys():
-                varname_checked = dic[varname]
-        
-        return varname_checked
+    def get_nc_varnames(self):
+        # the names of the netCDF variables of the file, read once
+        if self._nc_varnames is None:
+            with self._lock:
+                self._nc_varnames = set(self.variables.keys())
+        return self._nc_varnames
+
+    def is_derived(self, varname):
+        # derived variables are computed, unless the file has them (written by NetCDFWriter)
+        return varname in DERIVED_VARS and varname not in self.get_stored_derived_vars()
+
+    def get_stored_derived_vars(self):
+        # Ex: 'P' is the pressure perturbation in wrfout, the derived pressure in a file written by pyWRF
+        if self._stored_derived is None:
+            with self._lock:
+                self._stored_derived = [v for v in DERIVED_VARS if v in self.get_nc_varnames() and \
+                    DERIVED_ATTRIBUTE in self.variables[v].ncattrs()]
+        return self._stored_derived
+
+    def get_init_time(self):
+        return datetime.datetime.strptime(self.global_attributes['START_DATE'],'%Y-%m-%d_%H:%M:%S')
+
+    def get_xtime(self):
+        if self._xtime is None:
+            with self._lock:
+                self._xtime = self.variables['XTIME'][:]
+        return self._xtime
+
+    @property
+    def ntimes(self):
+        return self.get_dim_size('Time')
 
-    def get_variable(self, var_names, itime=0, get_proj_info=True, assign_heights=False, shared_heights=False, depth=-1):
+    def get_dim_size(self, dim):
+        if dim not in self._dim_sizes:
+            with self._lock:
+                self._dim_sizes[dim] = len(self.dimensions[dim])
+        return self._dim_sizes[dim]
+
+    def get_var_layout(self, varname):
+        # (dimensions, shape) of the netCDF variable varname, read once
+        if varname not in self._var_layouts:
+            with self._lock:
+                ncvar = self.variables[varname]
+                self._var_layouts[varname] = (ncvar.dimensions, ncvar.shape)
+        return self._var_layouts[varname]
+
+    def get_var_dimensions(self, varname):
+        return self.get_var_layout(varname)[0]
+
+    def get_var_attributes(self, varname):
+        # the netCDF attributes of varname, read once and shared by the DataClass (must not be modified)
+        if varname not in self._var_attributes:
+            with self._lock:
+                self._var_attributes[varname] = self.variables[varname].__dict__
+        return self._var_attributes[varname]
+
+    def get_shape(self, var_name, subset=None):
+        # shape of a variable at one time step, without reading or computing it
+        if self.is_derived(var_name):
+            return self.get_shape(DERIVED_REGISTRY[var_name].like, subset)
+        window = self.get_window(subset)
+        dimensions, shape = self.get_var_layout(self.check_varname(var_name))
+        return tuple(len(range(n)[get_window_slice(window, dim)]) \
+            for dim, n in zip(dimensions, shape) if dim != 'Time')
+
+    def get_window(self, subset):
+        # Normalize a subset of the domain into a window ((dim, start, stop), ...) of mass grid indices.
+        # subset is a dictionary of index ranges [start, stop), Ex: {'south_north':(10, 50), 'west_east':(20, 80)},
+        # ranges of 'bottom_top' are also accepted, or a lat/lon box, Ex: {'lat':(28., 30.), 'lon':(120., 122.)}
+        # Ranges covering the full dimension are dropped, the full domain is None.
+        if subset is None:
+            return None
+        if isinstance(subset, tuple):
+            subset = dict((dim, (start, stop)) for dim, start, stop in subset)
+        subset = dict(subset)
+
+        if 'lat' in subset or 'lon' in subset:
+            # sample the edges of the box, lat/lon lines are curved on the WRF grid
+            lat0, lat1 = subset.pop('lat', (-90., 90.))
+            lon0, lon1 = subset.pop('lon', (-180., 180.))
+            edge = np.linspace(0., 1., 33)
+            lats = np.concatenate([lat0 + 0*edge, lat1 + 0*edge, lat0 + (lat1-lat0)*edge, lat0 + (lat1-lat0)*edge])
+            lons = np.concatenate([lon0 + (lon1-lon0)*edge, lon0 + (lon1-lon0)*edge, lon0 + 0*edge, lon1 + 0*edge])
+
+            coords_WRF = WGS_to_WRF(np.vstack((lats, lons)).T, self.get_projection())
+            subset['west_east'] = (int(np.floor(coords_WRF[:,0].min())), int(np.ceil(coords_WRF[:,0].max()))+1)
+            subset['south_north'] = (int(np.floor(coords_WRF[:,1].min())), int(np.ceil(coords_WRF[:,1].max()))+1)
+
+        window = []
+        for dim, (start, stop) in sorted(subset.items()):
+            if dim not in ['bottom_top', 'south_north', 'west_east']:
+                raise ValueError('Invalid subset dimension {}'.format(dim))
+            n = self.get_dim_size(dim)
+            start, stop = max(int(start), 0), min(int(stop), n)
+            if start >= stop:
+                raise ValueError('The subset of {} is outside of the domain'.format(dim))
+            if (start, stop) != (0, n):
+                window.append((dim, start, stop))
+        return tuple(window) if len(window) > 0 else None
+
+    def release_time(self, itime):
+        # the cached variables of this time step are not needed anymore
+        self.dic_variables.discard_time(itime)
+        with self._lock:
+            for key in [key for key in self._pending.keys() if key[1] == itime]:
+                self._pending.pop(key).cancel()
+
+    def get_persistent_key(self, name, options):
+        # key of a derived variable in the persistent cache
+        return self._source_id + get_cache_key(name, options) + (get_formula_version(name),)
+
+    def in_persistent_cache(self, name, options):
+        return self.disk_cache is not None and self.is_derived(name) and \
+            self.get_persistent_key(name, options) in self.disk_cache
+
+    def load_persistent(self, name, options):
+        # a derived variable from the persistent cache, its data is a read-only memory map
+        if self.disk_cache is None or not self.is_derived(name):
+            return None
+        entry = self.disk_cache.load(self.get_persistent_key(name, options))
+        if entry is None:
+            return None
+        (data,), meta = entry
+        var = d.DataClass()
+        var.set_metadata(meta)
+        var.file = self
+        var.data = data
+        return var
+
+    def save_persistent(self, name, options, var):
+        if self.disk_cache is None:
+            return
+        meta = var.get_metadata()
+        self.disk_cache.save(self.get_persistent_key(name, options), [var.data], meta)
+
+    def warm_disk_cache(self, var_names=None, itimes=None, assign_heights=True, **kwargs):
+        # compute and persist var_names (default: all the derived variables available from
+        # the file, and the heights of all the grids) for itimes (default: all)
+        if self.disk_cache is None:
+            raise ValueError('No persistent cache, see open_file(disk_cache=)')
+        if var_names is None:
+            var_names = [v for v in DERIVED_VARS if self.is_derived(v) and \
+                self.check_if_variables_in_file(get_base_fields([v]))]
+            if assign_heights:
+                var_names += [v for v in ['U', 'V', 'W'] if self.check_varname(v) != '']
+        for itime, dic_var in self.iter_frames(var_names, itimes, assign_heights=assign_heights, **kwargs):
+            pass
+        return self.disk_cache.stats()
+
+    def get_geometry(self, var, depth, itime):
+        # (z-levels, topograph) of the grid of var (mass, U, V or W) at itime, computed once
+        # and shared read-only by all the variables on that grid, None if var has no vertical levels.
+        # It is kept in the variable cache with its time step, within the memory budget of the cache
+        key = ('_geometry', itime, var.attributes.get('subset'), tuple(var.dimensions))
+        geometry = self.dic_variables.get(key)
+        if geometry is None:
+            names = [var.attributes.get(att + '_variable') for att in ['z-levels', 'topograph']]
+            disk_key = self._source_id + key + (get_formula_version('Zm'), get_formula_version('Zw'))
+            entry = self.disk_cache.load(disk_key) if self.disk_cache is not None else None
+            if None not in names and all(name in self.get_nc_varnames() for name in names):
+                # heights written by NetCDFWriter
+                geometry = tuple(self.read_slab(name, itime, key[2]) for name in names)
+            elif entry is not None:
+                geometry = tuple(entry[0])
+            else:
+                geometry = var.get_heights(depth, itime)
+                if geometry is not None and self.disk_cache is not None:
+                    self.disk_cache.save(disk_key, list(geometry), None)
+            if geometry is not None:
+                for arr in geometry:
+                    arr.flags.writeable = False
+                self.dic_variables.put(key, geometry)
+        return geometry
+
+    def get_level_interpolator(self, var, levels, itime, coordinate='P', log=None, chunk_size=None):
+        # the VerticalInterpolator of the grid of var to levels of a vertical coordinate,
+        # computed once and shared by all the variables on that grid. It is kept in the
+        # variable cache with its time step, within the memory budget of the cache
+        if coordinate not in LEVEL_COORDINATES:
+            raise ValueError('Invalid vertical coordinate {}, must be one of {}'.format(coordinate, LEVEL_COORDINATES))
+        if log is None:
+            log = coordinate == 'P'
+        key = ('_levels', itime, tuple(np.ravel(levels)), coordinate, log, chunk_size, var.dimensions, var.attributes.get('subset'))
+        interpolator = self.dic_variables.get(key)
+        if interpolator is None:
+            vcoord = var.get_level_coordinate(coordinate, 0, itime)
+            interpolator = VerticalInterpolator(vcoord, levels, log=log, chunk_size=chunk_size)
+            self.dic_variables.put(key, interpolator)
+        return interpolator
+
+    def get_variable_on_levels(self, var_names, levels, coordinate='P', itime=0, log=None, chunk_size=None, out=None, **kwargs):
+        # var_names interpolated to fixed levels of a vertical coordinate, see DataClass.interp_levels,
+        # Ex: get_variable_on_levels(['T', 'QV'], [85000., 70000., 50000.], coordinate='P')
+        # out: optional dictionary of preallocated float32 arrays (nlevels, south_north, west_east),
+        # or the array of a single name, kwargs are options of get_variable
+        single = not isinstance(var_names, list)
+        names = [var_names] if single else var_names
+        if out is None:
+            out = {}
+        elif single:
+            out = {var_names:out}
+        dic_var = self.get_variable(names, itime=itime, assign_heights=coordinate != 'P', **kwargs)
+        dic_levels = dict((name, dic_var[name].interp_levels(levels, itime, coordinate, log, chunk_size, out.get(name))) \
+            for name in names)
+        return dic_levels[var_names] if single else dic_levels
+
+    def get_station_series(self, var_names, lat, lon, itimes=None, method='nearest', stations=None):
+        # time series of var_names at stations (lat, lon), only their columns are read, see stations.read_station_series,
+        # returns {name: (station, time, level) or (station, time) float32 array}
+        # stations: a StationColumns mapped before (lat, lon and method are then ignored)
+        if stations is None:
+            stations = StationColumns(self.get_projection(), lat, lon, method)
+        single = not isinstance(var_names, list)
+        dic_series = read_station_series(self, [var_names] if single else var_names, stations, itimes)
+        return dic_series[var_names] if single else dic_series
+
+    def get_shared_projection(self, nI=None, nJ=None):
+        # get_projection with the grid sizes nI, nJ (default: mass grid), shared by the DataClass (must not be modified)
+        if (nI, nJ) not in self._projections:
+            dic_proj = self.get_projection()
+            if nI is not None:
+                dic_proj['nI'] = nI
+            if nJ is not None:
+                dic_proj['nJ'] = nJ
+            self._projections[(nI, nJ)] = dic_proj
+        return self._projections[(nI, nJ)]
+
+    def get_projection(self):
+        # a new dictionary of the projection parameters of the mass grid
+        dic_proj = dict((att, self.global_attributes[att]) for att in _proj_atts)
+        dic_proj['nI'], dic_proj['nJ'] = self.get_dim_size('west_east'), self.get_dim_size('south_north')
+        return dic_proj
+
+    def read_slab(self, varname, itime, window=None):
+        # read only the Time == itime hyperslab of a netCDF variable, within the subset window,
+        # the float32 conversion is applied to that slab only
+        with self._lock:
+            if (varname, window) in self._static_slabs:
+                return self._static_slabs[(varname, window)]
+            if (varname, itime, window) in self._prefetched:
+                return self._prefetched.pop((varname, itime, window))
+            future = self._pending.pop((varname, itime, window), None)
+
+        if future is not None:
+            # submitted to the readers, wait for it outside of the lock
+            slab, seconds = future.result()
+        with self._lock:
+            if future is None:
+                slab, seconds = read_hyperslab(self._handle, varname, itime, window)
+            if self.profiler is not None:
+                self.profiler.add_read(varname, seconds, slab)
+
+            if varname in self._static_vars:
+                # shared by all frames, must not be modified
+                slab.flags.writeable = False
+                self._static_slabs[(varname, window)] = slab
+        return slab
+
+    def submit_reads(self, varnames, itime, window=None):
+        # submit the slabs of the netCDF variables varnames for itime to the readers, to be consumed by read_slab
+        with self._lock:
+            for varname in varnames:
+                key = (varname, itime, window)
+                if (varname, window) in self._static_slabs or key in self._prefetched or key in self._pending:
+                    continue
+                self._pending[key] = self.readers.submit(varname, itime, window)
+
+    def prefetch(self, varnames, itime, window=None):
+        # read the slabs of the netCDF variables varnames for itime, to be consumed by read_slab
+        if self.readers is not None:
+            return self.submit_reads(varnames, itime, window)
+        for varname in varnames:
+            with self._lock:
+                if (varname, window) in self._static_slabs or (varname, itime, window) in self._prefetched:
+                    continue
+                slab = self.read_slab(varname, itime, window)
+                if (varname, window) not in self._static_slabs:
+                    self._prefetched[(varname, itime, window)] = slab
+
+    def get_base_vars(self, var_names, assign_heights=False):
+        # netCDF variables read to get var_names (and their heights)
+        names = list(var_names)
+        if assign_heights:
+            names += ['Zw', 'Zm', 'HGT']
+        derived = [v for v in names if self.is_derived(v)]
+        ncnames = []
+        for v in [v for v in names if not self.is_derived(v)] + get_base_fields(derived, self.get_stored_derived_vars()):
+            varname_checked = self.check_varname(v)
+            if varname_checked != '' and varname_checked not in ncnames:
+                ncnames.append(varname_checked)
+        return ncnames
+
+    def load_metadata(self, ncnames):
+        # read the metadata of the netCDF variables ncnames used by DataClass (dimensions,
+        # attributes, times), so that building their variables does not access the handle anymore
+        self.get_stored_derived_vars()
+        self.get_xtime()
+        for ncname in ncnames:
+            self.get_var_dimensions(ncname)
+            self.get_var_attributes(ncname)
+
+    def iter_frames(self, var_names, itimes=None, prefetch=True, static_vars=TIME_INVARIANT_VARS, **kwargs):
+        # Iterate over the frames of the file, yields (itime, dic_var) as get_variable(var_names, itime).
+        # The next frame is read in a background thread while the current one is processed,
+        # static_vars are read once and shared by all frames: their arrays are read-only, in-place
+        # operators on their variables return new variables (see DataClass._owns_data) and item
+        # assignments copy them, but their data must not be modified directly (Ex: var.data += 1).
+        # Only the current and the prefetched frame are kept in memory.
+        if itimes is None:
+            itimes = range(self.ntimes)
+        itimes = list(itimes)
+        ncnames = self.get_base_vars(var_names, kwargs.get('assign_heights', False))
+        window = self.get_window(kwargs.get('subset'))
+        # the handle is shared with the prefetching thread, the metadata is read before it starts
+        # (every access holds the lock anyway, but would wait for the reads of the next frame)
+        self.load_metadata(ncnames)
+
+        self._static_vars = set(static_vars)
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            future = None
+            for i, itime in enumerate(itimes):
+                if future is not None:
+                    future.result()
+                future = None
+                if prefetch and i+1 < len(itimes):
+                    future = executor.submit(self.prefetch, ncnames, itimes[i+1], window)
+
+                yield itime, self.get_variable(var_names, itime=itime, **kwargs)
+
+                # the variables of this frame are not needed anymore
+                self.release_time(itime)
+        finally:
+            executor.shutdown(wait=True)
+            self._static_vars = set()
+            self._static_slabs.clear()
+            self._prefetched.clear()
+
+    def get_plan(self, var_names, options, depth=0):
+        # Topological order of the variables needed by var_names, every variable appears once.
+        # Derived variables already in the cache (or the persistent cache) are not expanded to their inputs.
+        # Returns the order, the depth of each variable in the dependency tree,
+        # the number of derived variables consuming each variable, and the variables expanded.
+        order, depths, consumers, expanded = [], {}, {}, set()
+        def visit(name, level):
+            if name in depths:
+                return
+            depths[name] = level
+            consumers[name] = 0
+            if self.is_derived(name) and get_cache_key(name, options) not in self.dic_variables \
+                and not self.in_persistent_cache(name, options):
+                expanded.add(name)
+                for inp in get_input_vars(name):
+                    visit(inp, level+1)
+                    consumers[inp] += 1
+            order.append(name)
+        for name in var_names:
+            visit(name, depth)
+        return order, depths, consumers, expanded
+
+    def get_tiles(self, window, tile_size):
+        # horizontal tiles covering a window, tile_size: points per tile, int or (south_north, west_east)
+        if np.isscalar(tile_size):
+            tile_size = (tile_size, tile_size)
+        ranges = []
+        for dim, size in zip(['south_north', 'west_east'], tile_size):
+            index = get_window_slice(window, dim)
+            start, stop = index.start or 0, self.get_dim_size(dim) if index.stop is None else index.stop
+            ranges.append([(dim, i, min(i+int(size), stop)) for i in range(start, stop, int(size))])
+        return [set_window_range(set_window_range(window, *sn), *we) for sn in ranges[0] for we in ranges[1]]
+
+    def get_tiled_variable(self, var_names, tile_size, itime=0, get_proj_info=True, window=None, out=None):
+        # Evaluate var_names tile by tile: the base fields of one horizontal tile are read and
+        # the derived variables are computed on them, then written into the full outputs.
+        # The peak memory is the outputs plus the fields of one tile. Tiles hold whole columns
+        # since some derived variables (e.g. Zm) are computed along the vertical.
+        # out: optional dictionary of float32 arrays or .npy file names (written as memory maps),
+        # the results are not cached
+        if out is None:
+            out = {}
+        derived = [v for v in var_names if self.is_derived(v)]
+        fields = [v for v in var_names if not self.is_derived(v)]
+        fields += [v for v in get_base_fields(derived, self.get_stored_derived_vars()) if v not in fields]
+        ncnames = dict((v, self.check_varname(v)) for v in fields)
+        for v in fields:
+            if ncnames[v] == '' and v not in var_names:
+                raise ValueError('Could not compute derived variables, input {} not found'.format(v))
+
+        # [A]. the outputs and the variables giving their grid and metadata
+        arrays, likes = {}, {}
+        for name in var_names:
+            like = name
+            while like in DERIVED_REGISTRY:
+                like = DERIVED_REGISTRY[like].like
+            if ncnames[like] == '':
+                logger.warning('Variable %s was not found in file %s', name, self.name)
+                continue
+            likes[name] = like
+            shape = self.get_shape(name, window)
+            target = out.get(name)
+            if target is None:
+                target = np.empty(shape, dtype='float32')
+            elif isinstance(target, str):
+                target = np.lib.format.open_memmap(target, mode='w+', dtype='float32', shape=shape)
+            elif target.shape != shape:
+                raise ValueError('Output of {} has shape {}, expected {}'.format(name, target.shape, shape))
+            arrays[name] = target
+
+        # [B]. tile by tile
+        def get_position(name, tile):
+            position = []
+            for dim in self.get_var_dimensions(ncnames[likes[name]]):
+                if dim == 'Time':
+                    continue
+                offset = get_window_slice(window, dim).start or 0
+                index = get_window_slice(tile, dim)
+                position.append(slice((index.start or 0) - offset, None if index.stop is None else index.stop - offset))
+            return tuple(position)
+
+        tiles = self.get_tiles(window, tile_size)
+        for tile in tiles:
+            slabs = dict((v, self.read_slab(ncnames[v], itime, tile)) for v in fields if ncnames[v] != '')
+            for name in [v for v in var_names if v in arrays and not self.is_derived(v)]:
+                arrays[name][get_position(name, tile)] = slabs[name]
+            if len(derived) > 0:
+                engine = FusedEngine(slabs, vertical_axis=0)
+                tile_out = dict((name, arrays[name][get_position(name, tile)]) for name in derived)
+                with get_timer(self.profiler) as elapsed:
+                    engine.evaluate(derived, out=tile_out)
+                if self.profiler is not None: # the variables are evaluated together
+                    self.profiler.add_compute('+'.join(derived), elapsed[0], tile_out[derived[0]])
+
+        # [C]. wrap the outputs, the metadata is read with the first tile
+        dic_var = dict((name, None) for name in var_names)
+        for name in arrays.keys():
+            template = d.DataClass(self, ncnames[likes[name]], name, get_proj_info=get_proj_info, itime=itime, window=tiles[0])
+            var = template._new_like(arrays[name], owns_data=True)
+            var.coordinates = d.Coordinates()
+            for dim, n in zip(var.dimensions, var.data.shape):
+                start = get_window_slice(window, dim).start or 0
+                var.coordinates[dim] = range(start, start+n)
+            if window is None:
+                del var.attributes['subset']
+            else:
+                var.attributes['subset'] = window
+            if self.is_derived(name):
+                var.attributes['long_name'] = DERIVED_REGISTRY[name].long_name
+                var.attributes['units'] = DERIVED_REGISTRY[name].units
+            dic_var[name] = var
+        return dic_var
+
+    def get_variable(self, var_names, itime=0, get_proj_info=True, assign_heights=False, shared_heights=False, subset=None, depth=-1,
+                     tile_size=None, out=None):
         
         # Create dictionary of options
         # share height means share topograph
+        # subset: only read a part of the domain, see get_window
+        # tile_size: evaluate tile by tile with bounded memory into out, see get_tiled_variable
 
         depth += 1
+        window = self.get_window(subset)
         import_opts = {'itime':itime,\
                        'get_proj_info':get_proj_info,\
-                       'shared_heights':shared_heights,\
-                       'assign_heights':assign_heights,\
-                       'depth':depth}
-        
-        if isinstance(var_names, list):
-            import_opts['depth'] -= 1
-            dic_var = {} # only return those wanted vars
-            for i,v in enumerate(var_names):
-                var = self.get_variable(v, **import_opts)
-                if assign_heights:
-                    if i > 0 and shared_heights:
-                        # Stop assigning heights, after first variable
-                        import_opts['assign_heights'] = False
-                        # If shared_heights is true we just copy the heights from the first variables to all others
-                        var.attributes['z-levels'] = dic_var[var_names[0]].attributes['z-levels']
-                        var.attributes['topograph'] = dic_var[var_names[0]].attributes['topograph']
-
-                dic_var[v] = var
-            return dic_var
-        else:
-            print('----'*depth + '>' + var_names)
-            
-            # check if already read
-            if var_names in self.dic_variables.keys():
-                var = self.dic_variables[var_names]
-                # maybe not assigned at first when computing 'Zm' and 'Zw'
-                if 'z-levels' not in var.attributes and assign_heights:
-                    var.assign_heights(depth=depth, itime=itime)
-            elif var_names in DERIVED_VARS:
-                var = get_derived_var(self,var_names,import_opts)
-                # force the heights and topograph assignment
-                if 'z-levels' in var.attributes.keys():
-                    del var.attributes['z-levels'], var.attributes['topograph']
-            else:
-                varname_checked = self.check_varname(var_names)
-                if varname_checked != '':
-                    var = d.DataClass(self, varname_checked, var_names, get_proj_info=get_proj_info, itime=itime)
+                       'subset':window}
+
+        if not isinstance(var_names, list):
+            return self.get_variable([var_names], itime=itime, get_proj_info=get_proj_info, \
+                assign_heights=assign_heights, shared_heights=shared_heights, subset=window, depth=depth-1, \
+                tile_size=tile_size, out=None if out is None else {var_names:out})[var_names]
+
+        if tile_size is not None:
+            if assign_heights:
+                raise ValueError('Heights can not be assigned to variables evaluated by tiles')
+            return self.get_tiled_variable(var_names, tile_size, itime=itime, get_proj_info=get_proj_info, window=window, out=out)
+
+        # [A]. Plan the whole request: each base variable is read once, each derived variable
+        # is computed once, and intermediates are released after their last consumer has run
+        # (they are still kept by the cache within its memory budget)
+        order, depths, consumers, expanded = self.get_plan(var_names, import_opts, depth)
+        if self.readers is not None:
+            # all the base variables are read concurrently, in the order they are consumed
+            self.submit_reads([self.check_varname(name) for name in order if not self.is_derived(name) \
+                and self.check_varname(name) != '' and get_cache_key(name, import_opts) not in self.dic_variables],
+                itime, window)
+
+        working = {}
+        for name in order:
+            logger.debug('%s>%s', '----'*depths[name], name)
+
+            # check if already read for this time step and options
+            cache_key = get_cache_key(name, import_opts)
+            var = self.dic_variables.get(cache_key)
+            if var is None and name not in expanded:
+                var = self.load_persistent(name, import_opts)
+                if var is not None:
+                    self.dic_variables.put(cache_key, var)
+            if self.profiler is not None:
+                self.profiler.add_cache(name, var is not None)
+            if var is None:
+                if self.is_derived(name):
+                    inputs = get_input_vars(name)
+                    if name in expanded:
+                        dic_inputs = dict((inp, working[inp]) for inp in inputs)
+                    else: # evicted from the cache after planning
+                        dic_inputs = self.get_variable(inputs, depth=depths[name], **import_opts)
+                    with get_timer(self.profiler) as elapsed:
+                        var = compute_derived_var(name, dic_inputs)
+                    if self.profiler is not None:
+                        self.profiler.add_compute(name, elapsed[0], var.data)
+                    # force the heights and topograph assignment
+                    if 'z-levels' in var.attributes.keys():
+                        del var.attributes['z-levels'], var.attributes['topograph']
+                    self.save_persistent(name, import_opts, var)
                 else:
-                    print('Variable was not found in file_instance')
-                    return
-            
-            self.dic_variables[var_names] = var
+                    varname_checked = self.check_varname(name)
+                    if varname_checked != '':
+                        var = d.DataClass(self, varname_checked, name, get_proj_info=get_proj_info, itime=itime, window=window)
+                    else:
+                        logger.warning('Variable %s was not found in file %s', name, self.name)
+                if var is not None:
+                    self.dic_variables.put(cache_key, var)
+            working[name] = var
 
-            # Assign heights if wanted
-            if 'z-levels' not in var.attributes and assign_heights and var:
-                var.assign_heights(depth=depth, itime=itime)
+            # release the intermediates whose last consumer has run
+            if name in expanded:
+                for inp in get_input_vars(name):
+                    consumers[inp] -= 1
+                    if consumers[inp] == 0 and inp not in var_names:
+                        del working[inp]
 
-            return var
+        # [B]. Assign heights if wanted
+        dic_var = {} # only return those wanted vars
+        for i,v in enumerate(var_names):
+            var = working[v]
+            if assign_heights and var is not None:
+                first = dic_var.get(var_names[0])
+                if i > 0 and shared_heights and first is not None and first.dimensions == var.dimensions \
+                    and 'z-levels' in first.attributes:
+                    # If shared_heights is true we just copy the heights from the first variable to the others on its grid
+                    var.attributes['z-levels'] = first.attributes['z-levels']
+                    var.attributes['topograph'] = first.attributes['topograph']
+                elif 'z-levels' not in var.attributes:
+                    # maybe not assigned at first when computing 'Zm' and 'Zw'
+                    var.assign_heights(depth=depth, itime=itime)
+                self.dic_variables.update(get_cache_key(v, import_opts))
+            # the cached variable is kept as it is, the caller gets a light-weight
+            # variable sharing its data, copied on write (see DataClass._owns_data)
+            dic_var[v] = var._new_like(var.data) if var is not None else None
+        return dic_var
+
+    def to_netcdf(self, fname, var_names, itimes=None, writer_options=None, **kwargs):
+        # write var_names of itimes (default: all) to a netCDF4 file frame by frame,
+        # see writer.NetCDFWriter for writer_options, kwargs are options of get_variable
+        return write_frames(fname, self, var_names, itimes, writer_options, **kwargs)
+
+    def get_missing_variables(self, varnames):
+        # the names in varnames which can not be read or derived from the file: unknown names, and
+        # names whose netCDF variables (the base fields of a derived variable) are not in the file,
+        # Ex: 'N' in a file written by NetCDFWriter without the temperature and pressure fields
+        nc_varnames = self.get_nc_varnames()
+        missing = []
+        for v, varname_checked in self.check_varnames(varnames).items():
+            if self.is_derived(varname_checked):
+                fields = get_base_fields([varname_checked], self.get_stored_derived_vars())
+            else:
+                fields = [varname_checked]
+            if any(self.check_varname(field) not in nc_varnames for field in fields):
+                missing.append(v)
+        return missing
 
     def check_if_variables_in_file(self, varnames):
-        for var in varnames:
-            varname_checked = self.check_varname(var)
-            if varname_checked == '':
-                return False
-        return True
+        return len(self.get_missing_variables(varnames)) == 0
 
 
 if __name__ == '__main__':
@@ -8,5 +8,8 @@
 @LastEditTime: 2020-07-16 12:10:58
 '''
 
-from pyWRF.utilities import WGS_to_WRF
+from pyWRF.utilities import WGS_to_WRF, WRF_to_WGS, get_projector
 from pyWRF.WRFio import open_file
+from pyWRF.series import open_series
+from pyWRF.parallel import process_times
+from pyWRF.profiler import Profiler, set_log_level
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: caches of the variables read or derived by FileClass
+'''
+
+import numpy as np
+import os
+import pickle
+import hashlib
+from collections import OrderedDict
+
+# default memory budget of a file cache: 1 GiB
+DEFAULT_CACHE_SIZE = 1024**3
+
+# options of FileClass.get_variable that change the returned variable
+CACHE_KEY_OPTS = ['itime', 'get_proj_info', 'subset']
+
+def get_cache_key(varname, options):
+    # Ex: ('RHO', 10, True, None)
+    return (varname,) + tuple(options[opt] for opt in CACHE_KEY_OPTS)
+
+def get_nbytes(var):
+    # memory held by a DataClass: the data and its height arrays,
+    # read-only heights are shared by the variables of a grid and counted once, as the
+    # geometry entries of FileClass; other entries (Ex: the level interpolators) give their nbytes
+    if isinstance(var, tuple):
+        return sum(arr.nbytes for arr in var)
+    if hasattr(var, 'nbytes'):
+        return var.nbytes
+    nbytes = var.data.nbytes
+    for att in ['z-levels', 'topograph']:
+        if att in var.attributes and var.attributes[att].flags.writeable:
+            nbytes += var.attributes[att].nbytes
+    return nbytes
+
+class VariableCache(object):
+    # A least-recently-used cache of DataClass, bounded by the bytes of the cached arrays.
+    # Entries are keyed by (name, itime, ...), see get_cache_key and discard_time
+    def __init__(self, max_bytes=DEFAULT_CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def keys(self):
+        return self._entries.keys()
+
+    @property
+    def current_bytes(self):
+        return sum(self._nbytes.values())
+
+    def get(self, key):
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, var):
+        self._entries[key] = var
+        self._entries.move_to_end(key)
+        self.update(key)
+
+    def update(self, key):
+        # refresh the size of an entry, e.g. after heights are assigned to it,
+        # nothing to do if it has been evicted meanwhile
+        if key not in self._entries:
+            return
+        self._nbytes[key] = get_nbytes(self._entries[key])
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        # drop the least recently used entries until the budget is met,
+        # the entry just inserted is always kept
+        total = self.current_bytes
+        for key in list(self._entries.keys()):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._nbytes.pop(key)
+            del self._entries[key]
+            self.evictions += 1
+
+    def discard(self, key):
+        if key in self._entries:
+            del self._entries[key], self._nbytes[key]
+
+    def discard_time(self, itime):
+        # drop all the entries of a time step
+        pos = CACHE_KEY_OPTS.index('itime') + 1
+        for key in [key for key in self._entries.keys() if key[pos] == itime]:
+            self.discard(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._nbytes.clear()
+
+    def stats(self):
+        return {'hits':self.hits, 'misses':self.misses, 'evictions':self.evictions,
+                'entries':len(self._entries), 'bytes':self.current_bytes, 'max_bytes':self.max_bytes}
+
+# default size of a persistent cache directory: 10 GiB
+DEFAULT_DISK_CACHE_SIZE = 10 * 1024**3
+
+class DiskCache(object):
+    # A persistent cache of arrays shared by several runs (or processes) in a directory.
+    # An entry is a list of .npy arrays, loaded as read-only memory maps, and pickled metadata,
+    # its file name is a hash of the key. The metadata file is written last, so an entry
+    # being written by another process is not visible. The least recently loaded entries
+    # are removed when the directory exceeds max_bytes.
+    def __init__(self, directory, max_bytes=DEFAULT_DISK_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def get_path(self, key, suffix):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + suffix)
+
+    def __contains__(self, key):
+        return os.path.exists(self.get_path(key, '.pkl'))
+
+    def load(self, key):
+        # (arrays, metadata) of key, None if not cached
+        meta_path = self.get_path(key, '.pkl')
+        try:
+            with open(meta_path, 'rb') as f:
+                narrays, meta = pickle.load(f)
+            arrays = [np.load(self.get_path(key, '_{}.npy'.format(i)), mmap_mode='r') for i in range(narrays)]
+        except (IOError, OSError, EOFError, pickle.UnpicklingError): # not cached or removed meanwhile
+            self.misses += 1
+            return None
+        os.utime(meta_path, None) # last access for the eviction
+        self.hits += 1
+        return arrays, meta
+
+    def save(self, key, arrays, meta):
+        # written to temporary files first, other processes never see partial entries
+        for i, arr in enumerate(arrays):
+            path = self.get_path(key, '_{}.npy'.format(i))
+            tmp = '{}.{}.tmp'.format(path, os.getpid())
+            with open(tmp, 'wb') as f:
+                np.save(f, np.asarray(arr))
+            os.replace(tmp, path)
+        path = self.get_path(key, '.pkl')
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump((len(arrays), meta), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.evict()
+
+    def get_entries(self):
+        # {hash: [last access, bytes, [files]]}
+        entries = {}
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp'):
+                continue
+            name = entry.name.split('_')[0].split('.')[0]
+            stat = entry.stat()
+            info = entries.setdefault(name, [0., 0, []])
+            if entry.name.endswith('.pkl'):
+                info[0] = stat.st_mtime
+            info[1] += stat.st_size
+            info[2].append(entry.path)
+        return entries
+
+    @property
+    def current_bytes(self):
+        return sum(info[1] for info in self.get_entries().values())
+
+    def evict(self):
+        entries = self.get_entries()
+        total = sum(info[1] for info in entries.values())
+        for name, (atime, nbytes, paths) in sorted(entries.items(), key=lambda item: item[1][0]):
+            if total <= self.max_bytes:
+                break
+            for path in sorted(paths, key=lambda path: not path.endswith('.pkl')): # metadata first
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= nbytes
+            self.evictions += 1
+
+    def clear(self):
+        for info in self.get_entries().values():
+            for path in info[2]:
+                os.remove(path)
+
+    def stats(self):
+        entries = self.get_entries()
+        return {'hits':self.hits, 'misses':self.misses, 'evictions':self.evictions, 'entries':len(entries),
+                'bytes':sum(info[1] for info in entries.values()), 'max_bytes':self.max_bytes}
@@ -10,98 +10,251 @@ LastEditTime: 2020-09-26 23:06:22
 
 import numpy as np
 from collections import OrderedDict
+from collections.abc import MutableMapping
 import copy
-import glob, os
 import datetime
-import warnings
 
-class DataClass:
+from pyWRF.utilities import get_window_slice, set_window_range
+from pyWRF.writer import NetCDFWriter
+
+# operands of DataClass operators other than DataClass itself
+_SCALAR_TYPES = (int, float, bool, np.number, np.ndarray)
+
+class Coordinates(MutableMapping):
+    # The coordinates of a variable by dimension, in the order of the dimensions.
+    # Grid indices are held as ranges and materialized as integer arrays when accessed,
+    # other coordinates (e.g. levels) are arrays.
+    # Copies share the coordinates until one of them is modified (copy on write).
+    __slots__ = ('_coords', '_shared')
+
+    def __init__(self, items=()):
+        self._coords = OrderedDict(items)
+        self._shared = False
+
+    def __getitem__(self, dim):
+        coord = self._coords[dim]
+        if isinstance(coord, range):
+            return np.arange(coord.start, coord.stop, coord.step).astype('int')
+        return coord
+
+    def _before_write(self):
+        if self._shared:
+            self._coords = OrderedDict(self._coords)
+            self._shared = False
+
+    def __setitem__(self, dim, coord):
+        self._before_write()
+        self._coords[dim] = coord
+
+    def __delitem__(self, dim):
+        self._before_write()
+        del self._coords[dim]
+
+    def __iter__(self):
+        return iter(self._coords)
+
+    def __len__(self):
+        return len(self._coords)
+
+    def get_range(self, dim):
+        # the coordinate as stored, a range of grid indices or an array (both can be sliced)
+        return self._coords[dim]
+
+    def copy(self):
+        cp = Coordinates()
+        cp._coords = self._coords
+        cp._shared = self._shared = True
+        return cp
+
+    def __deepcopy__(self, memo):
+        return Coordinates((dim, copy.deepcopy(coord, memo)) for dim, coord in self._coords.items())
+
+    def __repr__(self):
+        return 'Coordinates({})'.format(list(self._coords.items()))
+
+class Attributes(MutableMapping):
+    # The attributes of a variable: base attributes shared by all the variables read from
+    # the same netCDF variable (never modified) and a small overlay of the attributes set,
+    # modified or deleted on this variable. Copies share the base and copy the overlay.
+    __slots__ = ('_base', '_overlay', '_deleted')
+
+    def __init__(self, base=None, overlay=None, deleted=()):
+        self._base = base if base is not None else {}
+        self._overlay = dict(overlay) if overlay is not None else {}
+        self._deleted = set(deleted)
+
+    def __getitem__(self, att):
+        if att in self._overlay:
+            return self._overlay[att]
+        if att in self._deleted:
+            raise KeyError(att)
+        return self._base[att]
+
+    def __setitem__(self, att, value):
+        self._overlay[att] = value
+        self._deleted.discard(att)
+
+    def __delitem__(self, att):
+        if att not in self:
+            raise KeyError(att)
+        self._overlay.pop(att, None)
+        if att in self._base:
+            self._deleted.add(att)
+
+    def __contains__(self, att):
+        return att in self._overlay or (att in self._base and att not in self._deleted)
+
+    def __iter__(self):
+        for att in self._base:
+            if att not in self._deleted:
+                yield att
+        for att in self._overlay:
+            if att not in self._base:
+                yield att
+
+    def __len__(self):
+        return sum(1 for att in self)
+
+    def copy(self):
+        return Attributes(self._base, self._overlay, self._deleted)
+
+    def __deepcopy__(self, memo):
+        # the base is immutable, only the overlay is copied
+        return Attributes(self._base, copy.deepcopy(self._overlay, memo), self._deleted)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class DataClass(object):
     # This is just a small class that contains the content of a variable, to facilitate manipulation of data.
-    def __init__(self, file='', varname='', formal_name='', get_proj_info=True, itime=0):
+    # The metadata is shared as much as possible: the netCDF attributes and the projection by all
+    # the variables read from a file, the coordinates and the attributes by the results of the operators.
+    # The data of the variables read or derived by a file is held by its cache: in-place operators
+    # and item assignments copy it before their first write, see _owns_data.
+    __slots__ = ('file', 'name', 'data', 'dim', 'dimensions', '_coordinates', '_attributes', '_owns_data')
+
+    def __init__(self, file='', varname='', formal_name='', get_proj_info=True, itime=0, window=None):
+        # if data is only referenced by this variable (results of the operators and copies)
+        self._owns_data = False
         if file != '' and varname != '':
-            self.create(file, varname, formal_name, get_proj_info, itime)
-    
-    def create(self, file, varname, formal_name, get_proj_info, itime):
+            self.create(file, varname, formal_name, get_proj_info, itime, window)
+
+    @property
+    def coordinates(self):
+        return self._coordinates
+
+    @coordinates.setter
+    def coordinates(self, coordinates):
+        self._coordinates = coordinates if isinstance(coordinates, Coordinates) else Coordinates(coordinates)
+
+    @property
+    def attributes(self):
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, attributes):
+        self._attributes = attributes if isinstance(attributes, Attributes) else Attributes(overlay=attributes)
+
+    def create(self, file, varname, formal_name, get_proj_info, itime, window=None):
         self.file = file
         self.name = formal_name
-        self.data = self.file.variables[varname][:].astype('float32')
+        # only the Time == itime hyperslab (within the subset window) is read from disk and converted to float32
+        self.data = self.file.read_slab(varname, itime, window)
         self.dim =  len(self.data.shape)
-        self.coordinates = OrderedDict()
+        self.coordinates = Coordinates()
 
         # Ex: OrderedDict([(u'FieldType', 104), (u'MemoryOrder', u'XY '), (u'description', u'LATITUDE, SOUTH IS NEGATIVE'), 
         # (u'units', u'degree_north'), (u'stagger', u'')])
-        self.attributes = self.file.variables[varname].__dict__
+        # read once per file and shared
+        self.attributes = Attributes(self.file.get_var_attributes(varname))
         # Ex: (u'Time', u'south_north', u'west_east') 
-        self.dimensions = self.file.variables[varname].dimensions
+        self.dimensions = self.file.get_var_dimensions(varname)
 
         # [A]. Deal with time slice
         # Ex: 2013-10-06_00:00:00
-        # print(self.file.__dict__)
-        init_time = datetime.datetime.strptime(self.file.__dict__['START_DATE'],'%Y-%m-%d_%H:%M:%S')
+        init_time = self.file.get_init_time()
         self.attributes['init_time'] = init_time
-        self.attributes['step'] = self.file.variables['XTIME']
+        self.attributes['step'] = self.file.get_xtime()
         self.attributes['step_type'] = 'minutes'
         self.get_time_slice(itime)
 
         if self.attributes['step_type'] == 'days':
-            current_time = init_time+datetime.timedelta(days=int(self.attributes['step'].data))
+            current_time = init_time+datetime.timedelta(days=int(self.attributes['step']))
         elif self.attributes['step_type'] == 'hours':
-            current_time = init_time+datetime.timedelta(hours=int(self.attributes['step'].data))
+            current_time = init_time+datetime.timedelta(hours=int(self.attributes['step']))
         elif self.attributes['step_type'] == 'minutes':
-            current_time = init_time+datetime.timedelta(minutes=int(self.attributes['step'].data))
+            current_time = init_time+datetime.timedelta(minutes=int(self.attributes['step']))
         elif self.attributes['step_type'] == 'seconds':
-            current_time = init_time+datetime.timedelta(seconds=int(self.attributes['step'].data))
+            current_time = init_time+datetime.timedelta(seconds=int(self.attributes['step']))
 
         self.attributes['time']=str(current_time)
-
-        if self.attributes['time'] == '2013-10-06 00:00:00':
-            print('Wrong time by {}'.format(self.name))
         
         # [B]. get projection information and coordinates
-        dic_proj = {'TRUELAT1':self.file.__dict__['TRUELAT1'], 'TRUELAT2':self.file.__dict__['TRUELAT2'],
-                    'MOAD_CEN_LAT':self.file.__dict__['MOAD_CEN_LAT'], 'STAND_LON':self.file.__dict__['STAND_LON'],
-                    'CEN_LAT':self.file.__dict__['CEN_LAT'], 'CEN_LON':self.file.__dict__['CEN_LON'],
-                    'DX':self.file.__dict__['DX'], 'DY':self.file.__dict__['DY']}
-        
+        # nI and nJ are the sizes of the full domain, even if data is a subset of it
+        nI, nJ = None, None
         shape = self.data.shape
         for i, dim in enumerate(self.dimensions):   
             if 'west_east' in dim:
-                dic_proj['nI'] = shape[i]
+                nI = self.file.get_dim_size(dim)
             elif 'south_north' in dim:
-                dic_proj['nJ'] = shape[i]
-            # currently we just make the coordinates as grid index
-            self.coordinates[dim]=np.arange(0,shape[i]).astype('int')
+                nJ = self.file.get_dim_size(dim)
+            # currently we just make the coordinates as grid index (of the full domain)
+            start = get_window_slice(window, dim).start or 0
+            self.coordinates[dim]=range(start,start+shape[i])
         
         if get_proj_info:
-            self.attributes['proj_info']=dic_proj
+            # the projection parameters are read once per file and shared
+            self.attributes['proj_info']=self.file.get_shared_projection(nI, nJ)
+        if window is not None:
+            self.attributes['subset']=window
 
     def get_time_slice(self, itime):
         # we assume the time dimention comes first, maybe too special in some cases
         list_dimensions = list(self.dimensions)
         list_dimensions.remove('Time')
         self.dimensions = tuple(list_dimensions) # remove the time dimension
-        self.data = self.data[itime, ...]
+        # data has already been read as a time slab by FileClass.read_slab
+        if self.data.ndim > len(self.dimensions):
+            self.data = self.data[itime, ...]
+            self.dim -= 1
         self.attributes['step'] = self.attributes['step'][itime]
-        self.dim -= 1
     
     def get_vertical_slice(self, slice):
-        sliced_var = self.copy()
-        sliced_var.data = sliced_var.data[slice]
+        # only the sliced part of data is copied, coordinates are copied on write
+        sliced_var = self._new_like(self.data[slice].copy(), owns_data=True)
         for i,dim in enumerate(sliced_var.coordinates.keys()):
             if 'bottom_top' in dim:
-                sliced_var.coordinates[dim] = sliced_var.coordinates[dim][slice[i]]
+                sliced_var.coordinates[dim] = sliced_var.coordinates.get_range(dim)[slice[i]]
         
         return sliced_var
 
     def copy(self):
         cp=DataClass()
-        for attr in self.__dict__.keys():
+        for attr in self.__slots__:
+            if not hasattr(self, attr):
+                continue
             if attr != 'file':
                 setattr(cp,attr,copy.deepcopy(getattr(self,attr)))
             else: 
                 setattr(cp,attr,getattr(self,attr))                
+        cp._owns_data = True
         return cp
+
+    def get_metadata(self):
+        # everything but the file and the data, Ex: to be pickled with the data saved apart
+        return dict((attr, getattr(self, attr)) for attr in self.__slots__ \
+            if attr not in ['file', 'data', '_owns_data'] and hasattr(self, attr))
+
+    def set_metadata(self, metadata):
+        for attr, value in metadata.items():
+            setattr(self, attr, value)
     
+    def to_netcdf(self, fname, mode='w', **kwargs):
+        # write self as one time slice, mode='a' appends it to a file written before,
+        # kwargs are options of writer.NetCDFWriter
+        with NetCDFWriter(fname, mode=mode, **kwargs) as writer:
+            writer.write([self])
+
     def __str__(self):
         string='---------------------------------------------------\n'
         string+='Variable: '+self.name+', size='+str(self.data.shape)+', coords='+'('+','.join(self.coordinates.keys())+')\n'
@@ -119,46 +272,87 @@ class DataClass:
             string+='   '+atr+' : "'+str(self.attributes[atr])+'"\n'
         return string
 
-    def assign_topo(self, depth, itime):
-        d = self.file.get_variable('HGT', itime=itime, depth=depth)
+    def get_horizontal_field(self, varname, depth, itime):
+        # varname is defined on horizontal C-grid full grids, it is averaged to the
+        # horizontal grid of self. Within a subset window the neighbour points outside
+        # the window are read, the edge is only padded at the boundaries of the domain.
+        window = self.attributes.get('subset')
+        for dim, axis in [('west_east', -1), ('south_north', -2)]:
+            if dim+'_stag' in self.dimensions:
+                break
+        else:
+            return self.file.get_variable(varname, itime=itime, subset=window, depth=depth).data
 
+        n = self.file.get_dim_size(dim)
+        index = get_window_slice(window, dim)
+        start, stop = index.start or 0, n if index.stop is None else index.stop
+        halo_start, halo_stop = max(start-1, 0), min(stop+1, n)
+        Z = self.file.get_variable(varname, itime=itime, subset=set_window_range(window, dim, halo_start, halo_stop), depth=depth).data
+
+        lower, upper = [slice(None)] * Z.ndim, [slice(None)] * Z.ndim
+        lower[axis], upper[axis] = slice(None, -1), slice(1, None)
+        Z = 0.5 * (Z[tuple(lower)] + Z[tuple(upper)])
+        pad = [(0, 0)] * Z.ndim
+        pad[axis] = (int(halo_start == start), int(halo_stop == stop))
+        return np.pad(Z, pad, 'edge')
+
+    def get_topo(self, depth, itime):
         # HGT are defined on horizontal C-grid full grids
-        if 'west_east_stag' in self.dimensions: # a U-like grid
-            stag_topo = 0.5 * (d.data[:,:-1] + d.data[:,1:])
-            stag_topo = np.pad(stag_topo, ((0, 0), (1, 1)), 'edge')
-        elif 'south_north_stag' in self.dimensions: # a V-like grid
-            stag_topo = 0.5 * (d.data[:-1,:] + d.data[1:,:])
-            stag_topo = np.pad(stag_topo, ((1, 1), (0, 0)), 'edge')
-        else:
-            stag_topo = d.data
-        
-        self.attributes['topograph'] = stag_topo.astype('float32')
-    
-    def assign_heights(self, depth, itime):
+        return self.get_horizontal_field('HGT', depth, itime).astype('float32')
 
+    def get_heights(self, depth, itime):
+        # (z-levels, topograph) on the grid of self, None for variables with no vertical coordinates
         if 'bottom_top_stag' in self.dimensions: # a W-like grid
-            Z = self.file.get_variable('Zw', itime=itime, depth=depth).data
+            Z = self.get_horizontal_field('Zw', depth, itime)
         elif 'bottom_top' in self.dimensions:
-            Z = self.file.get_variable('Zm', itime=itime, depth=depth).data
+            Z = self.get_horizontal_field('Zm', depth, itime)
         else:
-            return # for variables with no vertical coordinates
+            return None
 
         # Z-mass and Z-W are both defined on horizontal C-grid full grids
-
-        if 'west_east_stag' in self.dimensions: # a U-like grid
-            Z = 0.5 * (Z[:,:,:-1] + Z[:,:,1:])
-            Z = np.pad(Z, ((0, 0), (0, 0), (1, 1)), 'edge')
-        elif 'south_north_stag' in self.dimensions: # a V-like grid
-            Z = 0.5 * (Z[:,:-1,:] + Z[:,1:,:])
-            Z = np.pad(Z, ((0, 0), (1, 1), (0, 0)), 'edge')
-        
-        if Z.shape == self.data.shape:
-            self.attributes['z-levels'] = Z.astype('float32')
-        else:
+        if Z.shape != self.data.shape:
             raise IOError('z-levels have different dimension with the variable')
+
+        return Z.astype('float32'), self.get_topo(depth, itime)
+
+    def assign_topo(self, depth, itime):
+        self.attributes['topograph'] = self.get_topo(depth, itime)
+    
+    def assign_heights(self, depth, itime):
+        # the heights are computed once per time and grid (mass, U, V or W) by the file,
+        # the arrays are read-only and shared by all the variables on the same grid
+        geometry = self.file.get_geometry(self, depth, itime)
+        if geometry is not None:
+            self.attributes['z-levels'], self.attributes['topograph'] = geometry
         
-        self.assign_topo(depth, itime)
-        
+    def get_level_coordinate(self, coordinate, depth, itime):
+        # the vertical coordinate of self on its own grid, see interp.LEVEL_COORDINATES
+        if coordinate == 'P':
+            if 'bottom_top' not in self.dimensions:
+                raise ValueError('Pressure levels are only available for variables on mass levels')
+            return self.get_horizontal_field('P', depth, itime)
+        if coordinate not in ['Z', 'AGL']:
+            raise ValueError('Invalid vertical coordinate {}'.format(coordinate))
+        if 'z-levels' not in self.attributes:
+            self.assign_heights(depth, itime)
+        if coordinate == 'Z':
+            return self.attributes['z-levels']
+        return self.attributes['z-levels'] - self.attributes['topograph']
+
+    def interp_levels(self, levels, itime, coordinate='P', log=None, chunk_size=None, out=None):
+        # self on fixed levels of a vertical coordinate ('P', 'Z' or 'AGL'), the interpolation
+        # indices are computed once per level set, time and grid, and shared by the variables of the file
+        interpolator = self.file.get_level_interpolator(self, levels, itime, coordinate, log, chunk_size)
+        interpolated = self._new_like(interpolator(self.data, out=out))
+        dim = coordinate + '_levels'
+        interpolated.dimensions = (dim,) + tuple(self.dimensions[1:])
+        interpolated.coordinates = Coordinates([(dim, np.asarray(levels))] + \
+            [(d, self.coordinates.get_range(d)) for d in list(self.coordinates.keys())[1:]])
+        if 'z-levels' in interpolated.attributes:
+            del interpolated.attributes['z-levels']
+        interpolated.attributes['level_type'] = coordinate
+        return interpolated
+
     # Redefine operators
 
     # enable slice like an array
@@ -166,253 +360,136 @@ class DataClass:
         return self.data[key]
     
     def __setitem__(self, key, value):
+        if not self._owns_data: # copy on write
+            self.data = self.data.copy()
+            self._owns_data = True
         self.data[key] = value
     
-    def log(self):
-        cp=self.copy()
-        cp.data=np.log(cp.data)
+    # Operators share the metadata of the left operand (coordinates are copied on write,
+    # attributes are a shallow copy), only one new output array is allocated.
+    # In-place operators write into self.data and allocate nothing, unless self does not
+    # own its data (Ex: a variable of the file cache), then a new variable is returned.
+
+    def _new_like(self, data, owns_data=False):
+        # a light-weight result: new data, shared metadata (coordinates are copied on write)
+        cp=DataClass()
+        for attr in self.__slots__:
+            if hasattr(self, attr):
+                setattr(cp, attr, getattr(self, attr))
+        cp.data = data
+        cp.dim = len(data.shape)
+        cp.coordinates = self.coordinates.copy()
+        cp.attributes = self.attributes.copy()
+        cp._owns_data = owns_data
         return cp
 
-    def __add__(self, x):
-        cp=None
-        if isinstance(x,(int,float,bool,np.ndarray )): # We sum by a scalar
-            cp=self.copy()
-            cp.data+=x
-        elif isinstance(x, DataClass): # Sum by another variable
-            if self.data.shape == x.data.shape:
-                cp=self.copy()
-                cp.data+=x.data
-
-                # copy the attributes from x
-                keys=self.attributes.keys()
-                for att in x.attributes.keys():
-                    if att not in keys:
-                        cp.attributes[att]=x.attributes[att]
-            else:
+    def _get_operand(self, x):
+        if isinstance(x, DataClass): # Operate with another variable
+            if self.data.shape != x.data.shape:
                 raise TypeError('var:{} and var:{} do not have identical shape'.format(self.name, x.name))
+            return x.data
+        elif isinstance(x, _SCALAR_TYPES): # Operate with a scalar or an array
+            return x
+        return None
+
+    def _merge_attributes(self, x):
+        # copy the attributes from x
+        if isinstance(x, DataClass):
+            for att in x.attributes.keys():
+                if att not in self.attributes:
+                    self.attributes[att]=x.attributes[att]
+
+    def _operate(self, ufunc, x, reverse=False):
+        other = self._get_operand(x)
+        if other is None:
+            return NotImplemented
+        out = np.empty(np.broadcast(self.data, other).shape, dtype=self.data.dtype)
+        if reverse:
+            ufunc(other, self.data, out=out)
+        else:
+            ufunc(self.data, other, out=out)
+        cp = self._new_like(out, owns_data=True)
+        cp._merge_attributes(x)
         return cp
 
+    def _ioperate(self, ufunc, x):
+        if not self._owns_data:
+            return self._operate(ufunc, x)
+        other = self._get_operand(x)
+        if other is None:
+            return NotImplemented
+        ufunc(self.data, other, out=self.data)
+        self._merge_attributes(x)
+        return self
+
+    def log(self):
+        return self._new_like(np.log(self.data), owns_data=True)
+
+    def __neg__(self):
+        return self._new_like(np.negative(self.data), owns_data=True)
+
+    def __add__(self, x):
+        return self._operate(np.add, x)
+
     def __radd__(self, x): # Reverse addition
-        cp=None
-        if isinstance(x,(int,float,bool,np.ndarray )): # We sum by a scalar
-            cp=self.copy()
-            cp.data+=x
-        elif isinstance(x, DataClass): # Sum by another variable
-            if self.data.shape == x.data.shape:
-                cp=self.copy()
-                cp.data+=x.data
-                keys=self.attributes.keys()
-                for att in x.attributes.keys():
-                    if att not in keys:
-                        cp.attributes[att]=x.attributes[att]
-            raise TypeError('var:{} and var:{} do not have identical shape'.format(self.name, x.name))
-        return cp
-    
-    
+        return self._operate(np.add, x, reverse=True)
+
+    def __iadd__(self, x):
+        return self._ioperate(np.add, x)
+
     def __sub__(self, x):
-        cp=None
-        if isinstance(x,(int,float,bool,np.ndarray )): # We subtract by a scalar
-            cp=self.copy()
-            cp.data-=x
-        elif isinstance(x, DataClass): # Substract by another variable
-            if self.data.shape == x.data.shape:
-                cp=self.copy()
-                cp.data-=x.data
-                keys=self.attributes.keys()
-                for att in x.attributes.keys():
-                    if att not in keys:
-                        cp.attributes[att]=x.attributes[att]
-            else:
-                raise TypeError('var:{} and var:{} do not have identical shape'.format(self.name, x.name))
-        return cp
+        return self._operate(np.subtract, x)
 
     def __rsub__(self, x): # Reverse subtraction (non-commutative)
-        cp=None
-        if isinstance(x,(int,float,bool,np.ndarray )): # We subtract by a scalar
-            cp=self.copy()
-            cp.data=x-cp.data
-        elif isinstance(x, DataClass): # Substract by another variable
-            if self.data.shape == x.data.shape:
-                cp=self.copy()
-                cp.data=x.data-cp.data
-                keys=self.attributes.keys()
-                for att in x.attributes.keys():
-                    if att not in keys:
-                        cp.attributes[att]=x.attributes[att]
-            raise TypeError('var:{} and var:{} do not have identical shape'.format(self.name, x.name))
-        return cp
+        return self._operate(np.subtract, x, reverse=True)
 
+    def __isub__(self, x):
+        return self._ioperate(np.subtract, x)
 
     def __mul__(self, x):
-        cp=None
-        if isinstance(x,(int,float,bool,np.ndarray )): # We muliply by a scalar
-            cp=self.copy()
-            cp.data*=x
-        elif isinstance(x, DataClass): # Multiply by another variable
-            if self.data.shape == x.data.shape:
-                cp=self.copy()
-                cp.data*=x.data
-                keys=self.attributes.keys()
-                for att in x.attributes.keys():
-                    if att not in keys:
-                        cp.attributes[att]=x.attributes[att]
-            else:
-                raise TypeError('var:{} and var:{} do not have identical shape'.format(self.name, x.name))
-        return cp
-        
+        return self._operate(np.multiply, x)
 
     def __rmul__(self, x):
-        cp=None
-        if isinstance(x,(int,float,bool,np.ndarray )): # We muliply by a scalar
-            cp=self.copy()
-            cp.data*=x
-        elif isinstance(x, DataClass): # Multiply by another variable
-            if self.data.shape == x.data.shape:
-                cp=self.copy()
-                cp.data*=x.data
-                keys=self.attributes.keys()
-                for att in x.attributes.keys():
-                    if att not in keys:
-                        cp.attributes[att]=x.attributes[att]
-            else:
-                raise TypeError('var:{} and var:{} do not have identical shape'.format(self.name, x.name))
-        return cp
-    
+        return self._operate(np.multiply, x, reverse=True)
+
+    def __imul__(self, x):
+        return self._ioperate(np.multiply, x)
+
     # for python 2.x
     def __div__(self, x):
-        cp=None
-        if isinstance(x,(int,float,bool,np.ndarray )): # We divide by a scalar
-            cp=self.copy()
-            cp.data/=x
-        elif isinstance(x, DataClass): # divide by another variable
-            if self.data.shape == x.data.shape:
-                cp=self.copy()
-                cp.data/=x.data
-                keys=self.attributes.keys()
-                for att in x.attributes.keys():
-                    if att not in keys:
-                        cp.attributes[att]=x.attributes[att]
-            else:
-                raise TypeError('var:{} and var:{} do not have identical shape'.format(self.name, x.name))
-        return cp
-            
+        return self._operate(np.true_divide, x)
+
     def __rdiv__(self, x): # Reverse divsion (non-commutative)
-        cp=None
-        if isinstance(x,(int,float,bool,np.ndarray )): # We divide by a scalar
-            cp=self.copy()
-            cp.data=x/cp.data
-        elif isinstance(x, DataClass): # divide by another variable
-            if self.data.shape == x.data.shape:
-                cp=self.copy()
-                cp.data=x.data/cp.data
-                keys=self.attributes.keys()
-                for att in x.attributes.keys():
-                    if att not in keys:
-                        cp.attributes[att]=x.attributes[att]
-            else:
-                raise TypeError('var:{} and var:{} do not have identical shape'.format(self.name, x.name))
-        return cp
-    
+        return self._operate(np.true_divide, x, reverse=True)
+
+    def __idiv__(self, x):
+        return self._ioperate(np.true_divide, x)
+
     # for python 3.x
     def __truediv__(self, x):
-        cp=None
-        if isinstance(x,(int,float,bool,np.ndarray )): # We divide by a scalar
-            cp=self.copy()
-            cp.data/=x
-        elif isinstance(x, DataClass): # divide by another variable
-            if self.data.shape == x.data.shape:
-                cp=self.copy()
-                cp.data/=x.data
-                keys=self.attributes.keys()
-                for att in x.attributes.keys():
-                    if att not in keys:
-                        cp.attributes[att]=x.attributes[att]
-            else:
-                raise TypeError('var:{} and var:{} do not have identical shape'.format(self.name, x.name))
-        return cp
-    
+        return self._operate(np.true_divide, x)
+
     def __rtruediv__(self, x): # Reverse divsion (non-commutative)
-        cp=None
-        if isinstance(x,(int,float,bool,np.ndarray )): # We divide by a scalar
-            cp=self.copy()
-            cp.data=x/cp.data
-        elif isinstance(x, DataClass): # divide by another variable
-            if self.data.shape == x.data.shape:
-                cp=self.copy()
-                cp.data=x.data/cp.data
-                keys=self.attributes.keys()
-                for att in x.attributes.keys():
-                    if att not in keys:
-                        cp.attributes[att]=x.attributes[att]
-            else:
-                raise TypeError('var:{} and var:{} do not have identical shape'.format(self.name, x.name))
-        return cp
-    
+        return self._operate(np.true_divide, x, reverse=True)
+
+    def __itruediv__(self, x):
+        return self._ioperate(np.true_divide, x)
+
     # for both python 2.x and 3.x
     def __floordiv__(self, x):
-        cp=None
-        if isinstance(x,(int,float,bool,np.ndarray )): # We divide by a scalar
-            cp=self.copy()
-            cp.data//=x
-        elif isinstance(x, DataClass): # divide by another variable
-            if self.data.shape == x.data.shape:
-                cp=self.copy()
-                cp.data/=x.data
-                keys=self.attributes.keys()
-                for att in x.attributes.keys():
-                    if att not in keys:
-                        cp.attributes[att]=x.attributes[att]
-            else:
-                raise TypeError('var:{} and var:{} do not have identical shape'.format(self.name, x.name))
-        return cp
+        return self._operate(np.floor_divide, x)
 
     def __rfloordiv__(self, x): # Reverse divsion (non-commutative)
-        cp=None
-        if isinstance(x,(int,float,bool,np.ndarray )): # We divide by a scalar
-            cp=self.copy()
-            cp.data=x//cp.data
-        elif isinstance(x, DataClass): # divide by another variable
-            if self.data.shape == x.data.shape:
-                cp=self.copy()
-                cp.data=x.data/cp.data
-                keys=self.attributes.keys()
-                for att in x.attributes.keys():
-                    if att not in keys:
-                        cp.attributes[att]=x.attributes[att]
-            else:
-                raise TypeError('var:{} and var:{} do not have identical shape'.format(self.name, x.name))
-        return cp
+        return self._operate(np.floor_divide, x, reverse=True)
+
+    def __ifloordiv__(self, x):
+        return self._ioperate(np.floor_divide, x)
 
     def __pow__(self, x):
-        cp=None
-        if isinstance(x,(int,float,bool,np.ndarray )): # We divide by a scalar
-            cp=self.copy()
-            cp.data = cp.data**x
-        elif isinstance(x, DataClass): # divide by another variable
-            if self.data.shape == x.data.shape:
-                cp=self.copy()
-                cp.data = cp.data**x.data
-                keys=self.attributes.keys()
-                for att in x.attributes.keys():
-                    if att not in keys:
-                        cp.attributes[att]=x.attributes[att]
-            else:
-                raise TypeError('var:{} and var:{} do not have identical shape'.format(self.name, x.name))
-        return cp
-    
-    def __rpow__(self, x): # Reverse divsion (non-commutative)
-        cp=None
-        if isinstance(x,(int,float,bool,np.ndarray )): # We divide by a scalar
-            cp=self.copy()
-            cp.data=x**cp.data
-        elif isinstance(x, DataClass): # divide by another variable
-            if self.data.shape == x.data.shape:
-                cp=self.copy()
-                cp.data=x.data**cp.data
-                keys=self.attributes.keys()
-                for att in x.attributes.keys():
-                    if att not in keys:
-                        cp.attributes[att]=x.attributes[att]
-            else:
-                raise TypeError('var:{} and var:{} do not have identical shape'.format(self.name, x.name))
-        return cp
+        return self._operate(np.power, x)
+
+    def __rpow__(self, x): # Reverse power (non-commutative)
+        return self._operate(np.power, x, reverse=True)
+
+    def __ipow__(self, x):
+        return self._ioperate(np.power, x)
@@ -9,111 +9,159 @@
 '''
 
 # WRF CONSTANTS
-WRF_R_D = 287.05
-WRF_R_V = 451.51
-WRF_RDV = WRF_R_D / WRF_R_V
-WRF_O_M_RDV = 1.0 - WRF_RDV
-WRF_RVD_M_O = WRF_R_V / WRF_R_D - 1.0
-WRF_G = 9.81
+from pyWRF.kernels import WRF_R_D, WRF_R_V, WRF_RDV, WRF_O_M_RDV, WRF_RVD_M_O, WRF_G
+import pyWRF.kernels as k
 
-DERIVED_VARS=['N', 'QV_v', 'QR_v', 'QS_v', 'QG_v', 'QC_v', 'QI_v', 'RHO', 'Pw', 'P', 'T', 'Zw', 'Zm']
+HYDROMETEORS = ['QR', 'QC', 'QI', 'QS', 'QG']
 
 import numpy as np
+from collections import OrderedDict
 
-def get_derived_var(file_instance, varname, options):
-    derived_var = None
-    if varname == "N":
-        d = file_instance.get_variable(['T','Pw','P'],**options)
-        derived_var=(77.6/d['T'])*(0.01*d['P']+4810*(0.01*d['Pw'])/d['T'])
-        derived_var.attributes['long_name']='Refractivity'
-        derived_var.attributes['units']='-'
-    elif varname == "QV_v":  # Water vapour mass density
-        d = file_instance.get_variable(['QV','RHO'],**options)
-        derived_var = d['QV']*d['RHO']
-        derived_var.name = 'QV_v'
-        derived_var.attributes['units'] = 'kg/m3'
-        derived_var.attributes['long_name'] = 'Water vapor mass density'
-    elif varname == "QR_v":  # Rain water mass density
-        d = file_instance.get_variable(['QR','RHO'],**options)
-        derived_var = d['QR']*d['RHO']
-        derived_var.name='QR_v'
-        derived_var.attributes['units']='kg/m3'
-        derived_var.attributes['long_name']='Rain mass density'
-    elif varname == "QS_v":  # Snow water mass density
-        d = file_instance.get_variable(['QS','RHO'],**options)
-        derived_var=d['QS']*d['RHO']
-        derived_var.name='QS_v'
-        derived_var.attributes['units']='kg/m3'
-        derived_var.attributes['long_name']='Snow mass density'
-    elif varname == "QG_v":  # Graupel water mass density
-        d = file_instance.get_variable(['QG','RHO'],**options)
-        derived_var=d['QG']*d['RHO']
-        derived_var.name='QG_v'
-        derived_var.attributes['units']='kg/m3'
-        derived_var.attributes['long_name']='Graupel mass density'
-    elif varname == "QC_v":  # Cloud water mass density
-        d = file_instance.get_variable(['QC','RHO'],**options)
-        derived_var=d['QC']*d['RHO']
-        derived_var.name='QC_v'
-        derived_var.attributes['units']='kg/m3'
-        derived_var.attributes['long_name']='Cloud mass density'
-    elif varname == "QI_v":  # Ice cloud water mass density
-        d = file_instance.get_variable(['QI','RHO'],**options)
-        derived_var=d['QI']*d['RHO']
-        derived_var.name='QI_v'
-        derived_var.attributes['units']='kg/m3'
-        derived_var.attributes['long_name']='Ice crystals mass density'
-    elif varname == 'RHO': # AIR DENSITY
-        d = file_instance.get_variable(['P','T','QV','QR','QC','QI','QS','QG'],**options)
-        derived_var=d['P']/(d['T']*WRF_R_D*((d['QV']*WRF_RVD_M_O\
-        -d['QR']-d['QC']-d['QI']-d['QS']-d['QG'])+1.0))
-        derived_var.name='RHO'
-        derived_var.attributes['long_name']='Air density'
-        derived_var.attributes['units']='kg/m3'
-    elif varname == 'Pw': # Vapor pressure
-        d = file_instance.get_variable(['P','QV'],**options)
-        derived_var=(d['P']*d['QV'])/(d['QV']*(1-0.6357)+0.6357)
-        derived_var.attributes['long_name']='Vapor pressure'
-        derived_var.attributes['units']='Pa'
-    elif varname == 'P':
-        d = file_instance.get_variable(['Pp', 'PB'], **options)
-        derived_var=(d['Pp']+d['PB'])
-        derived_var.attributes['long_name']='Pressure'
-        derived_var.attributes['units']='Pa'
-    elif varname == 'T':
-        d = file_instance.get_variable(['Thetap', 'T00', 'P', 'P00'], **options)
-        derived_var=(d['Thetap']+d['T00'].data)*((d['P']/d['P00'].data)**0.2857)
-        derived_var.attributes['long_name']='Temperature'
-        derived_var.attributes['units']='K'
-    elif varname == 'Zw':
-        d = file_instance.get_variable(['PHB', 'PH'], **options)
-        derived_var=(d['PHB']+d['PH'])/WRF_G
-        derived_var.attributes['long_name']='Height on velocity(full) levels'
-        derived_var.attributes['units']='m'
-    elif varname == 'Zm':
-        # isothermal layer approximation
-        d = file_instance.get_variable(['Zw', 'T', 'P', 'Pw'], **options)
-
-        slice_ls1, slice_ls2 = list(), list()
-        for dim,coords in d['Zw'].coordinates.items():
-            if dim == 'bottom_top_stag':
-                slice_ls1.append(slice(coords[0], coords[-1])) # z1
-                slice_ls2.append(slice(coords[0]+1, coords[-1]+1)) # z2
-            else:
-                slice_ls1.append(slice(coords[0], coords[-1]+1))
-                slice_ls2.append(slice(coords[0], coords[-1]+1))
-        slice1, slice2 = tuple(slice_ls1), tuple(slice_ls2)
-        Zw1, Zw2 = d['Zw'].get_vertical_slice(slice1), d['Zw'].get_vertical_slice(slice2)
-        
-        Rv = WRF_R_D * (1 + 0.378*d['Pw']/d['P'])
-        a = WRF_G / Rv / d['T']     
-        s = 2. / (1./np.e**(a*Zw1) + 1./np.e**(a*Zw2))
-        derived_var = 1./ a * s.log()
-
-        derived_var.attributes['long_name']='Height on mass(half) levels'
-        derived_var.attributes['units']='m'
-    else:
+class DerivedVar(object):
+    # Declaration of a derived variable: the variables it is computed from,
+    # the kernel computing it and the input giving its grid and metadata.
+    # The kernel is called as kernel(*inputs, out=, [work=], [axis=]) on plain arrays.
+    def __init__(self, inputs, kernel, long_name='', units='', like=None, nwork=0, vertical=False, version=1):
+        self.inputs = list(inputs)
+        self.kernel = kernel
+        self.long_name = long_name
+        self.units = units
+        self.like = like if like is not None else self.inputs[0]
+        self.nwork = nwork # number of work buffers of the kernel
+        self.vertical = vertical # if the kernel works along the vertical axis
+        self.version = version # to be increased when the formula changes
+
+# Names starting with '_' are intermediate subexpressions, they are computed
+# inside the variables using them and are never returned by FileClass
+DERIVED_REGISTRY = OrderedDict()
+
+def register_derived_var(name, inputs, kernel, **kwargs):
+    DERIVED_REGISTRY[name] = DerivedVar(inputs, kernel, **kwargs)
+    if not name.startswith('_') and name not in DERIVED_VARS:
+        DERIVED_VARS.append(name)
+
+DERIVED_VARS = []
+
+register_derived_var('P', ['Pp', 'PB'], k.pressure, long_name='Pressure', units='Pa')
+register_derived_var('T', ['Thetap', 'T00', 'P', 'P00'], k.temperature, nwork=1,
+                     long_name='Temperature', units='K')
+register_derived_var('Pw', ['P', 'QV'], k.vapor_pressure, long_name='Vapor pressure', units='Pa')
+register_derived_var('_MOIST', ['QV'] + HYDROMETEORS, k.moisture_factor)
+register_derived_var('RHO', ['P', 'T', '_MOIST'], k.density, long_name='Air density', units='kg/m3')
+register_derived_var('QV_v', ['QV', 'RHO'], k.mass_density, long_name='Water vapor mass density', units='kg/m3')
+register_derived_var('QR_v', ['QR', 'RHO'], k.mass_density, long_name='Rain mass density', units='kg/m3')
+register_derived_var('QS_v', ['QS', 'RHO'], k.mass_density, long_name='Snow mass density', units='kg/m3')
+register_derived_var('QG_v', ['QG', 'RHO'], k.mass_density, long_name='Graupel mass density', units='kg/m3')
+register_derived_var('QC_v', ['QC', 'RHO'], k.mass_density, long_name='Cloud mass density', units='kg/m3')
+register_derived_var('QI_v', ['QI', 'RHO'], k.mass_density, long_name='Ice crystals mass density', units='kg/m3')
+register_derived_var('N', ['T', 'Pw', 'P'], k.refractivity, long_name='Refractivity', units='-')
+register_derived_var('Zw', ['PHB', 'PH'], k.height_w, long_name='Height on velocity(full) levels', units='m')
+# isothermal layer approximation
+register_derived_var('Zm', ['Zw', 'T', 'P', 'Pw'], k.height_m, like='T', nwork=2, vertical=True,
+                     long_name='Height on mass(half) levels', units='m')
+
+def get_input_vars(varname):
+    # the variables read or derived by FileClass that varname is computed from,
+    # the intermediate subexpressions are expanded to their own inputs
+    inputs = []
+    for inp in DERIVED_REGISTRY[varname].inputs:
+        if inp.startswith('_'):
+            new_inputs = get_input_vars(inp)
+        else:
+            new_inputs = [inp]
+        inputs += [v for v in new_inputs if v not in inputs]
+    return inputs
+
+def get_evaluation_order(varnames, known=()):
+    # depth-first post-order of the derived variables needed by varnames,
+    # names in known (e.g. already available fields) are not expanded
+    order = []
+    def visit(name):
+        if name in order or name in known or name not in DERIVED_REGISTRY:
+            return
+        for inp in DERIVED_REGISTRY[name].inputs:
+            visit(inp)
+        order.append(name)
+    for name in varnames:
+        visit(name)
+    return order
+
+def get_base_fields(varnames, known=()):
+    # the fields needed to evaluate varnames: non-derived fields and the fields in known
+    base = []
+    for name in get_evaluation_order(varnames, known):
+        for inp in DERIVED_REGISTRY[name].inputs:
+            if (inp not in DERIVED_REGISTRY or inp in known) and inp not in base:
+                base.append(inp)
+    return base
+
+def get_formula_version(varname):
+    # versions of the formulas varname is computed with, Ex: (('P', 1), ('T', 1))
+    return tuple((name, DERIVED_REGISTRY[name].version) for name in get_evaluation_order([varname]))
+
+class FusedEngine(object):
+    # Evaluate derived variables from plain arrays of base fields.
+    # Every intermediate is computed once for all the variables requested together,
+    # and written into float32 buffers with in-place numpy operations.
+    def __init__(self, fields, vertical_axis=0):
+        self.fields = dict(fields)
+        self.vertical_axis = vertical_axis
+        self._scratch = {}
+
+    def get_scratch(self, n, like):
+        # work buffers are reused by all the kernels with the same result shape
+        shape = np.shape(like)
+        bufs = self._scratch.setdefault(shape, [])
+        while len(bufs) < n:
+            bufs.append(np.empty(shape, dtype='float32'))
+        return bufs[:n]
+
+    def evaluate(self, varnames, out=None):
+        # out: optional dict of preallocated float32 buffers for the requested variables
+        if out is None:
+            out = {}
+        results = {}
+        for name in get_evaluation_order(varnames, known=self.fields.keys()):
+            spec = DERIVED_REGISTRY[name]
+            arrays = [self.fields[inp] if inp in self.fields else results[inp] for inp in spec.inputs]
+            like = self.fields[spec.like] if spec.like in self.fields else results[spec.like]
+
+            kwargs = {'out':out.get(name)}
+            if spec.nwork > 0:
+                kwargs['work'] = self.get_scratch(spec.nwork, like)
+            if spec.vertical:
+                kwargs['axis'] = self.vertical_axis
+            results[name] = spec.kernel(*arrays, **kwargs)
+
+        return dict((name, self.fields[name] if name in self.fields else results[name]) for name in varnames)
+
+def get_vertical_axis(var):
+    for i, dim in enumerate(var.dimensions):
+        if 'bottom_top' in dim:
+            return i
+    return 0
+
+def compute_derived_var(varname, d):
+    # d: dictionary of the DataClass inputs of varname, see get_input_vars
+    if varname not in DERIVED_VARS:
         raise ValueError('Could not compute derived variable, please specify a valid variable name')
-    
-    derived_var.name = varname        
+
+    spec = DERIVED_REGISTRY[varname]
+    like = d[spec.like]
+    inputs = get_input_vars(varname)
+    for inp in inputs:
+        if d.get(inp) is None:
+            raise ValueError('Could not compute derived variable {}, input {} not found'.format(varname, inp))
+
+    engine = FusedEngine(dict((inp, d[inp].data) for inp in inputs), vertical_axis=get_vertical_axis(like))
+    derived_var = like._new_like(engine.evaluate([varname])[varname])
+    derived_var.name = varname
+    derived_var.attributes['long_name'] = spec.long_name
+    derived_var.attributes['units'] = spec.units
     return derived_var
+
+def get_derived_var(file_instance, varname, options):
+    if varname not in DERIVED_VARS:
+        raise ValueError('Could not compute derived variable, please specify a valid variable name')
+    d = file_instance.get_variable(get_input_vars(varname), **options)
+    return compute_derived_var(varname, d)
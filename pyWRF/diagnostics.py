@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: column-integrated and column-reduced diagnostics of WRF output
+'''
+
+import numpy as np
+from collections import OrderedDict
+
+from pyWRF.derived_vars import HYDROMETEORS
+from pyWRF.data import Coordinates
+
+class ColumnDiagnostic(object):
+    # A 2-D diagnostic of the columns of mass densities of water species (Ex: 'QR_v'):
+    # 'path' integrates their sum over the column with the thickness of the layers (from Zw),
+    # 'max' is the maximum of their sum in the column,
+    # 'top' is the height of the highest level where their sum reaches a threshold
+    def __init__(self, species, reduction, long_name='', units=''):
+        self.species = list(species)
+        self.reduction = reduction
+        self.long_name = long_name
+        self.units = units
+
+COLUMN_DIAGNOSTICS = OrderedDict([
+    ('PW', ColumnDiagnostic(['QV'], 'path', 'Precipitable water', 'kg/m2')),
+    ('LWP', ColumnDiagnostic(['QC', 'QR'], 'path', 'Liquid water path', 'kg/m2')),
+    ('IWP', ColumnDiagnostic(['QI', 'QS', 'QG'], 'path', 'Ice water path', 'kg/m2')),
+    ('TWP', ColumnDiagnostic(HYDROMETEORS, 'path', 'Total condensed water path', 'kg/m2')),
+    ('CMAX', ColumnDiagnostic(HYDROMETEORS, 'max', 'Composite maximum of the condensed water content', 'kg/m3')),
+    ('CTOP', ColumnDiagnostic(HYDROMETEORS, 'top', 'Height of the top of the condensed water content', 'm')),
+])
+# the path of each species, Ex: 'QR_path'
+for Q in ['QV'] + HYDROMETEORS:
+    COLUMN_DIAGNOSTICS[Q+'_path'] = ColumnDiagnostic([Q], 'path', 'Column total of '+Q, 'kg/m2')
+
+# condensed water content at the top of CTOP [kg/m3], an echo-top like threshold
+DEFAULT_TOP_THRESHOLD = 1e-4
+
+def get_diagnostic_inputs(names):
+    # the variables of FileClass needed by the diagnostics names (a name or a list of names)
+    if isinstance(names, str):
+        names = [names]
+    inputs = []
+    for name in names:
+        if name not in COLUMN_DIAGNOSTICS:
+            raise ValueError('Unknown column diagnostic {}, must be one of {}'.format(name, list(COLUMN_DIAGNOSTICS.keys())))
+        diag = COLUMN_DIAGNOSTICS[name]
+        for Q in diag.species:
+            if Q+'_v' not in inputs:
+                inputs.append(Q+'_v')
+        if diag.reduction == 'path' and 'Zw' not in inputs:
+            inputs.append('Zw')
+        if diag.reduction == 'top' and 'Zm' not in inputs:
+            inputs.append('Zm')
+    return inputs
+
+def compute_column_diagnostics(names, fields, top_threshold=DEFAULT_TOP_THRESHOLD):
+    # {name: 2-D float32 array} of the diagnostics from plain (bottom_top, south_north, west_east) arrays,
+    # fields: the arrays of get_diagnostic_inputs(names).
+    # Every species is integrated once and its sums with other species are reduced once,
+    # all the paths being sums of the paths of their species.
+    diags = [COLUMN_DIAGNOSTICS[name] for name in names]
+    results, paths, sums = {}, {}, {}
+
+    if any(diag.reduction == 'path' for diag in diags):
+        Zw = fields['Zw']
+        dz = np.subtract(Zw[1:], Zw[:-1], dtype='float32')
+        for diag in diags:
+            for Q in diag.species if diag.reduction == 'path' else []:
+                if Q not in paths:
+                    paths[Q] = np.einsum('k...,k...->...', fields[Q+'_v'], dz)
+
+    for name, diag in zip(names, diags):
+        if diag.reduction == 'path':
+            result = paths[diag.species[0]].copy()
+            for Q in diag.species[1:]:
+                result += paths[Q]
+        else:
+            key = tuple(diag.species)
+            if key not in sums:
+                total = fields[diag.species[0]+'_v'].copy()
+                for Q in diag.species[1:]:
+                    total += fields[Q+'_v']
+                sums[key] = total
+            total = sums[key]
+            if diag.reduction == 'max':
+                result = total.max(axis=0)
+            else: # the highest level reaching the threshold
+                reached = total >= top_threshold
+                ktop = total.shape[0] - 1 - np.argmax(reached[::-1], axis=0)
+                result = np.take_along_axis(fields['Zm'], ktop[None], axis=0)[0].astype('float32')
+                result[~reached.any(axis=0)] = np.nan
+        results[name] = result
+    return results
+
+def get_horizontal_var(like, data, name, long_name, units):
+    # a 2-D DataClass on the horizontal grid of like
+    var = like._new_like(data, owns_data=True)
+    var.name = name
+    var.dimensions = tuple(like.dimensions[-2:])
+    var.dim = 2
+    var.coordinates = Coordinates((dim, like.coordinates.get_range(dim)) for dim in var.dimensions)
+    var.attributes = like.attributes.copy()
+    for att in ['z-levels', 'topograph']:
+        if att in var.attributes:
+            del var.attributes[att]
+    var.attributes['long_name'] = long_name
+    var.attributes['units'] = units
+    return var
+
+def get_column_diagnostics(source, names, itime=0, top_threshold=DEFAULT_TOP_THRESHOLD, **kwargs):
+    # {name: 2-D DataClass} of the column diagnostics names of a FileClass or SeriesClass at itime,
+    # the densities, Zw and Zm come from get_variable (kwargs are its options), so their common
+    # intermediates (P, T, RHO) are computed once and kept by the cache of the file
+    if isinstance(names, str):
+        names = [names]
+    dic_var = source.get_variable(get_diagnostic_inputs(names), itime=itime, **kwargs)
+    return get_diagnostic_vars(names, dic_var, top_threshold)
+
+def get_diagnostic_vars(names, dic_var, top_threshold=DEFAULT_TOP_THRESHOLD):
+    if isinstance(names, str):
+        names = [names]
+    inputs = get_diagnostic_inputs(names)
+    missing = [name for name in inputs if dic_var.get(name) is None]
+    if len(missing) > 0:
+        raise ValueError('Could not compute column diagnostics, inputs {} not found'.format(missing))
+    results = compute_column_diagnostics(names, dict((name, dic_var[name].data) for name in inputs), top_threshold)
+    like = dic_var[inputs[0]]
+    return OrderedDict((name, get_horizontal_var(like, results[name], name, COLUMN_DIAGNOSTICS[name].long_name,
+                                                 COLUMN_DIAGNOSTICS[name].units)) for name in names)
+
+def iter_column_diagnostics(source, names, itimes=None, top_threshold=DEFAULT_TOP_THRESHOLD, **kwargs):
+    # streaming form of get_column_diagnostics over the frames of a FileClass or SeriesClass,
+    # yields (itime, {name: 2-D DataClass}), one frame of inputs is held at a time (see iter_frames)
+    if isinstance(names, str):
+        names = [names]
+    for itime, dic_var in source.iter_frames(get_diagnostic_inputs(names), itimes, **kwargs):
+        yield itime, get_diagnostic_vars(names, dic_var, top_threshold)
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: interpolate WRF variables to arbitrary (lat, lon, height) points
+'''
+
+import numpy as np
+
+from pyWRF.utilities import get_projector
+
+# number of points processed at once when searching the vertical levels
+DEFAULT_CHUNK_SIZE = 262144
+
+# vertical coordinates of DataClass.interp_levels
+# 'P': pressure [Pa], interpolated in log(P) by default
+# 'Z': height above sea level [m], 'AGL': height above ground level [m]
+LEVEL_COORDINATES = ['P', 'Z', 'AGL']
+
+def get_grid_offsets(var):
+    # position of the data of var on the mass grid: staggered dimensions are shifted
+    # by half a grid point, subsets start at their first coordinate
+    offsets = {}
+    for dim in var.dimensions:
+        if dim.startswith('west_east') or dim.startswith('south_north'):
+            shift = -0.5 if dim.endswith('_stag') else 0.
+            offsets[dim.replace('_stag', '')] = var.coordinates[dim][0] + shift
+    return offsets
+
+class _GridWeights(object):
+    # Interpolation indices and weights of the points on one grid (mass, U, V or W),
+    # as flat indices into the data of the variables and their weights
+    def __init__(self, index, weights, valid, vcoord):
+        self.index = index
+        self.weights = weights
+        self.valid = valid
+        self.vcoord = vcoord # the vertical coordinate the weights were built from
+
+class PointInterpolator(object):
+    # Interpolate variables to points given by lat, lon and a vertical position,
+    # proj_info is the projection of the mass grid, see FileClass.get_projection.
+    # The horizontal bilinear weights and the bracketing levels of every point are computed
+    # once per grid (mass, U, V and W) and reused by every variable on that grid.
+    # vertical: 'linear' interpolates linearly in the vertical coordinate (default: z-levels),
+    #           'logp' interpolates linearly in log of a pressure coordinate, given as vcoord
+    # Points outside of the domain or of the vertical coordinate range get NaN.
+    def __init__(self, proj_info, lat, lon, levels, vertical='linear', chunk_size=DEFAULT_CHUNK_SIZE):
+        if vertical not in ['linear', 'logp']:
+            raise ValueError('Invalid vertical interpolation {}, must be linear or logp'.format(vertical))
+        lat = np.asarray(lat)
+        self.shape = lat.shape
+        self.index_x, self.index_y = get_projector(proj_info).to_wrf(lat, lon, dtype='float64')
+        self.index_x, self.index_y = self.index_x.ravel(), self.index_y.ravel()
+        self.levels = np.broadcast_to(np.asarray(levels, dtype='float64'), self.shape).ravel()
+        self.vertical = vertical
+        self.chunk_size = chunk_size
+        self._grids = {}
+
+    def get_vertical(self, values):
+        # the interpolation is linear in this transform of the vertical coordinate
+        if self.vertical == 'logp':
+            return np.log(values)
+        return values
+
+    def get_weights(self, var, vcoord):
+        offsets = get_grid_offsets(var)
+        key = (var.dimensions, tuple(sorted(offsets.items())))
+        if vcoord is None and var.data.ndim == 3:
+            vcoord = var.attributes['z-levels']
+        grid = self._grids.get(key)
+        if grid is not None and grid.vcoord is vcoord:
+            return grid
+
+        # [A]. horizontal bilinear weights
+        shape = var.data.shape
+        ny, nx = shape[-2], shape[-1]
+        fx = self.index_x - offsets['west_east']
+        fy = self.index_y - offsets['south_north']
+        valid = (fx >= 0) & (fx <= nx-1) & (fy >= 0) & (fy <= ny-1)
+        i0 = np.clip(np.floor(fx), 0, max(nx-2, 0)).astype('intp')
+        j0 = np.clip(np.floor(fy), 0, max(ny-2, 0)).astype('intp')
+        wx = np.clip(fx - i0, 0., 1.)
+        wy = np.clip(fy - j0, 0., 1.)
+        hindex = np.stack([j0*nx+i0, j0*nx+i0+1, (j0+1)*nx+i0, (j0+1)*nx+i0+1], axis=1)
+        hweights = np.stack([(1-wx)*(1-wy), wx*(1-wy), (1-wx)*wy, wx*wy], axis=1)
+
+        if len(shape) == 2:
+            grid = _GridWeights(hindex, hweights, valid, None)
+            self._grids[key] = grid
+            return grid
+
+        # [B]. bracketing levels in the horizontally interpolated columns
+        nz = shape[0]
+        npts = self.levels.size
+        column = np.asarray(vcoord).reshape(nz, -1)
+        target = self.get_vertical(self.levels)
+        k0 = np.zeros(npts, dtype='intp')
+        wz = np.zeros(npts, dtype='float64')
+        for start in range(0, npts, self.chunk_size):
+            sl = slice(start, start+self.chunk_size)
+            # (nz, chunk) column of the vertical coordinate at the points
+            col = (column[:, hindex[sl]] * hweights[sl]).sum(axis=-1)
+            col = self.get_vertical(col)
+            if col[-1].mean() < col[0].mean(): # decreasing coordinate, e.g. pressure
+                col, tgt = -col, -target[sl]
+            else:
+                tgt = target[sl]
+            valid[sl] &= (tgt >= col[0]) & (tgt <= col[-1])
+            k = np.clip(np.sum(col <= tgt, axis=0)-1, 0, nz-2)
+            lower = np.take_along_axis(col, k[None, :], axis=0)[0]
+            upper = np.take_along_axis(col, k[None, :]+1, axis=0)[0]
+            k0[sl] = k
+            with np.errstate(divide='ignore', invalid='ignore'):
+                wz[sl] = np.clip((tgt - lower) / (upper - lower), 0., 1.)
+
+        # 8 corners: 4 horizontal neighbours on the levels k0 and k0+1
+        layer = ny*nx
+        index = np.concatenate([hindex + (k0*layer)[:, None], hindex + ((k0+1)*layer)[:, None]], axis=1)
+        weights = np.concatenate([hweights * (1-wz)[:, None], hweights * wz[:, None]], axis=1)
+        grid = _GridWeights(index, weights, valid, vcoord)
+        self._grids[key] = grid
+        return grid
+
+    def interpolate(self, var, vcoord=None, dtype='float32'):
+        # var: DataClass with its z-levels assigned (or a vcoord on its grid)
+        if vcoord is not None and not isinstance(vcoord, np.ndarray): # a DataClass
+            vcoord = vcoord.data
+        grid = self.get_weights(var, vcoord)
+        flat = var.data.reshape(-1)
+        values = np.empty(self.levels.size, dtype=dtype)
+        for start in range(0, values.size, self.chunk_size):
+            sl = slice(start, start+self.chunk_size)
+            values[sl] = (flat[grid.index[sl]] * grid.weights[sl]).sum(axis=1)
+        values[~grid.valid] = np.nan
+        return values.reshape(self.shape)
+
+    __call__ = interpolate
+
+def interpolate_points(file_instance, var_names, lat, lon, heights, itime=0, **kwargs):
+    # values of var_names (a name or a list of names) at (lat, lon, height) points, heights in m above sea level
+    if isinstance(var_names, str):
+        var_names = [var_names]
+    dic_var = file_instance.get_variable(list(var_names), itime=itime, assign_heights=True, **kwargs)
+    interpolator = PointInterpolator(file_instance.get_projection(), lat, lon, heights)
+    return dict((name, interpolator(dic_var[name])) for name in var_names)
+
+class VerticalInterpolator(object):
+    # Interpolate 3-D variables to fixed levels of a vertical coordinate, Ex: pressure or height.
+    # vcoord is the coordinate on the grid of the variables, with the vertical axis first.
+    # The bracketing level indices and weights of every column are computed once for the
+    # level set and applied to any number of variables, log interpolates in log(vcoord).
+    # chunk_size: number of horizontal columns processed at once (default: all)
+    # Levels outside of a column get NaN.
+    def __init__(self, vcoord, levels, log=False, chunk_size=None):
+        vcoord = np.asarray(vcoord)
+        self.levels = np.asarray(levels, dtype='float64').ravel()
+        self.nz, self.hshape = vcoord.shape[0], vcoord.shape[1:]
+        ncol = int(np.prod(self.hshape))
+        self.chunk_size = chunk_size if chunk_size else ncol
+
+        nlev = self.levels.size
+        self.index = np.empty((nlev, ncol), dtype='intp')
+        self.weights = np.empty((nlev, ncol), dtype='float32')
+        self.valid = np.empty((nlev, ncol), dtype='bool')
+
+        column = vcoord.reshape(self.nz, ncol)
+        target = np.log(self.levels) if log else self.levels
+        for sl in self.get_chunks(ncol):
+            col = column[:, sl].astype('float64')
+            if log:
+                np.log(col, out=col)
+            if col[-1].mean() < col[0].mean(): # decreasing coordinate, e.g. pressure
+                col, tgt = -col, -target
+            else:
+                tgt = target
+            for ilev in range(nlev):
+                k = np.clip(np.sum(col <= tgt[ilev], axis=0)-1, 0, self.nz-2)
+                lower = np.take_along_axis(col, k[None, :], axis=0)[0]
+                upper = np.take_along_axis(col, k[None, :]+1, axis=0)[0]
+                self.index[ilev, sl] = k
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    self.weights[ilev, sl] = np.clip((tgt[ilev] - lower) / (upper - lower), 0., 1.)
+                self.valid[ilev, sl] = (tgt[ilev] >= col[0]) & (tgt[ilev] <= col[-1])
+
+    @property
+    def nbytes(self):
+        return self.index.nbytes + self.weights.nbytes + self.valid.nbytes
+
+    def get_chunks(self, ncol):
+        return [slice(start, start+self.chunk_size) for start in range(0, ncol, self.chunk_size)]
+
+    def apply(self, data, out=None):
+        # data: array on the grid of vcoord, out: optional float32 array (nlevels,) + horizontal shape
+        data = np.asarray(data)
+        if data.shape != (self.nz,) + self.hshape:
+            raise ValueError('data and vertical coordinate do not have identical shape')
+        if out is None:
+            out = np.empty((self.levels.size,) + self.hshape, dtype='float32')
+        flat = data.reshape(self.nz, -1)
+        out_flat = out.reshape(self.levels.size, -1)
+        for sl in self.get_chunks(flat.shape[1]):
+            index = self.index[:, sl]
+            lower = np.take_along_axis(flat[:, sl], index, axis=0)
+            upper = np.take_along_axis(flat[:, sl], index+1, axis=0)
+            upper -= lower
+            upper *= self.weights[:, sl]
+            upper += lower
+            upper[~self.valid[:, sl]] = np.nan
+            out_flat[:, sl] = upper
+        return out
+
+    __call__ = apply
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: fused numpy kernels of the derived variables, working on plain arrays
+'''
+
+# Every kernel writes its result into a float32 buffer `out` (allocated if not given),
+# intermediate results are computed in place in `out` or in the `work` buffers,
+# so that no temporary arrays are materialised.
+
+import numpy as np
+
+# WRF CONSTANTS
+WRF_R_D = 287.05
+WRF_R_V = 451.51
+WRF_RDV = WRF_R_D / WRF_R_V
+WRF_O_M_RDV = 1.0 - WRF_RDV
+WRF_RVD_M_O = WRF_R_V / WRF_R_D - 1.0
+WRF_G = 9.81
+
+# Ratio of vapor pressure formula
+WRF_EPS = 0.6357
+
+def get_buffer(out, like):
+    if out is None:
+        out = np.empty(np.shape(like), dtype='float32')
+    return out
+
+def get_work(work, n, like):
+    if work is None:
+        work = [None] * n
+    return [get_buffer(w, like) for w in work]
+
+def vertical_slice(arr, axis, sl):
+    index = [slice(None)] * arr.ndim
+    index[axis] = sl
+    return arr[tuple(index)]
+
+def pressure(Pp, PB, out=None):
+    # P = Pp + PB
+    out = get_buffer(out, Pp)
+    np.add(Pp, PB, out=out)
+    return out
+
+def temperature(Thetap, T00, P, P00, out=None, work=None):
+    # T = (Thetap + T00) * (P / P00)**0.2857
+    out = get_buffer(out, Thetap)
+    w, = get_work(work, 1, Thetap)
+    np.divide(P, P00, out=out)
+    np.power(out, 0.2857, out=out)
+    np.add(Thetap, T00, out=w)
+    out *= w
+    return out
+
+def vapor_pressure(P, QV, out=None):
+    # Pw = P * QV / (QV * (1 - eps) + eps)
+    out = get_buffer(out, P)
+    np.multiply(QV, 1.0 - WRF_EPS, out=out)
+    out += WRF_EPS
+    np.divide(QV, out, out=out)
+    out *= P
+    return out
+
+def moisture_factor(QV, QR, QC, QI, QS, QG, out=None):
+    # the subexpression QV * WRF_RVD_M_O - sum(hydrometeors) + 1 of the air density
+    out = get_buffer(out, QV)
+    np.multiply(QV, WRF_RVD_M_O, out=out)
+    out += 1.0
+    for Q in (QR, QC, QI, QS, QG):
+        out -= Q
+    return out
+
+def density(P, T, moist, out=None):
+    # RHO = P / (T * R_D * moist), out may be the moist buffer itself
+    out = get_buffer(out, P)
+    np.multiply(moist, T, out=out)
+    out *= WRF_R_D
+    np.divide(P, out, out=out)
+    return out
+
+def mass_density(Q, RHO, out=None):
+    # Q_v = Q * RHO
+    out = get_buffer(out, Q)
+    np.multiply(Q, RHO, out=out)
+    return out
+
+def refractivity(T, Pw, P, out=None):
+    # N = (77.6 / T) * (0.01 * P + 4810 * (0.01 * Pw) / T)
+    #   = 0.776 * (P + 4810 * Pw / T) / T
+    out = get_buffer(out, T)
+    np.divide(Pw, T, out=out)
+    out *= 4810.
+    out += P
+    out *= 0.776
+    out /= T
+    return out
+
+def height_w(PHB, PH, out=None):
+    # Zw = (PHB + PH) / G
+    out = get_buffer(out, PHB)
+    np.add(PHB, PH, out=out)
+    out /= WRF_G
+    return out
+
+def height_m(Zw, T, P, Pw, out=None, work=None, axis=0):
+    # isothermal layer approximation between two full levels
+    # a = G / (Rv * T), Rv = R_D * (1 + 0.378 * Pw / P)
+    # Zm = log(2 / (exp(-a * Zw1) + exp(-a * Zw2))) / a
+    out = get_buffer(out, T)
+    a, e2 = get_work(work, 2, T)
+    Zw1 = vertical_slice(Zw, axis, slice(None, -1))
+    Zw2 = vertical_slice(Zw, axis, slice(1, None))
+
+    np.divide(Pw, P, out=a)
+    a *= 0.378
+    a += 1.0
+    a *= WRF_R_D
+    a *= T
+    np.divide(WRF_G, a, out=a)
+
+    np.multiply(a, Zw1, out=out)
+    np.negative(out, out=out)
+    np.exp(out, out=out)
+    np.multiply(a, Zw2, out=e2)
+    np.negative(e2, out=e2)
+    np.exp(e2, out=e2)
+    out += e2
+
+    np.divide(2., out, out=out)
+    np.log(out, out=out)
+    out /= a
+    return out
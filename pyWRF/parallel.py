@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: process the time steps of a WRF output file or series in parallel
+'''
+
+# global import
+import numpy as np
+import multiprocessing
+import multiprocessing.util
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# local import
+from pyWRF.WRFio import FileClass
+from pyWRF.series import SeriesClass
+
+# state of a worker process: its own file handle and the shared outputs
+_worker = {}
+
+def _open_source(fnames):
+    # a single file or a series of files (glob pattern or list of files)
+    if isinstance(fnames, str) and os.path.isfile(fnames):
+        return FileClass(fnames)
+    return SeriesClass(fnames)
+
+def _init_worker(fnames, var_names, paths, options):
+    # each worker opens its own netCDF handle, closed when the worker exits
+    _worker['source'] = _open_source(fnames)
+    multiprocessing.util.Finalize(_worker['source'], _worker['source'].close, exitpriority=10)
+    _worker['var_names'] = var_names
+    _worker['options'] = options
+    _worker['out'] = dict((name, np.load(path, mmap_mode='r+')) for name, path in paths.items())
+
+def _process_time(pos, itime):
+    # compute one time step and write it straight into the shared outputs,
+    # only the indices go back to the main process
+    source = _worker['source']
+    dic_var = source.get_variable(_worker['var_names'], itime=itime, **_worker['options'])
+    for name in _worker['var_names']:
+        _worker['out'][name][pos] = dic_var[name].data
+    source.release_time(itime)
+    return pos, itime
+
+def process_times(fnames, var_names, itimes=None, max_workers=None, ordered=True, out_dir=None, **kwargs):
+    # Compute var_names (a name or a list of names) for many time steps of a file or series in a pool of processes.
+    # Yields (itime, dic) with dic[var_name] the array of that time step, in the order
+    # of itimes if ordered, else in the order of completion. kwargs are options of get_variable.
+    # The results are not pickled: workers write them into memory-mapped .npy files
+    # of shape (len(itimes),) + shape of the variable, in out_dir if given (the files
+    # are kept), else in a temporary directory on shared memory (removed at the end).
+    # [A]. Allocate the outputs
+    var_names = [var_names] if isinstance(var_names, str) else list(var_names)
+    source = _open_source(fnames)
+    missing = source.get_missing_variables(var_names)
+    if len(missing) > 0:
+        source.close()
+        raise ValueError('Variables {} not found in {}'.format(missing, fnames))
+    if itimes is None:
+        itimes = range(source.ntimes)
+    itimes = list(itimes)
+    shapes = dict((name, source.get_shape(name, kwargs.get('subset'))) for name in var_names)
+    source.close()
+
+    keep_files = out_dir is not None
+    if keep_files:
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+    else:
+        out_dir = tempfile.mkdtemp(prefix='pyWRF_', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    paths, out = {}, {}
+    for name in var_names:
+        paths[name] = os.path.join(out_dir, name+'.npy')
+        out[name] = np.lib.format.open_memmap(paths[name], mode='w+', dtype='float32',
+                                              shape=(len(itimes),)+shapes[name])
+
+    # [B]. Distribute the time steps, the workers are spawned: a forked child would
+    # inherit the netCDF/HDF5 library state and the threads of the parent
+    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker, initargs=(fnames, var_names, paths, kwargs))
+    futures = []
+    try:
+        futures = [executor.submit(_process_time, pos, itime) for pos, itime in enumerate(itimes)]
+        for future in (futures if ordered else as_completed(futures)):
+            pos, itime = future.result()
+            yield itime, dict((name, out[name][pos]) for name in var_names)
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+        if not keep_files: # the mappings of the main process stay valid
+            shutil.rmtree(out_dir, ignore_errors=True)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: logging and opt-in profiling of the reads and computations of pyWRF
+'''
+
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+# pyWRF is silent unless the application configures logging, or calls set_log_level
+logger = logging.getLogger('pyWRF')
+logger.addHandler(logging.NullHandler())
+
+def set_log_level(level=logging.INFO):
+    # print the messages of pyWRF from level on, Ex: logging.DEBUG for the variable trace
+    if not any(isinstance(handler, logging.StreamHandler) for handler in logger.handlers):
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(levelname)s: %(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(level)
+
+# statistics of the netCDF variables read and of the variables of pyWRF (base or derived),
+# times in s and sizes in bytes
+READ_FIELDS = ['read_time', 'read_bytes', 'reads', 'peak_bytes']
+VARIABLE_FIELDS = ['compute_time', 'computes', 'cache_hits', 'cache_misses', 'peak_bytes']
+
+class Profiler(object):
+    # Statistics of the netCDF variables read and the variables got from a file or series,
+    # see FileClass.enable_profiler. Reads may happen in a prefetch thread.
+    # netCDF names and pyWRF names are kept apart, Ex: 'P' is read as the pressure perturbation
+    # and derived as the pressure.
+    def __init__(self):
+        self.reads = OrderedDict()
+        self.variables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_record(self, table, fields, name):
+        if name not in table:
+            table[name] = OrderedDict((field, 0) for field in fields)
+        return table[name]
+
+    def add_read(self, ncname, seconds, array):
+        with self._lock:
+            record = self.get_record(self.reads, READ_FIELDS, ncname)
+            record['read_time'] += seconds
+            record['read_bytes'] += array.nbytes
+            record['reads'] += 1
+            record['peak_bytes'] = max(record['peak_bytes'], array.nbytes)
+
+    def add_compute(self, name, seconds, array):
+        with self._lock:
+            record = self.get_record(self.variables, VARIABLE_FIELDS, name)
+            record['compute_time'] += seconds
+            record['computes'] += 1
+            record['peak_bytes'] = max(record['peak_bytes'], array.nbytes)
+
+    def add_cache(self, name, hit):
+        with self._lock:
+            self.get_record(self.variables, VARIABLE_FIELDS, name)['cache_hits' if hit else 'cache_misses'] += 1
+
+    @contextmanager
+    def timer(self):
+        # Ex: with profiler.timer() as elapsed: ...; elapsed[0] is the time in s
+        elapsed = [0.]
+        start = time.perf_counter()
+        try:
+            yield elapsed
+        finally:
+            elapsed[0] = time.perf_counter() - start
+
+    def reset(self):
+        with self._lock:
+            self.reads.clear()
+            self.variables.clear()
+
+    def to_dict(self):
+        # {'reads': {ncname: statistics}, 'variables': {name: statistics}, 'total': statistics},
+        # peak_bytes of total is the largest array read or computed
+        with self._lock:
+            tables = [('reads', self.reads), ('variables', self.variables)]
+            result = OrderedDict((key, OrderedDict((name, OrderedDict(record)) for name, record in table.items()))
+                                 for key, table in tables)
+        total = OrderedDict((field, 0) for field in READ_FIELDS[:-1] + VARIABLE_FIELDS)
+        for key, table in tables:
+            for record in result[key].values():
+                for field, value in record.items():
+                    total[field] = max(total[field], value) if field == 'peak_bytes' else total[field] + value
+        result['total'] = total
+        return result
+
+    def to_json(self, fname=None, indent=2):
+        # the statistics as a JSON string, also written to fname if given
+        text = json.dumps(self.to_dict(), indent=indent)
+        if fname is not None:
+            with open(fname, 'w') as f:
+                f.write(text)
+        return text
+
+def get_timer(profiler):
+    # the timer of profiler, or a context doing nothing when profiling is off (profiler is None),
+    # Ex: with get_timer(self.profiler) as elapsed: ...; elapsed[0] is the time in s (0 if off)
+    if profiler is None:
+        return nullcontext([0.])
+    return profiler.timer()
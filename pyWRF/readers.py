@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: a pool of readers decoding the netCDF variables of a file concurrently
+'''
+
+# global import
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import netCDF4 as nc
+
+# local import
+from pyWRF.utilities import get_window_slice
+
+READER_KINDS = ['process', 'thread']
+
+# the handle of a reader process, opened once by its initializer
+_process_handle = None
+
+def _open_process_handle(fname):
+    global _process_handle
+    _process_handle = nc.Dataset(fname, 'r')
+
+def read_hyperslab(handle, varname, itime, window):
+    # the Time == itime hyperslab of varname within the subset window, as float32,
+    # and the time in s spent reading and decoding it
+    start = time.perf_counter()
+    ncvar = handle.variables[varname]
+    index = [get_window_slice(window, dim) for dim in ncvar.dimensions]
+    if 'Time' in ncvar.dimensions:
+        index[ncvar.dimensions.index('Time')] = itime
+    slab = ncvar[tuple(index)].astype('float32', copy=False)
+    return slab, time.perf_counter() - start
+
+def _read_in_process(varname, itime, window):
+    return read_hyperslab(_process_handle, varname, itime, window)
+
+class ReaderPool(object):
+    # Readers decoding netCDF variables concurrently, each with its own handle on the file,
+    # see FileClass.enable_readers. Reads are submitted and return futures of (slab, seconds).
+    # kind: 'process' (default) reads in worker processes, the decompression runs in parallel
+    #       and the slabs are sent back to the caller.
+    #       'thread' reads in threads of the caller with one handle per thread, only safe with
+    #       a thread-safe build of the netCDF-C and HDF5 libraries.
+    # nreaders: number of readers (default: the number of cores), each reader is a process (or a thread)
+    #           with its own handle, so the pools of several files open at once multiply them
+    # The worker processes are spawned, the state of the HDF5 library of the caller is not forked,
+    # so scripts using the process readers must be protected by if __name__ == '__main__'.
+    def __init__(self, fname, nreaders=None, kind='process'):
+        if kind not in READER_KINDS:
+            raise ValueError('Invalid reader kind {}, must be one of {}'.format(kind, READER_KINDS))
+        self.fname = fname
+        self.kind = kind
+        self.nreaders = nreaders if nreaders is not None else (os.cpu_count() or 1)
+
+        if kind == 'process':
+            self._executor = ProcessPoolExecutor(max_workers=self.nreaders,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_open_process_handle, initargs=(fname,))
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.nreaders)
+            self._local = threading.local()
+            self._handles = []
+            self._handles_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _get_thread_handle(self):
+        if not hasattr(self._local, 'handle'):
+            self._local.handle = nc.Dataset(self.fname, 'r')
+            with self._handles_lock:
+                self._handles.append(self._local.handle)
+        return self._local.handle
+
+    def _read_in_thread(self, varname, itime, window):
+        return read_hyperslab(self._get_thread_handle(), varname, itime, window)
+
+    def submit(self, varname, itime, window=None):
+        # future of (slab, seconds) of the Time == itime hyperslab of varname
+        if self.kind == 'process':
+            return self._executor.submit(_read_in_process, varname, itime, window)
+        return self._executor.submit(self._read_in_thread, varname, itime, window)
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        if self.kind == 'thread':
+            for handle in self._handles:
+                handle.close()
+            self._handles = []
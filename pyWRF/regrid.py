@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: regrid WRF variables to regular lat/lon grids with precomputed sparse weights
+'''
+
+import json
+import numpy as np
+
+from pyWRF.utilities import get_projector
+from pyWRF.interp import get_grid_offsets
+
+REGRID_METHODS = ['bilinear', 'conservative']
+
+# number of products (values x weights) computed at once when applying the weights
+DEFAULT_CHUNK_SIZE = 4194304
+
+class SparseWeights(object):
+    # A sparse matrix of weights in compressed sparse row format (indptr, indices, data),
+    # rows are the target points and columns the flat horizontal index of the source grid.
+    # Rows with no weights (outside of the domain) get NaN.
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr = np.asarray(indptr, dtype='intp')
+        self.indices = np.asarray(indices, dtype='intp')
+        self.data = np.asarray(data, dtype='float64')
+        self.shape = tuple(int(n) for n in shape)
+        self._rows = np.flatnonzero(np.diff(self.indptr) > 0)
+
+    @classmethod
+    def from_coo(cls, rows, cols, weights, shape):
+        # duplicated (row, col) entries are summed
+        keys, inverse = np.unique(np.asarray(rows, dtype='int64') * shape[1] + cols, return_inverse=True)
+        data = np.bincount(inverse.ravel(), weights=np.ravel(weights), minlength=keys.size)
+        rows = keys // shape[1]
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=shape[0]))])
+        return cls(indptr, keys % shape[1], data, shape)
+
+    @property
+    def nnz(self):
+        return self.indices.size
+
+    def dot(self, values, out=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        # (..., ncols) values -> (..., nrows) float32, the leading axes (levels, times, ...)
+        # are a batch multiplied at once, chunk_size bounds the products held in memory
+        values = np.asarray(values)
+        batch_shape = values.shape[:-1]
+        values = values.reshape(-1, self.shape[1])
+        if out is None:
+            out = np.empty(batch_shape + (self.shape[0],), dtype='float32')
+        flat_out = out.reshape(-1, self.shape[0])
+        flat_out[:] = np.nan
+        if self.nnz == 0:
+            return out
+        starts = self.indptr[self._rows]
+        step = max(1, chunk_size // self.nnz)
+        for start in range(0, values.shape[0], step):
+            products = values[start:start+step, self.indices] * self.data
+            flat_out[start:start+step, self._rows] = np.add.reduceat(products, starts, axis=1)
+        return out
+
+def get_cell_bounds(centers):
+    # bounds of the cells of a 1-D regular coordinate, halfway between the centers
+    centers = np.asarray(centers, dtype='float64')
+    if centers.size == 1:
+        return np.array([centers[0] - 0.5, centers[0] + 0.5])
+    mid = 0.5 * (centers[1:] + centers[:-1])
+    return np.concatenate([[2*centers[0] - mid[0]], mid, [2*centers[-1] - mid[-1]]])
+
+class Regridder(object):
+    # Regrid variables of a WRF domain to a regular lat/lon grid (1-D lat and lon of the target).
+    # proj_info is the projection of the mass grid, see FileClass.get_projection.
+    # The weights of each source grid (mass, U, V, or a subset of them) are computed once as
+    # a sparse matrix and reused by every variable, level and time on that grid.
+    # method: 'bilinear' interpolates the four surrounding grid points,
+    #         'conservative' averages the grid cells overlapping each target cell, the overlaps
+    #         are estimated with nsub x nsub points per target cell weighted by cos(lat)
+    # Target points outside of the domain get NaN.
+    def __init__(self, proj_info, lat, lon, method='bilinear', nsub=4, chunk_size=DEFAULT_CHUNK_SIZE):
+        if method not in REGRID_METHODS:
+            raise ValueError('Invalid method {}, must be one of {}'.format(method, REGRID_METHODS))
+        self.proj_info = dict((key, float(value)) for key, value in get_projector(proj_info).proj_info.items())
+        self.lat = np.asarray(lat, dtype='float64')
+        self.lon = np.asarray(lon, dtype='float64')
+        self.method = method
+        self.nsub = nsub
+        self.chunk_size = chunk_size
+        self._points = None
+        self._grids = {}
+
+    @property
+    def shape(self):
+        return (self.lat.size, self.lon.size)
+
+    def get_points(self):
+        # mass grid indices (index_x, index_y) of the points sampling the target cells,
+        # the target points themselves for bilinear, and their weights
+        if self._points is not None:
+            return self._points
+        if self.method == 'bilinear':
+            lat, lon = np.meshgrid(self.lat, self.lon, indexing='ij')
+            weights = np.ones(lat.size)
+        else:
+            # nsub x nsub points evenly spread in each target cell
+            frac = (np.arange(self.nsub) + 0.5) / self.nsub
+            lat_bounds, lon_bounds = get_cell_bounds(self.lat), get_cell_bounds(self.lon)
+            sub_lat = (lat_bounds[:-1, None] + np.diff(lat_bounds)[:, None] * frac).ravel()
+            sub_lon = (lon_bounds[:-1, None] + np.diff(lon_bounds)[:, None] * frac).ravel()
+            lat, lon = np.meshgrid(sub_lat, sub_lon, indexing='ij')
+            weights = np.cos(np.deg2rad(lat)).ravel()
+        index_x, index_y = get_projector(self.proj_info).to_wrf(lat.ravel(), lon.ravel(), dtype='float64')
+        self._points = (index_x, index_y, weights)
+        return self._points
+
+    def get_rows(self):
+        # target row of each point of get_points
+        if self.method == 'bilinear':
+            return np.arange(self.lat.size * self.lon.size)
+        ilat, ilon = np.meshgrid(np.arange(self.lat.size * self.nsub) // self.nsub,
+                                 np.arange(self.lon.size * self.nsub) // self.nsub, indexing='ij')
+        return (ilat * self.lon.size + ilon).ravel()
+
+    def get_key(self, var):
+        # the source grid of a variable: horizontal dimensions, their sizes and their offsets on the mass grid
+        offsets = get_grid_offsets(var)
+        shape = np.shape(var.data)
+        ydim, xdim = var.dimensions[-2], var.dimensions[-1]
+        return (ydim, int(shape[-2]), xdim, int(shape[-1]), float(offsets['south_north']), float(offsets['west_east']))
+
+    def get_weights(self, var):
+        # the SparseWeights of the grid of var (a DataClass with south_north, west_east as last dimensions)
+        key = self.get_key(var)
+        if key not in self._grids:
+            self._grids[key] = self.compute_weights(key)
+        return self._grids[key]
+
+    def compute_weights(self, key):
+        ydim, ny, xdim, nx, offset_y, offset_x = key
+        index_x, index_y, point_weights = self.get_points()
+        fx, fy = index_x - offset_x, index_y - offset_y
+        rows = self.get_rows()
+        shape = (self.lat.size * self.lon.size, ny * nx)
+
+        if self.method == 'bilinear':
+            valid = (fx >= 0) & (fx <= nx-1) & (fy >= 0) & (fy <= ny-1)
+            fx, fy, rows = fx[valid], fy[valid], rows[valid]
+            i0 = np.clip(np.floor(fx), 0, max(nx-2, 0)).astype('intp')
+            j0 = np.clip(np.floor(fy), 0, max(ny-2, 0)).astype('intp')
+            i1, j1 = np.minimum(i0+1, nx-1), np.minimum(j0+1, ny-1)
+            wx = np.clip(fx - i0, 0., 1.)
+            wy = np.clip(fy - j0, 0., 1.)
+            cols = np.stack([j0*nx+i0, j0*nx+i1, j1*nx+i0, j1*nx+i1], axis=1)
+            weights = np.stack([(1-wx)*(1-wy), wx*(1-wy), (1-wx)*wy, wx*wy], axis=1)
+            rows = np.repeat(rows[:, None], 4, axis=1)
+        else:
+            # each sampling point falls in the grid cell of its nearest grid point
+            valid = (fx >= -0.5) & (fx < nx-0.5) & (fy >= -0.5) & (fy < ny-0.5)
+            i = np.floor(fx[valid] + 0.5).astype('intp')
+            j = np.floor(fy[valid] + 0.5).astype('intp')
+            cols, rows, weights = j*nx+i, rows[valid], point_weights[valid]
+            # normalized by the sampled area of the cell inside of the domain
+            total = np.bincount(rows, weights=weights, minlength=shape[0])
+            weights = weights / total[rows]
+        return SparseWeights.from_coo(rows.ravel(), cols.ravel(), weights.ravel(), shape)
+
+    def regrid_array(self, var, data, out=None):
+        # data (..., south_north, west_east) on the grid of var -> (..., lat, lon) float32
+        weights = self.get_weights(var)
+        data = np.asarray(data)
+        batch_shape = data.shape[:-2]
+        if out is not None:
+            out = out.reshape(batch_shape + (weights.shape[0],))
+        result = weights.dot(data.reshape(batch_shape + (-1,)), out, self.chunk_size)
+        return result.reshape(batch_shape + self.shape)
+
+    def regrid(self, var, out=None):
+        # a new DataClass of var on the lat/lon grid, with dimensions (..., 'lat', 'lon'),
+        # its heights are regridded too, out: optional float32 array (..., nlat, nlon)
+        regridded = var._new_like(self.regrid_array(var, var.data, out), owns_data=True)
+        regridded.dimensions = tuple(var.dimensions[:-2]) + ('lat', 'lon')
+        coordinates = regridded.coordinates.copy()
+        for dim in var.dimensions[-2:]:
+            if dim in coordinates:
+                del coordinates[dim]
+        coordinates['lat'], coordinates['lon'] = self.lat, self.lon
+        regridded.coordinates = coordinates
+        regridded.attributes = var.attributes.copy()
+        for att in ['z-levels', 'topograph']:
+            if att in var.attributes:
+                regridded.attributes[att] = self.regrid_array(var, var.attributes[att])
+        if 'proj_info' in regridded.attributes:
+            del regridded.attributes['proj_info']
+        regridded.attributes['regrid_method'] = self.method
+        return regridded
+
+    __call__ = regrid
+
+    def save(self, fname):
+        # the target grid and the weights computed so far, to an .npz file, see Regridder.load
+        arrays = {'lat':self.lat, 'lon':self.lon,
+                  'options':json.dumps({'method':self.method, 'nsub':self.nsub, 'proj_info':self.proj_info,
+                                        'grids':[list(key) for key in self._grids.keys()]})}
+        for i, weights in enumerate(self._grids.values()):
+            arrays['indptr_{}'.format(i)] = weights.indptr
+            arrays['indices_{}'.format(i)] = weights.indices
+            arrays['data_{}'.format(i)] = weights.data
+            arrays['shape_{}'.format(i)] = np.asarray(weights.shape)
+        np.savez(fname, **arrays)
+
+    @classmethod
+    def load(cls, fname, chunk_size=DEFAULT_CHUNK_SIZE):
+        with np.load(fname) as f:
+            options = json.loads(str(f['options']))
+            regridder = cls(options['proj_info'], f['lat'], f['lon'], options['method'], options['nsub'], chunk_size)
+            for i, key in enumerate(options['grids']):
+                regridder._grids[tuple(key)] = SparseWeights(f['indptr_{}'.format(i)], f['indices_{}'.format(i)],
+                                                             f['data_{}'.format(i)], f['shape_{}'.format(i)])
+        return regridder
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: a series of WRF output files handled as one dataset with a global time axis
+'''
+
+# global import
+import os
+import netCDF4 as nc
+import numpy as np
+import datetime
+import glob
+from collections import OrderedDict
+
+# local import
+from pyWRF.WRFio import FileClass
+from pyWRF.cache import DEFAULT_CACHE_SIZE, DiskCache
+from pyWRF.writer import write_frames
+from pyWRF.profiler import Profiler
+from pyWRF.stations import StationColumns
+
+# default number of files kept open by a series
+DEFAULT_MAX_OPEN = 8
+
+def open_series(fnames, max_open=DEFAULT_MAX_OPEN, cache_size=DEFAULT_CACHE_SIZE, disk_cache=None):
+    # fnames: a glob pattern, Ex: 'wrfout_d03_*', or a list of file names
+    return SeriesClass(fnames, max_open=max_open, cache_size=cache_size, disk_cache=disk_cache)
+
+def get_file_times(fname):
+    # the valid times of the frames in a wrfout file, from START_DATE and XTIME
+    with nc.Dataset(fname, 'r') as fhandle:
+        init_time = datetime.datetime.strptime(fhandle.START_DATE, '%Y-%m-%d_%H:%M:%S')
+        if 'XTIME' in fhandle.variables:
+            xtime = np.asarray(fhandle.variables['XTIME'][:], dtype='float64')
+            return [init_time + datetime.timedelta(minutes=float(step)) for step in xtime]
+        times = nc.chartostring(fhandle.variables['Times'][:])
+        return [datetime.datetime.strptime(str(t), '%Y-%m-%d_%H:%M:%S') for t in times]
+
+class SeriesClass(object):
+    def __init__(self, fnames, max_open=DEFAULT_MAX_OPEN, cache_size=DEFAULT_CACHE_SIZE, disk_cache=None):
+        if isinstance(fnames, str):
+            fnames = sorted(glob.glob(fnames))
+        if len(fnames) == 0:
+            raise IOError('No WRF output file found for the series')
+
+        self.fnames = list(fnames)
+        self.max_open = max_open
+        self.cache_size = cache_size
+        # one persistent cache shared by all the files
+        self.disk_cache = DiskCache(disk_cache) if isinstance(disk_cache, str) else disk_cache
+
+        # [A]. Index the files once: global time axis sorted by valid time,
+        # frames duplicated in several files (e.g. restarts) are taken from the first file
+        frames = {}
+        for ifile, fname in enumerate(self.fnames):
+            for itime, time in enumerate(get_file_times(fname)):
+                if time not in frames:
+                    frames[time] = (ifile, itime)
+        self.times = sorted(frames.keys())
+        self._index = [frames[time] for time in self.times]
+
+        # [B]. Pool of open files, the least recently used is closed when full
+        self._pool = OrderedDict()
+        # shared by all the files, see enable_profiler
+        self.profiler = None
+        # options of the readers of each open file, see enable_readers
+        self.reader_options = None
+
+    @property
+    def ntimes(self):
+        return len(self.times)
+
+    def get_file(self, itime):
+        # the FileClass holding the global frame itime and its local time index
+        ifile, local_itime = self._index[itime]
+        fname = self.fnames[ifile]
+        if fname in self._pool:
+            self._pool.move_to_end(fname)
+        else:
+            while len(self._pool) >= self.max_open:
+                self._pool.popitem(last=False)[1].close()
+            self._pool[fname] = FileClass(fname, cache_size=self.cache_size, disk_cache=self.disk_cache)
+            self._pool[fname].profiler = self.profiler
+            if self.reader_options is not None:
+                self._pool[fname].enable_readers(**self.reader_options)
+        return self._pool[fname], local_itime
+
+    def enable_profiler(self, profiler=None):
+        # same as FileClass.enable_profiler, one profiler for all the files of the series
+        self.profiler = profiler if profiler is not None else Profiler()
+        for file_instance in self._pool.values():
+            file_instance.profiler = self.profiler
+        return self.profiler
+
+    def disable_profiler(self):
+        self.profiler = None
+        for file_instance in self._pool.values():
+            file_instance.profiler = None
+
+    def enable_readers(self, nreaders=None, kind='process'):
+        # same as FileClass.enable_readers, each open file has its own nreaders readers,
+        # up to max_open * nreaders in total: by default the cores are shared by the open files
+        if nreaders is None:
+            nreaders = max(1, (os.cpu_count() or 1) // self.max_open)
+        self.reader_options = {'nreaders':nreaders, 'kind':kind}
+        for file_instance in self._pool.values():
+            file_instance.enable_readers(**self.reader_options)
+
+    def disable_readers(self):
+        self.reader_options = None
+        for file_instance in self._pool.values():
+            file_instance.disable_readers()
+
+    def get_variable(self, var_names, itime=0, **kwargs):
+        # same as FileClass.get_variable, itime is an index on the global time axis
+        file_instance, local_itime = self.get_file(itime)
+        return file_instance.get_variable(var_names, itime=local_itime, **kwargs)
+
+    def get_file_groups(self, itimes):
+        # itimes split into runs of consecutive frames of the same file: (file, global itimes, local itimes)
+        itimes = list(itimes)
+        i = 0
+        while i < len(itimes):
+            ifile = self._index[itimes[i]][0]
+            group = [itimes[i]]
+            while i+len(group) < len(itimes) and self._index[itimes[i+len(group)]][0] == ifile:
+                group.append(itimes[i+len(group)])
+            file_instance = self.get_file(group[0])[0]
+            yield file_instance, group, [self._index[itime][1] for itime in group]
+            i += len(group)
+
+    def iter_frames(self, var_names, itimes=None, **kwargs):
+        # same as FileClass.iter_frames over the global time axis,
+        # consecutive frames of a file are streamed with the prefetch of that file
+        if itimes is None:
+            itimes = range(self.ntimes)
+        for file_instance, group, local_itimes in self.get_file_groups(itimes):
+            for itime, (local_itime, dic_var) in zip(group, file_instance.iter_frames(var_names, local_itimes, **kwargs)):
+                yield itime, dic_var
+
+    def get_station_series(self, var_names, lat, lon, itimes=None, method='nearest'):
+        # same as FileClass.get_station_series over the global time axis,
+        # the stations are mapped once for all the files (of the same domain)
+        if itimes is None:
+            itimes = range(self.ntimes)
+        stations = StationColumns(self.get_file(0)[0].get_projection(), lat, lon, method)
+        single = not isinstance(var_names, list)
+        names = [var_names] if single else var_names
+        parts = [file_instance.get_station_series(names, lat, lon, local_itimes, stations=stations) \
+            for file_instance, group, local_itimes in self.get_file_groups(itimes)]
+        dic_series = OrderedDict()
+        for name in names:
+            series = [part[name] for part in parts]
+            dic_series[name] = None if any(s is None for s in series) else np.concatenate(series, axis=1)
+        return dic_series[var_names] if single else dic_series
+
+    def get_shape(self, var_name, subset=None):
+        return self.get_file(0)[0].get_shape(var_name, subset)
+
+    def release_time(self, itime):
+        ifile, local_itime = self._index[itime]
+        if self.fnames[ifile] in self._pool:
+            self._pool[self.fnames[ifile]].release_time(local_itime)
+
+    def get_missing_variables(self, varnames):
+        return self.get_file(0)[0].get_missing_variables(varnames)
+
+    def check_if_variables_in_file(self, varnames):
+        return self.get_file(0)[0].check_if_variables_in_file(varnames)
+
+    def to_netcdf(self, fname, var_names, itimes=None, writer_options=None, **kwargs):
+        # same as FileClass.to_netcdf over the global time axis
+        return write_frames(fname, self, var_names, itimes, writer_options, **kwargs)
+
+    def close(self):
+        while len(self._pool) > 0:
+            self._pool.popitem(last=False)[1].close()
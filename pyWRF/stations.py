@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: time series of WRF variables at stations, read column by column
+'''
+
+import logging
+import numpy as np
+from collections import OrderedDict
+
+from pyWRF.utilities import get_projector
+from pyWRF.derived_vars import FusedEngine, get_base_fields
+from pyWRF.profiler import get_timer
+
+logger = logging.getLogger(__name__)
+
+STATION_METHODS = ['nearest', 'bilinear']
+
+# memory for the chunks of the compressed variables kept decompressed while reading columns,
+# every chunk of a block of times is decompressed once for all the stations
+DEFAULT_CHUNK_CACHE = 256 * 1024**2
+
+def get_horizontal_dims(dimensions):
+    # (south_north dimension, west_east dimension) of a netCDF variable, None if it has none
+    ydim = [dim for dim in dimensions if dim.startswith('south_north')]
+    xdim = [dim for dim in dimensions if dim.startswith('west_east')]
+    if len(ydim) == 0 or len(xdim) == 0:
+        return None
+    return ydim[0], xdim[0]
+
+class _StationGrid(object):
+    # The columns of one grid (mass, U or V) read for the stations: unique (j, i) columns,
+    # the columns of each station (one, or four corners) and their weights
+    def __init__(self, jcols, icols, index, weights, valid):
+        self.jcols = jcols
+        self.icols = icols
+        self.index = index
+        self.weights = weights
+        self.valid = valid
+
+class StationColumns(object):
+    # Stations given by lat, lon, mapped once to the grids of a WRF domain,
+    # proj_info is the projection of the mass grid, see FileClass.get_projection.
+    # method: 'nearest' takes the column of the closest grid point,
+    #         'bilinear' interpolates the four surrounding columns (after the derived
+    #         variables are computed on them)
+    # Stations outside of the domain get NaN.
+    def __init__(self, proj_info, lat, lon, method='nearest'):
+        if method not in STATION_METHODS:
+            raise ValueError('Invalid method {}, must be one of {}'.format(method, STATION_METHODS))
+        self.index_x, self.index_y = get_projector(proj_info).to_wrf(np.atleast_1d(lat), np.atleast_1d(lon), dtype='float64')
+        self.index_x, self.index_y = self.index_x.ravel(), self.index_y.ravel()
+        self.method = method
+        self._grids = {}
+
+    @property
+    def nstations(self):
+        return self.index_x.size
+
+    def get_grid(self, ydim, ny, xdim, nx):
+        key = (ydim, ny, xdim, nx)
+        if key in self._grids:
+            return self._grids[key]
+
+        # staggered points are half a grid point before the mass points
+        fx = self.index_x + (0.5 if xdim.endswith('_stag') else 0.)
+        fy = self.index_y + (0.5 if ydim.endswith('_stag') else 0.)
+        if self.method == 'nearest':
+            valid = (fx >= -0.5) & (fx <= nx-0.5) & (fy >= -0.5) & (fy <= ny-0.5)
+            i = np.clip(np.floor(fx+0.5), 0, nx-1).astype('intp')
+            j = np.clip(np.floor(fy+0.5), 0, ny-1).astype('intp')
+            flat = (j*nx + i)[:, None]
+            weights = np.ones(flat.shape, dtype='float64')
+        else:
+            valid = (fx >= 0) & (fx <= nx-1) & (fy >= 0) & (fy <= ny-1)
+            i0 = np.clip(np.floor(fx), 0, max(nx-2, 0)).astype('intp')
+            j0 = np.clip(np.floor(fy), 0, max(ny-2, 0)).astype('intp')
+            wx = np.clip(fx - i0, 0., 1.)
+            wy = np.clip(fy - j0, 0., 1.)
+            flat = np.stack([j0*nx+i0, j0*nx+i0+1, (j0+1)*nx+i0, (j0+1)*nx+i0+1], axis=1)
+            weights = np.stack([(1-wx)*(1-wy), wx*(1-wy), (1-wx)*wy, wx*wy], axis=1)
+
+        # every column is read once, even if shared by several stations
+        columns, index = np.unique(flat, return_inverse=True)
+        grid = _StationGrid(columns // nx, columns % nx, index.reshape(flat.shape), weights, valid)
+        self._grids[key] = grid
+        return grid
+
+    def reduce(self, grid, values):
+        # values of the stations from the values of the columns of grid, the first axis
+        values = values[grid.index] # (station, corner, ...)
+        weights = grid.weights.reshape(grid.weights.shape + (1,) * (values.ndim - 2))
+        result = (values * weights).sum(axis=1).astype('float32')
+        result[~grid.valid] = np.nan
+        return result
+
+def get_time_blocks(ncvar, itimes, cache_bytes):
+    # blocks of itimes whose chunks fit in cache_bytes, with the chunk cache to set (None if not chunked)
+    chunking = ncvar.chunking()
+    if 'Time' not in ncvar.dimensions or chunking == 'contiguous' or chunking is None:
+        return [itimes], None
+    chunk_bytes = int(np.prod(chunking)) * ncvar.dtype.itemsize
+    axis = ncvar.dimensions.index('Time')
+    # chunks of a time chunk (the columns of scattered stations may touch them all)
+    nchunks = int(np.prod([-(-n // c) for k, (n, c) in enumerate(zip(ncvar.shape, chunking)) if k != axis]))
+    ntimes = max(1, cache_bytes // (chunk_bytes * nchunks)) * chunking[axis]
+    blocks = [itimes[start:start+ntimes] for start in range(0, len(itimes), ntimes)]
+    nelems = nchunks * -(-min(ntimes, len(itimes)) // chunking[axis])
+    return blocks, (chunk_bytes * nelems, nelems)
+
+def get_time_index(itimes):
+    # contiguous times are read as one strided slice
+    if len(itimes) > 1 and np.all(np.diff(itimes) == 1):
+        return slice(itimes[0], itimes[-1]+1)
+    return list(itimes)
+
+def read_columns(ncvar, itimes, grid, cache_bytes=DEFAULT_CHUNK_CACHE):
+    # (column, time, level) float32 array of the columns of grid, (column, time) without levels
+    dims = ncvar.dimensions
+    ydim, xdim = get_horizontal_dims(dims)
+    ncol = grid.jcols.size
+    values = None
+    blocks, chunk_cache = get_time_blocks(ncvar, itimes, cache_bytes)
+    if chunk_cache is not None:
+        previous = ncvar.get_var_chunk_cache()
+        ncvar.set_var_chunk_cache(size=chunk_cache[0], nelems=chunk_cache[1])
+    try:
+        it = 0
+        for block in blocks:
+            for c in range(ncol):
+                index = []
+                for dim in dims:
+                    if dim == 'Time':
+                        index.append(get_time_index(block))
+                    elif dim == ydim:
+                        index.append(grid.jcols[c])
+                    elif dim == xdim:
+                        index.append(grid.icols[c])
+                    else:
+                        index.append(slice(None))
+                column = np.asarray(ncvar[tuple(index)], dtype='float32')
+                if 'Time' not in dims: # the same column at all the times
+                    column = np.broadcast_to(column, (len(block),) + column.shape)
+                if values is None:
+                    values = np.empty((ncol, len(itimes)) + column.shape[1:], dtype='float32')
+                values[c, it:it+len(block)] = column
+            it += len(block)
+    finally:
+        if chunk_cache is not None:
+            ncvar.set_var_chunk_cache(size=previous[0], nelems=previous[1], preemption=previous[2])
+    return values
+
+def read_station_series(file_instance, var_names, stations, itimes=None, cache_bytes=DEFAULT_CHUNK_CACHE):
+    # {name: array} of var_names at the stations (StationColumns), (station, time, level) for
+    # 3-D variables and (station, time) otherwise, None for the variables not found.
+    # Only the columns of the stations are read, across the Time dimension, and the derived
+    # variables are computed on those columns only.
+    if itimes is None:
+        itimes = range(file_instance.ntimes)
+    itimes = list(itimes)
+    var_names = list(var_names)
+    derived = [v for v in var_names if file_instance.is_derived(v)]
+    names = [v for v in var_names if not file_instance.is_derived(v)]
+    names += [v for v in get_base_fields(derived, file_instance.get_stored_derived_vars()) if v not in names]
+
+    # [A]. read the columns of the base variables
+    columns, grids = {}, {}
+    for name in names:
+        varname_checked = file_instance.check_varname(name)
+        if varname_checked == '':
+            logger.warning('Variable %s was not found in file %s', name, file_instance.name)
+            continue
+        with file_instance._lock:
+            ncvar = file_instance.variables[varname_checked]
+            hdims = get_horizontal_dims(ncvar.dimensions)
+            if hdims is None: # Ex: T00, one value per time for all the stations
+                index = tuple(get_time_index(itimes) if dim == 'Time' else slice(None) for dim in ncvar.dimensions)
+                values = np.asarray(ncvar[index], dtype='float32').reshape(1, len(itimes), -1)
+                grid = None
+            else:
+                ydim, xdim = hdims
+                grid = stations.get_grid(ydim, file_instance.get_dim_size(ydim), xdim, file_instance.get_dim_size(xdim))
+                with get_timer(file_instance.profiler) as elapsed:
+                    values = read_columns(ncvar, itimes, grid, cache_bytes)
+                if file_instance.profiler is not None:
+                    file_instance.profiler.add_read(varname_checked, elapsed[0], values)
+        columns[name], grids[name] = values, grid
+
+    # [B]. the derived variables on the columns of the mass grid, the vertical axis is the last one
+    missing = [v for v in get_base_fields(derived, file_instance.get_stored_derived_vars()) if v not in columns]
+    if len(derived) > 0 and len(missing) > 0:
+        raise ValueError('Could not compute derived variables {}, inputs {} not found'.format(derived, missing))
+    if len(derived) > 0:
+        fields = dict((name, values if values.ndim == 3 else values[..., None]) for name, values in columns.items())
+        # the derived variables are on the mass grid (horizontally)
+        mass = stations.get_grid('south_north', file_instance.get_dim_size('south_north'),
+                                 'west_east', file_instance.get_dim_size('west_east'))
+        engine = FusedEngine(fields, vertical_axis=2)
+        for name, values in engine.evaluate(derived).items():
+            columns[name], grids[name] = values, mass
+
+    # [C]. from the columns to the stations
+    result = OrderedDict()
+    for name in var_names:
+        if name not in columns:
+            result[name] = None
+        elif grids[name] is None:
+            result[name] = np.repeat(columns[name].reshape(1, len(itimes)), stations.nstations, axis=0)
+        else:
+            result[name] = stations.reduce(grids[name], columns[name])
+    return result
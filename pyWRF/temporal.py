@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: streaming temporal statistics of WRF variables, one frame at a time
+'''
+
+import warnings
+import numpy as np
+from collections import OrderedDict
+
+STATISTICS = ['count', 'mean', 'variance', 'std', 'min', 'max', 'time_of_min', 'time_of_max', 'sum']
+
+class P2Quantile(object):
+    # Approximate quantile p (0 < p < 1) of every element of a stream of frames,
+    # with the P-square algorithm (Jain and Chlamtac, 1985): 5 markers per element,
+    # updated with vectorized operations, so memory is 15 frames whatever the number of frames.
+    # NaN values are skipped, elements with less than 5 values get their exact quantile.
+    def __init__(self, p, shape):
+        if not 0. < p < 1.:
+            raise ValueError('Invalid quantile {}, must be between 0 and 1'.format(p))
+        self.p = p
+        self.count = np.zeros(shape, dtype='int64')
+        self.heights = np.full((5,) + tuple(shape), np.nan)
+        self.positions = np.ones((5,) + tuple(shape)) * np.arange(1., 6.).reshape((5,) + (1,) * len(shape))
+        self.increments = np.array([0., p/2., p, (1.+p)/2., 1.]).reshape((5,) + (1,) * len(shape))
+        self.desired = np.ones((5,) + tuple(shape)) * (1. + 4. * self.increments)
+
+    def update(self, x):
+        x = np.asarray(x, dtype='float64')
+        valid = ~np.isnan(x)
+        q, n = self.heights, self.positions
+
+        # [A]. the first 5 values of an element are kept as they are, then sorted
+        filling = valid & (self.count < 5)
+        if filling.any():
+            index = np.minimum(self.count, 4)
+            first = np.take_along_axis(q, index[None], axis=0)[0]
+            np.put_along_axis(q, index[None], np.where(filling, x, first)[None], axis=0)
+            full = filling & (self.count == 4)
+            if full.any():
+                q[:] = np.where(full, np.sort(q, axis=0), q)
+
+        # [B]. update the markers of the elements with 5 values or more
+        active = valid & (self.count >= 5)
+        self.count += valid
+        if not active.any():
+            return
+        x = np.where(active, x, 0.)
+        q[0] = np.where(active & (x < q[0]), x, q[0])
+        q[4] = np.where(active & (x > q[4]), x, q[4])
+        # cell k of x, q[k] <= x < q[k+1], the markers above it move up
+        k = (x >= q[1]).astype('int64') + (x >= q[2]) + (x >= q[3])
+        for i in range(1, 5):
+            n[i] += active & (i > k)
+        self.desired += np.where(active, self.increments, 0.)
+
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            move = active & (((d >= 1.) & (n[i+1] - n[i] > 1.)) | ((d <= -1.) & (n[i-1] - n[i] < -1.)))
+            if not move.any():
+                continue
+            ds = np.where(d >= 0., 1., -1.)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                parabolic = q[i] + ds / (n[i+1] - n[i-1]) * ((n[i] - n[i-1] + ds) * (q[i+1] - q[i]) / (n[i+1] - n[i]) + \
+                    (n[i+1] - n[i] - ds) * (q[i] - q[i-1]) / (n[i] - n[i-1]))
+                neighbour_q = np.where(ds > 0., q[i+1], q[i-1])
+                neighbour_n = np.where(ds > 0., n[i+1], n[i-1])
+                linear = q[i] + ds * (neighbour_q - q[i]) / (neighbour_n - n[i])
+            estimate = np.where((q[i-1] < parabolic) & (parabolic < q[i+1]), parabolic, linear)
+            q[i] = np.where(move, estimate, q[i])
+            n[i] += np.where(move, ds, 0.)
+
+    def get_value(self):
+        value = self.heights[2].copy()
+        few = (self.count > 0) & (self.count < 5)
+        if few.any():
+            # exact quantile of the values kept
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning) # all-NaN elements
+                exact = np.nanpercentile(np.where(np.arange(5).reshape((5,) + (1,) * value.ndim) < self.count, self.heights, np.nan),
+                                         100. * self.p, axis=0)
+            value[few] = exact[few]
+        value[self.count == 0] = np.nan
+        return value
+
+class StreamingStatistics(object):
+    # Running statistics of one variable over a stream of frames, see update:
+    # count of valid values, mean and variance (Welford), min and max with the time of
+    # their occurrence, sum, and approximate percentiles (P-square, in percent).
+    # Memory is a few frames (15 per percentile) whatever the number of frames.
+    # NaN values are skipped.
+    def __init__(self, percentiles=()):
+        self.percentiles = list(percentiles)
+        self.times = [] # the time of each frame, an index of time_of_min and time_of_max
+        self._like = None
+        self._shape = None
+
+    def start(self, data):
+        shape = np.shape(data)
+        self._shape = shape
+        self._count = np.zeros(shape, dtype='int64')
+        self._mean = np.zeros(shape)
+        self._m2 = np.zeros(shape)
+        self._sum = np.zeros(shape)
+        self._min = np.full(shape, np.inf)
+        self._max = np.full(shape, -np.inf)
+        self._time_of_min = np.full(shape, -1, dtype='int64')
+        self._time_of_max = np.full(shape, -1, dtype='int64')
+        self._quantiles = OrderedDict((q, P2Quantile(q / 100., shape)) for q in self.percentiles)
+
+    def update(self, var, time=None):
+        # add a frame: a DataClass (its time is that of its attributes by default) or an array
+        data = var.data if hasattr(var, 'data') else var
+        if time is None:
+            time = var.attributes.get('time') if hasattr(var, 'attributes') else len(self.times)
+        if self._shape is None:
+            self.start(data)
+            if hasattr(var, '_new_like'):
+                # the metadata of the first frame, without its heights, see get_var
+                self._like = var._new_like(np.empty(0, dtype='float32'))
+                self._like.attributes = var.attributes.copy()
+                for att in ['z-levels', 'topograph']:
+                    if att in self._like.attributes:
+                        del self._like.attributes[att]
+        elif np.shape(data) != self._shape:
+            raise ValueError('Frame of shape {} does not match the shape {} of the statistics'.format(np.shape(data), self._shape))
+
+        itime = len(self.times)
+        self.times.append(time)
+        x = np.asarray(data, dtype='float64')
+        valid = ~np.isnan(x)
+        x0 = np.where(valid, x, 0.)
+
+        self._count += valid
+        delta = np.where(valid, x0 - self._mean, 0.)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._mean += np.where(valid, delta / np.maximum(self._count, 1), 0.)
+        self._m2 += delta * np.where(valid, x0 - self._mean, 0.)
+        self._sum += x0
+
+        lower, higher = valid & (x0 < self._min), valid & (x0 > self._max)
+        self._min[lower], self._time_of_min[lower] = x0[lower], itime
+        self._max[higher], self._time_of_max[higher] = x0[higher], itime
+
+        for quantile in self._quantiles.values():
+            quantile.update(x)
+
+    @property
+    def count(self):
+        return self._count.copy()
+
+    @property
+    def mean(self):
+        return np.where(self._count > 0, self._mean, np.nan)
+
+    def get_variance(self, ddof=1):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self._count > ddof, self._m2 / (self._count - ddof), np.nan)
+
+    @property
+    def variance(self):
+        return self.get_variance()
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    @property
+    def min(self):
+        return np.where(self._count > 0, self._min, np.nan)
+
+    @property
+    def max(self):
+        return np.where(self._count > 0, self._max, np.nan)
+
+    @property
+    def time_of_min(self):
+        # index in times of the frame of the minimum, -1 without valid value
+        return self._time_of_min.copy()
+
+    @property
+    def time_of_max(self):
+        return self._time_of_max.copy()
+
+    @property
+    def sum(self):
+        # accumulation of the valid values
+        return self._sum.copy()
+
+    def get_percentile(self, q):
+        return self._quantiles[q].get_value()
+
+    def get_statistic(self, stat):
+        # stat: one of STATISTICS, or a percentile given when created, Ex: 95
+        if stat in self._quantiles:
+            return self.get_percentile(stat)
+        if stat not in STATISTICS:
+            raise ValueError('Unknown statistic {}, must be one of {} or the percentiles {}'.format(stat, STATISTICS, self.percentiles))
+        return getattr(self, stat)
+
+    def to_dict(self):
+        # {statistic: array} of all the statistics, the percentiles as 'p95', ...
+        result = OrderedDict((stat, self.get_statistic(stat)) for stat in STATISTICS)
+        for q in self.percentiles:
+            result['p{:g}'.format(q)] = self.get_percentile(q)
+        return result
+
+    def get_var(self, stat):
+        # a statistic as a DataClass like the frames (the first frame must be a DataClass)
+        if self._like is None:
+            raise ValueError('The statistics have not been computed from DataClass frames')
+        value = self.get_statistic(stat)
+        var = self._like._new_like(value.astype('float32') if value.dtype.kind == 'f' else value, owns_data=True)
+        var.attributes = self._like.attributes.copy()
+        var.attributes['statistic'] = stat if stat in STATISTICS else 'p{:g}'.format(stat)
+        var.attributes['time_range'] = '{} - {}'.format(self.times[0], self.times[-1])
+        return var
+
+def reduce_frames(source, var_names, itimes=None, percentiles=(), **kwargs):
+    # {name: StreamingStatistics} of var_names (a name or a list of names) over the frames of a FileClass
+    # or SeriesClass, streamed with iter_frames (kwargs are options of get_variable), one frame held at a time
+    var_names = [var_names] if isinstance(var_names, str) else list(var_names)
+    stats = OrderedDict((name, StreamingStatistics(percentiles)) for name in var_names)
+    for itime, dic_var in source.iter_frames(var_names, itimes, **kwargs):
+        for name in var_names:
+            if dic_var[name] is not None:
+                stats[name].update(dic_var[name])
+    return stats
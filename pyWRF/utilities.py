@@ -12,14 +12,109 @@ import sys
 import numpy as np
 import pyproj
 
+# number of points transformed at once by WRFProjector
+DEFAULT_CHUNK_SIZE = 1048576
+
+# projection parameters identifying a WRF domain
+_PROJ_KEYS = ['TRUELAT1', 'TRUELAT2', 'MOAD_CEN_LAT', 'STAND_LON', 'CEN_LAT', 'CEN_LON', 'DX', 'DY', 'nI', 'nJ']
+
+_projectors = {}
+
+def get_projector(proj_info):
+    # projectors are built once per domain and shared
+    key = tuple(float(proj_info[k]) for k in _PROJ_KEYS)
+    if key not in _projectors:
+        _projectors[key] = WRFProjector(proj_info)
+    return _projectors[key]
+
+class WRFProjector(object):
+    # Transform between WGS84 lat/lon and the fractional grid indices of a WRF
+    # Lambert Conformal domain, built once from a proj_info dictionary
+    def __init__(self, proj_info):
+        self.proj_info = dict((k, proj_info[k]) for k in _PROJ_KEYS)
+
+        self.wrf_proj = pyproj.Proj(proj='lcc', # projection type: Lambert Conformal Conic
+                           lat_1=proj_info['TRUELAT1'], lat_2=proj_info['TRUELAT2'], # Cone intersects with the sphere
+                           lat_0=proj_info['MOAD_CEN_LAT'], lon_0=proj_info['STAND_LON'], # Center point
+                           a=6370000, b=6370000) # This is it! The Earth is a perfect sphere
+        self.wgs_proj = pyproj.Proj(proj='latlong', datum='WGS84')
+
+        # python3 or python2
+        if sys.version_info[0] >= 3:
+            self._forward = pyproj.Transformer.from_proj(self.wgs_proj, self.wrf_proj)
+            self._backward = pyproj.Transformer.from_proj(self.wrf_proj, self.wgs_proj)
+
+        # Easting and Northings of the domains center point
+        cen_lambert_x, cen_lambert_y = self._transform(True, proj_info['CEN_LON'], proj_info['CEN_LAT'])
+
+        nx, ny = proj_info['nI'], proj_info['nJ']
+        self.dx, self.dy = proj_info['DX'], proj_info['DY']
+        # Lambert coordinates of the grid point (0, 0)
+        self.x0 = cen_lambert_x - self.dx * (nx - 1) / 2.
+        self.y0 = cen_lambert_y - self.dy * (ny - 1) / 2.
+
+    def _transform(self, forward, x, y, inplace=False):
+        if sys.version_info[0] >= 3:
+            transformer = self._forward if forward else self._backward
+            return transformer.transform(x, y, inplace=inplace)
+        elif forward:
+            return pyproj.transform(self.wgs_proj, self.wrf_proj, x, y)
+        else:
+            return pyproj.transform(self.wrf_proj, self.wgs_proj, x, y)
+
+    def _apply(self, forward, a, b, dtype, chunk_size):
+        # transform the points chunk by chunk through two float64 work buffers,
+        # results are written into the output arrays of the requested dtype
+        a, b = np.asarray(a), np.asarray(b)
+        shape = a.shape
+        a, b = a.reshape(-1), b.reshape(-1) # views for contiguous inputs
+        out_a, out_b = np.empty(a.shape, dtype=dtype), np.empty(b.shape, dtype=dtype)
+        work_a = np.empty(min(chunk_size, a.size), dtype='float64')
+        work_b = np.empty(min(chunk_size, a.size), dtype='float64')
+
+        for start in range(0, a.size, chunk_size):
+            n = min(chunk_size, a.size - start)
+            wa, wb = work_a[:n], work_b[:n]
+            if forward:
+                # lon, lat -> Lambert -> index
+                np.copyto(wa, b[start:start+n])
+                np.copyto(wb, a[start:start+n])
+                wa, wb = self._transform(True, wa, wb, inplace=True)
+                out_a[start:start+n] = (wa - self.x0) / self.dx
+                out_b[start:start+n] = (wb - self.y0) / self.dy
+            else:
+                # index -> Lambert -> lon, lat
+                np.multiply(a[start:start+n], self.dx, out=wa)
+                wa += self.x0
+                np.multiply(b[start:start+n], self.dy, out=wb)
+                wb += self.y0
+                wa, wb = self._transform(False, wa, wb, inplace=True)
+                out_a[start:start+n] = wb
+                out_b[start:start+n] = wa
+        return out_a.reshape(shape), out_b.reshape(shape)
+
+    def to_wrf(self, lat, lon, dtype='float32', chunk_size=DEFAULT_CHUNK_SIZE):
+        # lat, lon arrays -> index_x, index_y arrays (index along west_east and south_north)
+        return self._apply(True, lat, lon, dtype, chunk_size)
+
+    def to_wgs(self, index_x, index_y, dtype='float64', chunk_size=DEFAULT_CHUNK_SIZE):
+        # index_x, index_y arrays -> lat, lon arrays
+        return self._apply(False, index_x, index_y, dtype, chunk_size)
+
+def as_points(coords):
+    # (npoints, 2) array of coordinates given as points (last axis of size 2),
+    # or as (2, npoints) rows of each coordinate, a (2, 2) array is taken as 2 points
+    if coords.shape[0] == 2 and coords.shape[1] != 2:
+        return coords.T
+    return coords
+
 def WGS_to_WRF(coords_WGS, proj_info):
     # convert from tuple to np.ndarrray
     if isinstance(coords_WGS, tuple):
         coords_WGS=np.vstack(coords_WGS)
     # check if input is an array
     if isinstance(coords_WGS, np.ndarray):
-        if coords_WGS.shape[0]<coords_WGS.shape[1]:
-            coords_WGS=coords_WGS.T
+        coords_WGS=as_points(coords_WGS)
         lon = coords_WGS[:,1]
         lat = coords_WGS[:,0]
         input_is_array=True
@@ -27,38 +122,8 @@ def WGS_to_WRF(coords_WGS, proj_info):
         lon=coords_WGS[1]
         lat=coords_WGS[0]
         input_is_array=False
-    
-    wrf_proj = pyproj.Proj(proj='lcc', # projection type: Lambert Conformal Conic
-                       lat_1=proj_info['TRUELAT1'], lat_2=proj_info['TRUELAT2'], # Cone intersects with the sphere
-                       lat_0=proj_info['MOAD_CEN_LAT'], lon_0=proj_info['STAND_LON'], # Center point
-                       a=6370000, b=6370000) # This is it! The Earth is a perfect sphere
-
-    # Easting and Northings of the domains center point
-    wgs_proj = pyproj.Proj(proj='latlong', datum='WGS84')
-
-    python_version = sys.version_info
-
-    # python3 or python2
-    if sys.version_info[0] >= 3:
-        transformer = pyproj.Transformer.from_proj(wgs_proj, wrf_proj)
-
-    if sys.version_info[0] >= 3:
-        cen_lambert_x, cen_lambert_y = transformer.transform(proj_info['CEN_LON'], proj_info['CEN_LAT'])
-    else:
-        cen_lambert_x, cen_lambert_y = pyproj.transform(wgs_proj, wrf_proj, proj_info['CEN_LON'], proj_info['CEN_LAT'])
 
-    nx, ny = proj_info['nI'], proj_info['nJ']
-    dx, dy = proj_info['DX'], proj_info['DY']
-
-    if sys.version_info[0] >= 3:
-        proj_lambert_x, proj_lambert_y = transformer.transform(lon, lat)
-    else:
-        proj_lambert_x, proj_lambert_y = pyproj.transform(wgs_proj, wrf_proj, lon, lat)
-
-    x = proj_lambert_x - (cen_lambert_x - dx * (nx - 1) / 2.)
-    y = proj_lambert_y - (cen_lambert_y - dy * (ny - 1) / 2.)
-
-    index_x, index_y = x / dx, y / dy
+    index_x, index_y = get_projector(proj_info).to_wrf(lat, lon)
 
     if input_is_array:
         coords_WRF = np.vstack((index_x, index_y)).T
@@ -67,6 +132,33 @@ def WGS_to_WRF(coords_WGS, proj_info):
     
     return coords_WRF.astype('float32')
 
+def WRF_to_WGS(coords_WRF, proj_info):
+    # inverse of WGS_to_WRF: (index_x, index_y) -> (lat, lon)
+    coords_WRF = np.asarray(coords_WRF)
+    if coords_WRF.ndim == 1:
+        lat, lon = get_projector(proj_info).to_wgs(coords_WRF[0], coords_WRF[1])
+        return np.asarray([lat, lon])
+    coords_WRF=as_points(coords_WRF)
+    lat, lon = get_projector(proj_info).to_wgs(coords_WRF[:,0], coords_WRF[:,1])
+    return np.vstack((lat, lon)).T
+
+def get_window_slice(window, dim):
+    # index of the dimension dim in a subset window, Ex: (('south_north', 10, 50), ('west_east', 20, 80)).
+    # The window is given on mass points, staggered dimensions get one more point.
+    if window is not None:
+        for wdim, start, stop in window:
+            if dim == wdim:
+                return slice(start, stop)
+            elif dim == wdim + '_stag':
+                return slice(start, stop + 1)
+    return slice(None)
+
+def set_window_range(window, dim, start, stop):
+    # a new window with the range of the mass dimension dim replaced
+    ranges = [(wdim, wstart, wstop) for wdim, wstart, wstop in (window or ()) if wdim != dim]
+    ranges.append((dim, start, stop))
+    return tuple(sorted(ranges))
+
 if __name__ == "__main__":
     # unit test
     dic_proj = {'TRUELAT1':30., 'TRUELAT2':60.,
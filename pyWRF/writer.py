@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: write variables read or derived from WRF output to netCDF4 files
+'''
+
+# global import
+import netCDF4 as nc
+import numpy as np
+import datetime
+
+from pyWRF.derived_vars import DERIVED_VARS
+
+# attributes of DataClass which are written as variables or global attributes, or change with time
+_SKIPPED_ATTS = ['init_time', 'step', 'step_type', 'time', 'proj_info', 'subset', 'z-levels', 'topograph']
+
+# attribute marking the derived variables written, they are read instead of computed by FileClass
+DERIVED_ATTRIBUTE = 'pyWRF_derived'
+
+def get_grid_suffix(dimensions):
+    # name suffix of the heights of a grid, Ex: 'z-levels_U' for the U grid
+    for dim, suffix in [('west_east_stag', '_U'), ('south_north_stag', '_V'), ('bottom_top_stag', '_W')]:
+        if dim in dimensions:
+            return suffix
+    return ''
+
+def get_nc_attribute(value):
+    # netCDF attributes are strings, numbers or 1-D arrays
+    if isinstance(value, (str, int, float, np.number)):
+        return value
+    if isinstance(value, np.ndarray) and value.ndim <= 1:
+        return value
+    return str(value)
+
+class NetCDFWriter(object):
+    # Write DataClass variables to a netCDF4 file, one time slice at a time along an unlimited
+    # Time dimension, so a series of frames is never held in memory.
+    # The WRF projection and START_DATE are written as global attributes, the time as XTIME
+    # (minutes since START_DATE), the coordinates as variables named by their dimension, and the
+    # heights of each grid as 'z-levels[_U|_V|_W]' and 'topograph[_U|_V|_W]'.
+    # A file with the full domain can be read back by FileClass, which then reads the written
+    # derived variables instead of recomputing them.
+    # chunksizes: dictionary of chunk sizes by dimension (default: one time slice per chunk)
+    # zlib, complevel, shuffle, least_significant_digit: compression of the variables
+    # mode: 'w' creates the file, 'a' appends time slices to a file written before
+    def __init__(self, fname, chunksizes=None, zlib=True, complevel=4, shuffle=True,
+                 least_significant_digit=None, mode='w', format='NETCDF4'):
+        self.fname = fname
+        self.chunksizes = chunksizes if chunksizes is not None else {}
+        self.compression = {'zlib':zlib, 'complevel':complevel, 'shuffle':shuffle,
+                            'least_significant_digit':least_significant_digit}
+        self._handle = nc.Dataset(fname, mode, format=format)
+        if 'Time' not in self._handle.dimensions:
+            self._handle.createDimension('Time', None)
+        self.ntimes = len(self._handle.dimensions['Time'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._handle.close()
+
+    def set_global_attributes(self, var):
+        # projection and initial time of the first variable written
+        if 'START_DATE' in self._handle.ncattrs():
+            return
+        atts = {'TITLE':'Variables written by pyWRF'}
+        atts['START_DATE'] = var.attributes['init_time'].strftime('%Y-%m-%d_%H:%M:%S')
+        for att, value in var.attributes.get('proj_info', {}).items():
+            atts[att] = value
+        if 'subset' in var.attributes:
+            atts['subset'] = str(var.attributes['subset'])
+        self._handle.setncatts(dict((att, get_nc_attribute(value)) for att, value in atts.items()))
+
+        xtime = self._handle.createVariable('XTIME', 'f4', ('Time',))
+        xtime.units = 'minutes since ' + var.attributes['init_time'].strftime('%Y-%m-%d %H:%M:%S')
+        xtime.description = 'minutes since simulation start'
+
+    def define_dimensions(self, var, dimensions):
+        for dim, n in zip(dimensions, np.shape(var.data)):
+            if dim not in self._handle.dimensions:
+                self._handle.createDimension(dim, n)
+                coord = self._handle.createVariable(dim, np.asarray(var.coordinates[dim]).dtype, (dim,))
+                coord[:] = var.coordinates[dim]
+            elif len(self._handle.dimensions[dim]) != n:
+                raise ValueError('Dimension {} of {} has size {}, {} in file {}'.format(
+                    dim, var.name, n, len(self._handle.dimensions[dim]), self.fname))
+
+    def get_nc_variable(self, name, var, dimensions, atts=None):
+        # the netCDF variable name, defined at its first write
+        if name in self._handle.variables:
+            return self._handle.variables[name]
+        self.define_dimensions(var, dimensions)
+        dimensions = ('Time',) + tuple(dimensions)
+        chunksizes = [1] + [min(self.chunksizes.get(dim, len(self._handle.dimensions[dim])),
+                                len(self._handle.dimensions[dim])) for dim in dimensions[1:]]
+        ncvar = self._handle.createVariable(name, 'f4', dimensions, chunksizes=chunksizes,
+                                            fill_value=np.float32(np.nan), **self.compression)
+        if atts is not None:
+            ncvar.setncatts(dict((att, get_nc_attribute(value)) for att, value in atts.items()
+                                 if att not in _SKIPPED_ATTS and not att.startswith('_')))
+        if name in DERIVED_VARS:
+            ncvar.setncattr(DERIVED_ATTRIBUTE, 1)
+        return ncvar
+
+    def write_heights(self, var, itime):
+        suffix = get_grid_suffix(var.dimensions)
+        names = {}
+        if 'z-levels' in var.attributes:
+            names['z-levels'] = 'z-levels' + suffix
+            ncvar = self.get_nc_variable(names['z-levels'], var, var.dimensions,
+                                         {'description':'Height', 'units':'m'})
+            if len(ncvar.dimensions) - 1 != np.ndim(var.attributes['z-levels']):
+                raise ValueError('Heights of {} do not match the grid of {}'.format(var.name, names['z-levels']))
+            ncvar[itime] = var.attributes['z-levels']
+        if 'topograph' in var.attributes:
+            names['topograph'] = 'topograph' + suffix
+            topo = var._new_like(var.attributes['topograph'])
+            ncvar = self.get_nc_variable(names['topograph'], topo, var.dimensions[-2:],
+                                         {'description':'Terrain height', 'units':'m'})
+            ncvar[itime] = var.attributes['topograph']
+        return names
+
+    def write(self, dic_var, sync=True):
+        # append one time slice: a dictionary of DataClass (or a list) at the same time
+        variables = list(dic_var.values()) if isinstance(dic_var, dict) else list(dic_var)
+        variables = [var for var in variables if var is not None]
+        if len(variables) == 0:
+            return
+        itime = self.ntimes
+
+        self.set_global_attributes(variables[0])
+        step = variables[0].attributes['step']
+        if variables[0].attributes.get('step_type', 'minutes') != 'minutes':
+            raise ValueError('Only steps in minutes are supported')
+        # minutes since the START_DATE of the file, frames of a series may start at other times
+        start = datetime.datetime.strptime(self._handle.START_DATE, '%Y-%m-%d_%H:%M:%S')
+        time = variables[0].attributes['init_time'] + datetime.timedelta(minutes=float(step))
+        self._handle.variables['XTIME'][itime] = (time - start).total_seconds() / 60.
+
+        written = {}
+        for var in variables:
+            ncvar = self.get_nc_variable(var.name, var, var.dimensions, var.attributes)
+            ncvar[itime] = var.data
+            # the heights of a grid are written once per frame
+            key = tuple(var.dimensions)
+            if key not in written:
+                written[key] = self.write_heights(var, itime)
+            for att, name in written[key].items():
+                ncvar.setncattr(att + '_variable', name)
+
+        self.ntimes += 1
+        if sync:
+            self._handle.sync()
+
+def write_frames(fname, source, var_names, itimes=None, writer_options=None, **kwargs):
+    # stream var_names (a name or a list of names) of a FileClass or SeriesClass to fname,
+    # one frame at a time, kwargs are options of get_variable, writer_options of NetCDFWriter
+    if isinstance(var_names, str):
+        var_names = [var_names]
+    with NetCDFWriter(fname, **(writer_options or {})) as writer:
+        for itime, dic_var in source.iter_frames(list(var_names), itimes, **kwargs):
+            writer.write([dic_var[name] for name in var_names])
+    return fname
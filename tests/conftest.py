@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: fixtures of the tests, synthetic wrfout files
+'''
+
+import datetime
+import os
+import sys
+
+import pytest
+
+# the tests import pyWRF and the generator of the benchmarks from the source tree
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark.make_wrfout import make_wrfout, get_fname
+
+@pytest.fixture(scope='session')
+def wrfout(tmp_path_factory):
+    # 3 frames on a 12 x 10 x 6 grid
+    fname = str(tmp_path_factory.mktemp('wrfout') / 'wrfout_d01_2013-10-06_00_00_00')
+    return make_wrfout(fname, nx=12, ny=10, nz=6, ntimes=3)
+
+@pytest.fixture(scope='session')
+def wrfout_series(tmp_path_factory):
+    # 2 files of 3 hourly frames, the last frame of the first file is the first one of the second
+    directory = str(tmp_path_factory.mktemp('series'))
+    return [make_wrfout(get_fname(directory, start), nx=12, ny=10, nz=6, ntimes=3, start=start)
+            for start in [datetime.datetime(2013, 10, 6), datetime.datetime(2013, 10, 6, 2)]]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: the synthetic wrfout generator and the cases of the I/O benchmark
+'''
+
+import datetime
+
+import numpy as np
+import pytest
+
+import pyWRF as pw
+from benchmark.make_wrfout import make_series
+from benchmark import bench_io
+
+def test_make_series(tmp_path):
+    fnames = make_series(str(tmp_path), nfiles=2, ntimes=2, nx=8, ny=6, nz=4)
+    series = pw.open_series(fnames)
+    assert series.times == [datetime.datetime(2013, 10, 6, hour) for hour in range(4)]
+    # frames of the later files are not copies of the first ones
+    assert not np.array_equal(series.get_variable('W', itime=0).data, series.get_variable('W', itime=2).data)
+    series.close()
+
+def test_synthetic_fields(wrfout):
+    f = pw.open_file(wrfout)
+    dic_var = f.get_variable(['P', 'T', 'QV', 'Zw'], itime=1)
+    assert (np.diff(dic_var['P'].data, axis=0) < 0).all()
+    assert (np.diff(dic_var['Zw'].data, axis=0) > 0).all()
+    assert 200. < dic_var['T'].data.min() and dic_var['T'].data.max() < 320.
+    assert (dic_var['QV'].data > 0.).all()
+
+@pytest.mark.parametrize('case', list(bench_io.CASES.keys()))
+def test_bench_cases(wrfout, case):
+    result = bench_io.run_case(case, wrfout, 1)
+    assert result['case'] == case and result['time'] >= 0. and result['peak_rss'] > 0
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: the variable cache of FileClass, keyed by time step and bounded in memory
+'''
+
+import numpy as np
+import netCDF4 as nc
+
+import pyWRF as pw
+from pyWRF.cache import VariableCache
+
+class _Var(object):
+    # the part of a DataClass seen by the cache
+    def __init__(self, nbytes):
+        self.data = np.zeros(nbytes, dtype='uint8')
+        self.attributes = {}
+
+def read_nc(fname, name, itime):
+    with nc.Dataset(fname) as f:
+        return np.asarray(f.variables[name][itime], dtype='float32')
+
+def test_itime_after_cached_read(wrfout):
+    f = pw.open_file(wrfout)
+    first = f.get_variable('QVAPOR', itime=0).data.copy()
+    last = f.get_variable('QVAPOR', itime=2).data
+    np.testing.assert_array_equal(first, read_nc(wrfout, 'QVAPOR', 0))
+    np.testing.assert_array_equal(last, read_nc(wrfout, 'QVAPOR', 2))
+    assert not np.array_equal(first, last)
+
+def test_cache_hits(wrfout):
+    f = pw.open_file(wrfout)
+    var = f.get_variable('QVAPOR', itime=1)
+    assert f.get_variable('QVAPOR', itime=1).data is var.data
+    stats = f.cache_info()
+    assert stats['hits'] == 1 and stats['entries'] == 1
+    assert stats['bytes'] == var.data.nbytes
+
+def test_lru_eviction():
+    cache = VariableCache(max_bytes=250)
+    for key in 'abc':
+        cache.put(key, _Var(100))
+    # the least recently used entry is dropped to stay within the budget
+    assert list(cache.keys()) == ['b', 'c'] and cache.current_bytes == 200
+    cache.get('b')
+    cache.put('d', _Var(100))
+    assert list(cache.keys()) == ['b', 'd'] and cache.evictions == 2
+
+def test_entry_larger_than_budget_is_kept():
+    cache = VariableCache(max_bytes=10)
+    cache.put('a', _Var(100))
+    assert 'a' in cache
+    cache.put('b', _Var(100))
+    assert list(cache.keys()) == ['b']
+
+def test_update_of_evicted_entry():
+    cache = VariableCache(max_bytes=150)
+    cache.put('a', _Var(100))
+    cache.put('b', _Var(100))
+    cache.update('a')
+    assert list(cache.keys()) == ['b']
+
+def test_small_budget_with_heights(wrfout):
+    f = pw.open_file(wrfout, cache_size=1)
+    dic_var = f.get_variable(['RHO', 'U', 'T'], itime=1, assign_heights=True)
+    assert all('z-levels' in var.attributes for var in dic_var.values())
+    assert len(f.dic_variables) <= 1
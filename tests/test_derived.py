@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: the derived variables against their formulas computed directly from the netCDF variables
+'''
+
+import numpy as np
+import netCDF4 as nc
+import pytest
+
+import pyWRF as pw
+from pyWRF.kernels import WRF_R_D, WRF_RVD_M_O, WRF_G, WRF_EPS
+from pyWRF.derived_vars import FusedEngine
+
+def reference(fname, itime):
+    # the derived variables of a frame with the formulas of the original implementation
+    with nc.Dataset(fname) as f:
+        d = dict((name, np.asarray(var[itime], dtype='float64')) for name, var in f.variables.items() if name != 'Times')
+    ref = {}
+    ref['P'] = d['P'] + d['PB']
+    ref['T'] = (d['T'] + d['T00']) * (ref['P'] / d['P00'])**0.2857
+    ref['Pw'] = ref['P'] * d['QVAPOR'] / (d['QVAPOR'] * (1 - WRF_EPS) + WRF_EPS)
+    moist = d['QVAPOR'] * WRF_RVD_M_O - d['QRAIN'] - d['QCLOUD'] - d['QICE'] - d['QSNOW'] - d['QGRAUP'] + 1.0
+    ref['RHO'] = ref['P'] / (ref['T'] * WRF_R_D * moist)
+    ref['QV_v'] = d['QVAPOR'] * ref['RHO']
+    ref['QR_v'] = d['QRAIN'] * ref['RHO']
+    ref['N'] = (77.6 / ref['T']) * (0.01 * ref['P'] + 4810 * (0.01 * ref['Pw']) / ref['T'])
+    ref['Zw'] = (d['PHB'] + d['PH']) / WRF_G
+    a = WRF_G / (WRF_R_D * (1 + 0.378 * ref['Pw'] / ref['P'])) / ref['T']
+    ref['Zm'] = np.log(2. / (np.exp(-a * ref['Zw'][:-1]) + np.exp(-a * ref['Zw'][1:]))) / a
+    return ref
+
+@pytest.mark.parametrize('name', ['P', 'T', 'Pw', 'RHO', 'QV_v', 'QR_v', 'N', 'Zw', 'Zm'])
+def test_derived_vars(wrfout, name):
+    f = pw.open_file(wrfout)
+    var = f.get_variable(name, itime=1)
+    assert var.data.dtype == np.float32
+    np.testing.assert_allclose(var.data, reference(wrfout, 1)[name], rtol=2e-5, atol=1e-12)
+
+def test_derived_vars_together(wrfout):
+    # the intermediates shared by several derived variables are computed once
+    f = pw.open_file(wrfout)
+    ref = reference(wrfout, 2)
+    dic_var = f.get_variable(['RHO', 'QV_v', 'Zm'], itime=2)
+    for name, var in dic_var.items():
+        np.testing.assert_allclose(var.data, ref[name], rtol=2e-5)
+
+def test_fused_engine_vertical_axis(wrfout):
+    # columns with the vertical axis last give the same results
+    with nc.Dataset(wrfout) as f:
+        names = {'Pp':'P', 'PB':'PB', 'Thetap':'T', 'T00':'T00', 'P00':'P00', 'QV':'QVAPOR',
+                 'QR':'QRAIN', 'QC':'QCLOUD', 'QI':'QICE', 'QS':'QSNOW', 'QG':'QGRAUP', 'PHB':'PHB', 'PH':'PH'}
+        fields = dict((name, np.moveaxis(np.asarray(f.variables[ncname][1], dtype='float32'), 0, -1)
+                       if f.variables[ncname].ndim == 4 else np.float32(f.variables[ncname][1]))
+                      for name, ncname in names.items())
+    results = FusedEngine(fields, vertical_axis=2).evaluate(['RHO', 'Zm'])
+    ref = reference(wrfout, 1)
+    for name in ['RHO', 'Zm']:
+        np.testing.assert_allclose(np.moveaxis(results[name], -1, 0), ref[name], rtol=2e-5)
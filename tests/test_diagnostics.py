@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: column-integrated and column-reduced diagnostics
+'''
+
+import numpy as np
+import pytest
+
+import pyWRF as pw
+from pyWRF.diagnostics import get_column_diagnostics, iter_column_diagnostics, get_diagnostic_inputs, \
+    DEFAULT_TOP_THRESHOLD
+
+@pytest.fixture
+def f(wrfout):
+    return pw.open_file(wrfout)
+
+def test_inputs():
+    assert get_diagnostic_inputs('PW') == ['QV_v', 'Zw']
+    assert get_diagnostic_inputs(['CTOP', 'PW']) == ['QR_v', 'QC_v', 'QI_v', 'QS_v', 'QG_v', 'Zm', 'QV_v', 'Zw']
+    with pytest.raises(ValueError):
+        get_diagnostic_inputs(['ECHO'])
+
+def test_paths(f):
+    dic_diag = get_column_diagnostics(f, ['PW', 'LWP', 'QC_path', 'QR_path'], itime=1)
+    dic_var = f.get_variable(['QV_v', 'Zw'], itime=1)
+    dz = np.diff(dic_var['Zw'].data, axis=0)
+    np.testing.assert_allclose(dic_diag['PW'].data, (dic_var['QV_v'].data * dz).sum(axis=0), rtol=1e-5)
+    np.testing.assert_allclose(dic_diag['LWP'].data, dic_diag['QC_path'].data + dic_diag['QR_path'].data, rtol=1e-6)
+    PW = dic_diag['PW']
+    assert PW.data.shape == f.get_shape('HGT') and PW.dimensions == ('south_north', 'west_east')
+    assert PW.attributes['units'] == 'kg/m2' and 'z-levels' not in PW.attributes
+
+def test_reductions(f):
+    dic_diag = get_column_diagnostics(f, ['CMAX', 'CTOP'], itime=2)
+    dic_var = f.get_variable(['QC_v', 'QR_v', 'QI_v', 'QS_v', 'QG_v', 'Zm'], itime=2)
+    total = sum(dic_var[Q+'_v'].data for Q in ['QC', 'QR', 'QI', 'QS', 'QG'])
+    np.testing.assert_allclose(dic_diag['CMAX'].data, total.max(axis=0), rtol=1e-6)
+    CTOP = dic_diag['CTOP'].data
+    for j, i in [(0, 0), (5, 7)]:
+        levels = np.flatnonzero(total[:, j, i] >= DEFAULT_TOP_THRESHOLD)
+        if len(levels) == 0:
+            assert np.isnan(CTOP[j, i])
+        else:
+            assert CTOP[j, i] == dic_var['Zm'].data[levels[-1], j, i]
+
+def test_single_name(f):
+    PW = get_column_diagnostics(f, 'PW', itime=0)
+    assert list(PW.keys()) == ['PW']
+    for itime, dic_diag in iter_column_diagnostics(f, 'PW'):
+        np.testing.assert_array_equal(dic_diag['PW'].data, get_column_diagnostics(f, ['PW'], itime=itime)['PW'].data)
+
+def test_series(wrfout_series):
+    series = pw.open_series(wrfout_series)
+    itimes = [itime for itime, _ in iter_column_diagnostics(series, ['TWP'])]
+    assert itimes == list(range(series.ntimes))
+    series.close()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: the persistent disk cache of derived variables and heights
+'''
+
+import os
+
+import numpy as np
+import pytest
+
+import pyWRF as pw
+from pyWRF.cache import DiskCache
+
+def test_derived_vars_from_disk(wrfout, tmp_path, monkeypatch):
+    directory = str(tmp_path / 'cache')
+    f = pw.open_file(wrfout, disk_cache=directory)
+    ref = f.get_variable(['RHO', 'U'], itime=1, assign_heights=True)
+    assert f.disk_cache.stats()['entries'] > 0
+
+    # another run reads RHO and the heights from disk, only U is read from the file
+    f = pw.open_file(wrfout, disk_cache=directory)
+    reads = []
+    read_slab = f.read_slab
+    def counting_read_slab(varname, *args, **kwargs):
+        reads.append(varname)
+        return read_slab(varname, *args, **kwargs)
+    monkeypatch.setattr(f, 'read_slab', counting_read_slab)
+    dic_var = f.get_variable(['RHO', 'U'], itime=1, assign_heights=True)
+    assert reads == ['U']
+    for name in ['RHO', 'U']:
+        np.testing.assert_array_equal(dic_var[name].data, ref[name].data)
+        np.testing.assert_array_equal(dic_var[name].attributes['z-levels'], ref[name].attributes['z-levels'])
+    assert dic_var['RHO'].attributes['time'] == ref['RHO'].attributes['time']
+
+    # the memory map is read-only, in-place operators and item assignments copy it
+    RHO = dic_var['RHO']
+    RHO *= 2.
+    RHO[0] = 0.
+    np.testing.assert_array_equal(f.get_variable('RHO', itime=1).data, ref['RHO'].data)
+
+def test_warm_disk_cache(wrfout, tmp_path):
+    f = pw.open_file(wrfout, disk_cache=str(tmp_path / 'cache'))
+    stats = f.warm_disk_cache(itimes=[0])
+    assert stats['entries'] > 0
+    assert f.in_persistent_cache('Zm', {'itime':0, 'get_proj_info':True, 'subset':None})
+    assert not f.in_persistent_cache('Zm', {'itime':1, 'get_proj_info':True, 'subset':None})
+    with pytest.raises(ValueError):
+        pw.open_file(wrfout).warm_disk_cache()
+
+def test_disk_cache_eviction(tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache'), max_bytes=2000)
+    for age, key in enumerate(['a', 'b', 'c']):
+        cache.save(key, [np.zeros(200, dtype='float32')], {'key':key})
+        # the last access is the modification time of the metadata
+        os.utime(cache.get_path(key, '.pkl'), (1e9 + age, 1e9 + age))
+    assert cache.evictions > 0 and cache.current_bytes <= 2000
+    assert 'c' in cache and 'a' not in cache
+    arrays, meta = cache.load('c')
+    assert meta == {'key':'c'} and not arrays[0].flags.writeable
+    assert cache.load('a') is None
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: FileClass.get_variable against the netCDF variables of a synthetic wrfout file
+'''
+
+import numpy as np
+import netCDF4 as nc
+import pytest
+
+import pyWRF as pw
+
+def read_frame(fname, itime):
+    # the netCDF variables of a frame, in float64
+    with nc.Dataset(fname) as f:
+        return dict((name, np.asarray(var[itime], dtype='float64')) for name, var in f.variables.items() if name != 'Times')
+
+@pytest.mark.parametrize('name, ncname', [('QVAPOR', 'QVAPOR'), ('QV', 'QVAPOR'), ('U', 'U'), ('HGT', 'HGT')])
+def test_read_time_slab(wrfout, name, ncname):
+    f = pw.open_file(wrfout)
+    var = f.get_variable(name, itime=1)
+    ref = read_frame(wrfout, 1)[ncname]
+    assert var.data.dtype == np.float32
+    assert var.data.shape == ref.shape
+    assert var.dim == ref.ndim and 'Time' not in var.dimensions
+    np.testing.assert_allclose(var.data, ref, rtol=1e-6)
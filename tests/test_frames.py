@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: FileClass.iter_frames, frames prefetched in a background thread
+'''
+
+import numpy as np
+import pytest
+
+import pyWRF as pw
+
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_frames_equal_get_variable(wrfout, prefetch):
+    frames = pw.open_file(wrfout)
+    f = pw.open_file(wrfout)
+    itimes = []
+    for itime, dic_var in frames.iter_frames(['RHO', 'U', 'QV'], prefetch=prefetch):
+        itimes.append(itime)
+        for name, var in dic_var.items():
+            np.testing.assert_array_equal(var.data, f.get_variable(name, itime=itime).data)
+    assert itimes == [0, 1, 2]
+
+def test_frames_subset_of_times(wrfout):
+    f = pw.open_file(wrfout)
+    assert [itime for itime, _ in f.iter_frames('T', itimes=[2, 0])] == [2, 0]
+
+def test_frames_release_previous_frames(wrfout):
+    f = pw.open_file(wrfout)
+    for itime, dic_var in f.iter_frames(['RHO']):
+        assert all(key[1] == itime for key in f.dic_variables.keys())
+    assert not f._prefetched and not f._static_slabs
+
+def test_static_slabs_shared_and_read_only(wrfout):
+    f = pw.open_file(wrfout)
+    slabs = []
+    for itime, dic_var in f.iter_frames(['HGT', 'PB']):
+        HGT = dic_var['HGT']
+        slabs.append(HGT.data)
+        assert not HGT.data.flags.writeable
+        # in-place operators and item assignments copy the shared slab
+        HGT += 1.
+        PB = dic_var['PB']
+        PB[0] = 0.
+        assert HGT.data is not slabs[-1] and PB.data.flags.writeable
+    assert slabs[0] is slabs[1] is slabs[2]
+    np.testing.assert_array_equal(slabs[0], pw.open_file(wrfout).get_variable('HGT').data)
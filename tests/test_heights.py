@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: heights shared read-only per time and grid, and their memory in the variable cache
+'''
+
+import numpy as np
+
+import pyWRF as pw
+
+def destagger(field, axis):
+    # the field of the mass grid on a staggered grid: averages of the neighbours, the edges repeated
+    field = np.moveaxis(field, axis, -1)
+    mid = 0.5 * (field[..., :-1] + field[..., 1:])
+    return np.moveaxis(np.concatenate([mid[..., :1], mid, mid[..., -1:]], axis=-1), -1, axis)
+
+def test_heights_of_each_grid(wrfout):
+    f = pw.open_file(wrfout)
+    dic_var = f.get_variable(['T', 'U', 'V', 'W'], itime=1, assign_heights=True)
+    Zm, Zw = f.get_variable('Zm', itime=1).data, f.get_variable('Zw', itime=1).data
+    HGT = f.get_variable('HGT', itime=1).data
+    np.testing.assert_allclose(dic_var['T'].attributes['z-levels'], Zm, rtol=1e-6)
+    np.testing.assert_allclose(dic_var['W'].attributes['z-levels'], Zw, rtol=1e-6)
+    np.testing.assert_allclose(dic_var['U'].attributes['z-levels'], destagger(Zm, -1), rtol=1e-6)
+    np.testing.assert_allclose(dic_var['V'].attributes['z-levels'], destagger(Zm, -2), rtol=1e-6)
+    np.testing.assert_allclose(dic_var['U'].attributes['topograph'], destagger(HGT, -1), rtol=1e-6)
+    np.testing.assert_allclose(dic_var['W'].attributes['topograph'], HGT, rtol=1e-6)
+
+def test_heights_shared_by_grid(wrfout):
+    f = pw.open_file(wrfout)
+    dic_var = f.get_variable(['T', 'QV', 'U'], itime=1, assign_heights=True)
+    assert dic_var['T'].attributes['z-levels'] is dic_var['QV'].attributes['z-levels']
+    assert not dic_var['T'].attributes['z-levels'].flags.writeable
+    assert dic_var['U'].attributes['z-levels'] is not dic_var['T'].attributes['z-levels']
+
+def test_shared_heights_across_staggers(wrfout):
+    f = pw.open_file(wrfout)
+    dic_var = f.get_variable(['T', 'U', 'QV'], itime=1, assign_heights=True, shared_heights=True)
+    # only the variables on the grid of the first variable reuse its heights
+    assert dic_var['U'].attributes['z-levels'].shape == dic_var['U'].data.shape
+    assert dic_var['QV'].attributes['z-levels'] is dic_var['T'].attributes['z-levels']
+
+def test_heights_in_cache_budget(wrfout):
+    f = pw.open_file(wrfout)
+    dic_var = f.get_variable(['T', 'U'], itime=1, assign_heights=True)
+    heights = sum(dic_var[name].attributes[att].nbytes for name in ['T', 'U'] for att in ['z-levels', 'topograph'])
+    stats = f.cache_info()
+    assert stats['bytes'] == sum(f.dic_variables._nbytes.values())
+    assert stats['bytes'] >= heights + dic_var['T'].data.nbytes + dic_var['U'].data.nbytes
+    f.release_time(1)
+    assert f.cache_info()['bytes'] == 0
+
+def test_small_budget_over_frames(wrfout):
+    f = pw.open_file(wrfout, cache_size=1)
+    for itime in range(3):
+        dic_var = f.get_variable(['T', 'U', 'V', 'W'], itime=itime, assign_heights=True)
+        assert all('z-levels' in var.attributes for var in dic_var.values())
+    assert len(f.dic_variables) <= 1
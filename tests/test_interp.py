@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: PointInterpolator, variables interpolated to (lat, lon, height) points
+'''
+
+import numpy as np
+import pytest
+
+import pyWRF as pw
+from pyWRF.interp import PointInterpolator, interpolate_points
+
+@pytest.fixture
+def f(wrfout):
+    return pw.open_file(wrfout)
+
+def get_latlon(f, j, i):
+    lat, lon = f.get_variable('XLAT').data, f.get_variable('XLONG').data
+    return lat[j, i], lon[j, i]
+
+def test_grid_points(f):
+    # at the grid points and their heights, the values of the grid
+    T = f.get_variable('T', itime=1, assign_heights=True)
+    j, i = np.array([2, 5, 7]), np.array([3, 4, 9])
+    lat, lon = get_latlon(f, j, i)
+    k = np.array([0, 2, 4])
+    values = PointInterpolator(f.get_projection(), lat, lon, T.attributes['z-levels'][k, j, i])(T)
+    np.testing.assert_allclose(values, T.data[k, j, i], rtol=1e-4)
+
+def test_linear_between_levels(f):
+    T = f.get_variable('T', itime=1, assign_heights=True)
+    Z = T.attributes['z-levels']
+    lat, lon = get_latlon(f, np.array([4]), np.array([6]))
+    height = 0.25 * Z[1, 4, 6] + 0.75 * Z[2, 4, 6]
+    values = PointInterpolator(f.get_projection(), lat, lon, [height])(T)
+    np.testing.assert_allclose(values, 0.25 * T.data[1, 4, 6] + 0.75 * T.data[2, 4, 6], rtol=1e-4)
+
+def test_staggered_grids(f):
+    # U at a mass point is the mean of its two neighbours on the U grid
+    U = f.get_variable('U', itime=1, assign_heights=True)
+    Z = U.attributes['z-levels']
+    j, i = np.array([3, 6]), np.array([4, 8])
+    lat, lon = get_latlon(f, j, i)
+    values = interpolate_points(f, 'U', lat, lon, 0.5 * (Z[2, j, i] + Z[2, j, i+1]), itime=1)['U']
+    np.testing.assert_allclose(values, 0.5 * (U.data[2, j, i] + U.data[2, j, i+1]), rtol=1e-4)
+
+def test_outside_points(f):
+    T = f.get_variable('T', itime=1, assign_heights=True)
+    lat, lon = get_latlon(f, np.array([5, 5]), np.array([5, 5]))
+    values = PointInterpolator(f.get_projection(), lat, lon + np.array([0., 20.]), [1e5, 3000.])(T)
+    assert np.isnan(values).all()
+
+def test_weights_shared_by_grid(f):
+    dic_var = f.get_variable(['T', 'QV', 'U'], itime=1, assign_heights=True)
+    lat, lon = get_latlon(f, np.array([4]), np.array([6]))
+    interpolator = PointInterpolator(f.get_projection(), lat, lon, [2000.])
+    for name in ['T', 'QV', 'U']:
+        interpolator(dic_var[name])
+    assert len(interpolator._grids) == 2
+
+def test_logp(f):
+    T = f.get_variable('T', itime=1)
+    P = f.get_variable('P', itime=1)
+    lat, lon = get_latlon(f, np.array([4]), np.array([6]))
+    values = PointInterpolator(f.get_projection(), lat, lon, P.data[3, 4, 6], vertical='logp')(T, vcoord=P)
+    np.testing.assert_allclose(values, T.data[3, 4, 6], rtol=1e-4)
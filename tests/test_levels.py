@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: variables interpolated to pressure and height levels with cached level indices
+'''
+
+import numpy as np
+import pytest
+
+import pyWRF as pw
+from pyWRF.interp import VerticalInterpolator
+
+def reference(data, vcoord, levels, log=False):
+    # column by column with np.interp, NaN outside of the column
+    nz = data.shape[0]
+    data, vcoord = data.reshape(nz, -1).astype('float64'), vcoord.reshape(nz, -1).astype('float64')
+    if log:
+        vcoord, levels = np.log(vcoord), np.log(levels)
+    out = np.empty((len(levels), data.shape[1]))
+    for icol in range(data.shape[1]):
+        x, y = vcoord[:, icol], data[:, icol]
+        if x[-1] < x[0]:
+            x, y = x[::-1], y[::-1]
+        out[:, icol] = np.interp(levels, x, y, left=np.nan, right=np.nan)
+    return out
+
+def test_vertical_interpolator():
+    rng = np.random.default_rng(0)
+    vcoord = np.cumsum(rng.uniform(100., 500., (8, 5, 4)), axis=0)
+    data = rng.normal(size=(8, 5, 4))
+    levels = [50., 800., 1500., 2500., 1e4]
+    for chunk_size in [None, 3]:
+        out = VerticalInterpolator(vcoord, levels, chunk_size=chunk_size)(data)
+        np.testing.assert_allclose(out.reshape(len(levels), -1), reference(data, vcoord, levels), rtol=1e-5, atol=1e-6)
+
+def test_pressure_levels(wrfout):
+    f = pw.open_file(wrfout)
+    levels = [90000., 70000., 50000.]
+    T = f.get_variable_on_levels('T', levels, itime=1)
+    ref = reference(f.get_variable('T', itime=1).data, f.get_variable('P', itime=1).data, levels, log=True)
+    np.testing.assert_allclose(T.data.reshape(len(levels), -1), ref, rtol=1e-5)
+    assert T.dimensions == ('P_levels', 'south_north', 'west_east')
+    np.testing.assert_array_equal(T.coordinates['P_levels'], levels)
+
+def test_height_levels(wrfout):
+    f = pw.open_file(wrfout)
+    levels = [1000., 3000.]
+    dic_levels = f.get_variable_on_levels(['QV', 'W'], levels, coordinate='AGL', itime=1)
+    for name in ['QV', 'W']:
+        var = f.get_variable(name, itime=1, assign_heights=True)
+        agl = var.attributes['z-levels'] - var.attributes['topograph']
+        np.testing.assert_allclose(dic_levels[name].data.reshape(len(levels), -1),
+                                   reference(var.data, agl, levels), rtol=1e-5, atol=1e-9)
+
+def test_interpolator_shared_and_released(wrfout):
+    f = pw.open_file(wrfout)
+    dic_var = f.get_variable(['T', 'QV'], itime=1)
+    interpolator = f.get_level_interpolator(dic_var['T'], [85000.], 1)
+    assert f.get_level_interpolator(dic_var['QV'], [85000.], 1) is interpolator
+    # kept in the variable cache with the variables of its time step
+    assert f.cache_info()['bytes'] >= interpolator.nbytes
+    f.release_time(1)
+    assert len(f.dic_variables) == 0
+
+def test_interpolators_bounded(wrfout):
+    f = pw.open_file(wrfout, cache_size=1)
+    for itime in range(3):
+        for level in [90000., 80000., 70000.]:
+            f.get_variable_on_levels('T', [level], itime=itime)
+    assert len(f.dic_variables) <= 1
+
+def test_single_name_out(wrfout):
+    f = pw.open_file(wrfout)
+    out = np.empty((2, 10, 12), dtype='float32')
+    T = f.get_variable_on_levels('T', [85000., 70000.], itime=1, out=out)
+    assert T.data is out
+
+def test_invalid_coordinate(wrfout):
+    f = pw.open_file(wrfout)
+    with pytest.raises(ValueError):
+        f.get_variable_on_levels('T', [1.], coordinate='theta')
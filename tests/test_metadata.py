@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: the metadata of DataClass, shared attributes and coordinates copied on write
+'''
+
+import pickle
+
+import numpy as np
+
+import pyWRF as pw
+from pyWRF.data import DataClass, Attributes, Coordinates
+
+def test_slots(wrfout):
+    var = pw.open_file(wrfout).get_variable('T', itime=0)
+    assert not hasattr(var, '__dict__')
+    assert isinstance(var.attributes, Attributes) and isinstance(var.coordinates, Coordinates)
+
+def test_attributes_shared_by_file(wrfout):
+    f = pw.open_file(wrfout)
+    T0 = f.get_variable('QVAPOR', itime=0)
+    T1 = f.get_variable('QVAPOR', itime=1)
+    assert T0.attributes._base is T1.attributes._base
+    T0.attributes['units'] = 'g kg-1'
+    del T0.attributes['description']
+    assert T1.attributes['units'] == 'kg kg-1' and 'description' in T1.attributes
+    assert 'description' not in T0.attributes and 'description' not in dict(T0.attributes)
+
+def test_attributes_overlay():
+    base = {'units':'K', 'stagger':''}
+    atts = Attributes(base)
+    cp = atts.copy()
+    cp['units'] = 'C'
+    cp['level_type'] = 'P'
+    del cp['stagger']
+    assert dict(atts) == base and dict(cp) == {'units':'C', 'level_type':'P'}
+    assert base == {'units':'K', 'stagger':''}
+
+def test_grid_coordinates_as_ranges(wrfout):
+    var = pw.open_file(wrfout).get_variable('QVAPOR', itime=0)
+    nz, ny, nx = var.data.shape
+    assert var.coordinates.get_range('west_east') == range(nx)
+    np.testing.assert_array_equal(var.coordinates['west_east'], np.arange(nx))
+    assert list(var.coordinates.keys()) == list(var.dimensions)
+
+def test_coordinates_copy_on_write():
+    coords = Coordinates([('bottom_top', range(5)), ('west_east', range(3))])
+    cp = coords.copy()
+    assert cp._coords is coords._coords
+    cp['bottom_top'] = np.arange(2)
+    assert coords.get_range('bottom_top') == range(5) and len(cp['bottom_top']) == 2
+    del coords['west_east']
+    assert list(cp.keys()) == ['bottom_top', 'west_east'] and list(coords.keys()) == ['bottom_top']
+
+def test_operator_results_share_metadata(wrfout):
+    T = pw.open_file(wrfout).get_variable('T', itime=1)
+    result = T * 2.
+    assert result.coordinates._coords is T.coordinates._coords
+    assert result.attributes._base is T.attributes._base
+    assert result._owns_data and not T._owns_data
+
+def test_metadata_round_trip(wrfout):
+    var = pw.open_file(wrfout).get_variable('QVAPOR', itime=1)
+    meta = pickle.loads(pickle.dumps(var.get_metadata()))
+    assert 'file' not in meta and 'data' not in meta and '_owns_data' not in meta
+    cp = DataClass()
+    cp.set_metadata(meta)
+    cp.data = var.data
+    assert dict(cp.attributes) == dict(var.attributes)
+    assert cp.dimensions == var.dimensions and list(cp.coordinates.keys()) == list(var.coordinates.keys())
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: DataClass operators, in-place operators and indexing with the file cache
+'''
+
+import numpy as np
+import pytest
+
+import pyWRF as pw
+
+@pytest.fixture
+def f(wrfout):
+    return pw.open_file(wrfout)
+
+def test_operators(f):
+    P = f.get_variable('P', itime=1)
+    Q = f.get_variable('QV', itime=1)
+    np.testing.assert_allclose((P + Q).data, P.data + Q.data)
+    np.testing.assert_allclose((1. - Q).data, 1. - Q.data)
+    np.testing.assert_allclose((2. / P).data, 2. / P.data)
+    np.testing.assert_allclose((P // 100.).data, P.data // 100.)
+    np.testing.assert_allclose((P ** 2).data, P.data ** 2, rtol=1e-6)
+    np.testing.assert_allclose((-P).data, -P.data)
+    assert (P * Q).data.dtype == np.float32
+    assert (P * Q).dimensions == P.dimensions
+
+def test_shape_mismatch(f):
+    with pytest.raises(TypeError):
+        f.get_variable('U', itime=1) + f.get_variable('V', itime=1)
+
+def test_inplace_operators_keep_cache(f):
+    P = f.get_variable('P', itime=1)
+    ref = P.data.copy()
+    P /= 100.
+    np.testing.assert_allclose(P.data, ref / 100.)
+    # neither the cached pressure nor the variables derived from it later are changed
+    np.testing.assert_array_equal(f.get_variable('P', itime=1).data, ref)
+    T = f.get_variable('T', itime=1)
+    assert 200. < T.data.mean() < 320.
+
+    RHO = f.get_variable('RHO', itime=1)
+    ref = RHO.data.copy()
+    RHO *= 2.
+    RHO *= 2. # owned from now on, written in place
+    np.testing.assert_allclose(RHO.data, 4. * ref)
+    np.testing.assert_array_equal(f.get_variable('RHO', itime=1).data, ref)
+
+def test_inplace_operators_on_results(f):
+    P = f.get_variable('P', itime=1) * 1.
+    data = P.data
+    P += 1.
+    assert P.data is data
+
+def test_indexing(f):
+    Zw = f.get_variable('Zw', itime=1)
+    ref = Zw.data.copy()
+    np.testing.assert_array_equal(Zw[:,0,0], ref[:,0,0])
+    Zw[1] = 0.
+    assert Zw[1].max() == 0.
+    np.testing.assert_array_equal(f.get_variable('Zw', itime=1).data, ref)
+
+def test_result_coordinates_are_copies(f):
+    T = f.get_variable('T', itime=1)
+    T.coordinates['bottom_top'] = np.arange(T.data.shape[0])
+    result = T * 2.
+    result.coordinates['bottom_top'] = np.zeros(T.data.shape[0])
+    np.testing.assert_array_equal(T.coordinates['bottom_top'], np.arange(T.data.shape[0]))
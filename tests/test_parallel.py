@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: process_times, the time steps of a file computed in a pool of processes
+'''
+
+import os
+
+import numpy as np
+import pytest
+
+import pyWRF as pw
+
+def test_process_times(wrfout):
+    f = pw.open_file(wrfout)
+    itimes = []
+    for itime, dic in pw.process_times(wrfout, ['RHO', 'U'], max_workers=2):
+        itimes.append(itime)
+        for name, data in dic.items():
+            np.testing.assert_array_equal(data, f.get_variable(name, itime=itime).data)
+    assert itimes == [0, 1, 2]
+
+def test_single_name_kept_outputs(wrfout, tmp_path):
+    results = dict(pw.process_times(wrfout, 'QV_v', itimes=[2, 0], max_workers=1, ordered=False,
+                                    out_dir=str(tmp_path)))
+    assert sorted(results.keys()) == [0, 2] and list(results[0].keys()) == ['QV_v']
+    out = np.load(os.path.join(str(tmp_path), 'QV_v.npy'))
+    assert out.shape == (2,) + pw.open_file(wrfout).get_shape('QV_v')
+
+def test_missing_variable(wrfout):
+    with pytest.raises(ValueError):
+        next(pw.process_times(wrfout, ['RHO', 'NOT_A_VARIABLE']))
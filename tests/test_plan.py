@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: the registry of the derived variables and the plan of the requests
+'''
+
+import numpy as np
+
+import pyWRF as pw
+from pyWRF.derived_vars import DERIVED_VARS, DERIVED_REGISTRY, get_input_vars
+
+def test_registry():
+    for name in DERIVED_VARS:
+        assert name in DERIVED_REGISTRY
+        assert len(get_input_vars(name)) > 0
+    assert 'P' in get_input_vars('RHO') and 'T' in get_input_vars('RHO')
+
+def test_plan_order(wrfout):
+    f = pw.open_file(wrfout)
+    order, depths, consumers = f.get_plan(['RHO', 'Zm'], {'itime':0, 'get_proj_info':True, 'subset':None})[:3]
+    # every variable appears once, after its inputs
+    assert len(order) == len(set(order))
+    for name in order:
+        if name in DERIVED_VARS:
+            assert all(order.index(inp) < order.index(name) for inp in get_input_vars(name))
+    assert depths['RHO'] == 0 and depths['P'] > 0
+    assert consumers['P'] >= 3 # T, Pw, RHO and Zm
+
+def test_base_variables_read_once(wrfout, monkeypatch):
+    f = pw.open_file(wrfout)
+    reads = []
+    read_slab = f.read_slab
+    def counting_read_slab(varname, *args, **kwargs):
+        reads.append(varname)
+        return read_slab(varname, *args, **kwargs)
+    monkeypatch.setattr(f, 'read_slab', counting_read_slab)
+    f.get_variable(['RHO', 'QV_v', 'N', 'Zm'], itime=1)
+    assert len(reads) == len(set(reads))
+    assert 'PB' in reads and 'QVAPOR' in reads
+
+def test_cached_derived_not_expanded(wrfout):
+    f = pw.open_file(wrfout)
+    RHO = f.get_variable('RHO', itime=1)
+    order = f.get_plan(['QV_v'], {'itime':1, 'get_proj_info':True, 'subset':None})[0]
+    assert 'RHO' in order and 'P' not in order
+    np.testing.assert_array_equal(f.get_variable('QV_v', itime=1).data,
+                                  f.get_variable('QV', itime=1).data * RHO.data)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: logging and the opt-in profiler of the reads and computations
+'''
+
+import json
+import logging
+
+import pyWRF as pw
+from pyWRF.profiler import get_timer
+
+def test_silent_by_default(wrfout, capsys):
+    f = pw.open_file(wrfout)
+    f.get_variable('RHO', itime=1)
+    assert capsys.readouterr().out == ''
+
+def test_variable_trace(wrfout, caplog):
+    with caplog.at_level(logging.DEBUG, logger='pyWRF'):
+        pw.open_file(wrfout).get_variable('RHO', itime=1)
+    messages = [record.getMessage() for record in caplog.records]
+    assert '>RHO' in messages and '---->P' in messages
+
+def test_missing_variable_warning(wrfout, caplog):
+    with caplog.at_level(logging.WARNING, logger='pyWRF'):
+        assert pw.open_file(wrfout).get_variable('NOT_A_VARIABLE') is None
+    assert 'NOT_A_VARIABLE' in caplog.text
+
+def test_profiler(wrfout, tmp_path):
+    f = pw.open_file(wrfout)
+    profiler = f.enable_profiler()
+    f.get_variable(['RHO', 'QV'], itime=1)
+    f.get_variable('RHO', itime=1)
+    stats = profiler.to_dict()
+    assert stats['reads']['QVAPOR']['reads'] == 1
+    assert stats['reads']['QVAPOR']['read_bytes'] == f.get_variable('QV', itime=1).data.nbytes
+    assert stats['variables']['RHO']['computes'] == 1 and stats['variables']['RHO']['cache_hits'] == 1
+    assert stats['total']['reads'] == sum(record['reads'] for record in stats['reads'].values())
+    fname = str(tmp_path / 'profile.json')
+    text = profiler.to_json(fname)
+    with open(fname) as f_json:
+        assert json.load(f_json) == json.loads(text) == json.loads(json.dumps(profiler.to_dict()))
+
+    f.disable_profiler()
+    reads = profiler.to_dict()['total']['reads']
+    f.get_variable('T', itime=2)
+    assert profiler.to_dict()['total']['reads'] == reads
+
+def test_tiles_profiled_together(wrfout):
+    f = pw.open_file(wrfout)
+    profiler = f.enable_profiler()
+    f.get_tiled_variable(['RHO', 'Zm'], 6, itime=1)
+    assert profiler.to_dict()['variables']['RHO+Zm']['computes'] == 4
+
+def test_series_profiler(wrfout_series):
+    series = pw.open_series(wrfout_series, max_open=1)
+    profiler = series.enable_profiler()
+    for itime in [0, 4]:
+        series.get_variable('QV', itime=itime)
+    assert profiler.to_dict()['reads']['QVAPOR']['reads'] == 2
+    series.close()
+
+def test_timer_off():
+    with get_timer(None) as elapsed:
+        pass
+    assert elapsed == [0.]
+    with get_timer(pw.Profiler()) as elapsed:
+        sum(range(1000))
+    assert elapsed[0] > 0.
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: WRFProjector and WGS_to_WRF/WRF_to_WGS against the lat/lon of the synthetic wrfout grid
+'''
+
+import numpy as np
+
+import pyWRF as pw
+from pyWRF.utilities import WRF_to_WGS, get_projector
+
+def get_grid(wrfout):
+    f = pw.open_file(wrfout)
+    lat, lon = f.get_variable('XLAT').data, f.get_variable('XLONG').data
+    return lat, lon, f.get_variable('XLAT').attributes['proj_info']
+
+def test_grid_points(wrfout):
+    lat, lon, proj_info = get_grid(wrfout)
+    coords = pw.WGS_to_WRF(np.vstack((lat.ravel(), lon.ravel())).T, proj_info)
+    iy, ix = np.mgrid[0:lat.shape[0], 0:lat.shape[1]]
+    np.testing.assert_allclose(coords[:,0], ix.ravel(), atol=1e-3)
+    np.testing.assert_allclose(coords[:,1], iy.ravel(), atol=1e-3)
+
+def test_round_trip(wrfout):
+    lat, lon, proj_info = get_grid(wrfout)
+    points = np.array([[2.5, 3.25], [0., 0.], [10.75, 8.5]])
+    coords = WRF_to_WGS(points, proj_info)
+    np.testing.assert_allclose(pw.WGS_to_WRF(coords, proj_info), points, atol=1e-3)
+
+def test_input_layouts(wrfout):
+    lat, lon, proj_info = get_grid(wrfout)
+    ref = pw.WGS_to_WRF(np.array([[lat[2, 3], lon[2, 3]], [lat[5, 7], lon[5, 7]], [lat[1, 1], lon[1, 1]]]), proj_info)
+    # rows of each coordinate, a tuple of coordinate arrays
+    rows = np.array([[lat[2, 3], lat[5, 7], lat[1, 1]], [lon[2, 3], lon[5, 7], lon[1, 1]]])
+    np.testing.assert_array_equal(pw.WGS_to_WRF(rows, proj_info), ref)
+    np.testing.assert_array_equal(pw.WGS_to_WRF((rows[0], rows[1]), proj_info), ref)
+    # a single point, as a point array or as a pair of scalars
+    np.testing.assert_array_equal(pw.WGS_to_WRF(np.array([[lat[2, 3], lon[2, 3]]]), proj_info), ref[:1])
+    np.testing.assert_array_equal(pw.WGS_to_WRF([lat[2, 3], lon[2, 3]], proj_info), ref[0])
+    np.testing.assert_allclose(WRF_to_WGS(np.array([[3., 2.]]), proj_info), [[lat[2, 3], lon[2, 3]]], atol=1e-4)
+
+def test_projector_chunks(wrfout):
+    lat, lon, proj_info = get_grid(wrfout)
+    projector = get_projector(proj_info)
+    assert get_projector(dict(proj_info)) is projector
+    ix, iy = projector.to_wrf(lat, lon)
+    ix_chunked, iy_chunked = projector.to_wrf(lat, lon, chunk_size=7)
+    assert ix.shape == lat.shape
+    np.testing.assert_array_equal(ix, ix_chunked)
+    np.testing.assert_array_equal(iy, iy_chunked)
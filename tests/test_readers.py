@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: the pool of readers decoding the base variables of a request concurrently
+'''
+
+import os
+
+import numpy as np
+import pytest
+
+import pyWRF as pw
+from pyWRF.readers import ReaderPool
+
+# the tests reading with the readers use processes, the thread readers need a thread-safe
+# build of the netCDF-C and HDF5 libraries (see ReaderPool)
+
+def test_readers_equal_serial_reads(wrfout):
+    f = pw.open_file(wrfout)
+    ref = pw.open_file(wrfout)
+    f.enable_readers(nreaders=2)
+    try:
+        for itime in range(3):
+            dic_var = f.get_variable(['RHO', 'Zm', 'U'], itime=itime)
+            for name, var in dic_var.items():
+                np.testing.assert_array_equal(var.data, ref.get_variable(name, itime=itime).data)
+        assert not f._pending
+    finally:
+        f.close()
+
+def test_frames_with_readers(wrfout):
+    f = pw.open_file(wrfout)
+    ref = pw.open_file(wrfout)
+    f.enable_readers(nreaders=2)
+    for itime, dic_var in f.iter_frames(['T', 'QV']):
+        for name, var in dic_var.items():
+            np.testing.assert_array_equal(var.data, ref.get_variable(name, itime=itime).data)
+    f.disable_readers()
+    assert f.readers is None and not f._pending
+
+def test_release_time_cancels_reads(wrfout):
+    # nothing else reads the file while the reader thread runs
+    f = pw.open_file(wrfout)
+    f.enable_readers(nreaders=1, kind='thread')
+    f.submit_reads(['P', 'PB', 'QVAPOR'], 1)
+    f.submit_reads(['P'], 2)
+    f.release_time(1)
+    assert list(f._pending.keys()) == [('P', 2, None)]
+    f.close()
+
+def test_invalid_kind(wrfout):
+    with pytest.raises(ValueError):
+        ReaderPool(wrfout, kind='fiber')
+
+def test_series_shares_cores(wrfout_series):
+    series = pw.open_series(wrfout_series, max_open=2)
+    series.enable_readers()
+    assert series.reader_options['nreaders'] == max(1, (os.cpu_count() or 1) // 2)
+    np.testing.assert_array_equal(series.get_variable('T', itime=3).data,
+                                  pw.open_series(wrfout_series).get_variable('T', itime=3).data)
+    series.disable_readers()
+    series.close()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: regridding to regular lat/lon grids with precomputed sparse weights
+'''
+
+import numpy as np
+import pytest
+
+import pyWRF as pw
+from pyWRF.regrid import Regridder, SparseWeights
+from pyWRF.utilities import get_projector
+
+@pytest.fixture
+def f(wrfout):
+    return pw.open_file(wrfout)
+
+def get_target(f, n=5):
+    # a lat/lon grid inside of the domain
+    lat = f.get_variable('XLAT', itime=0).data
+    lon = f.get_variable('XLONG', itime=0).data
+    return np.linspace(lat.min() + 0.02, lat.max() - 0.02, n), np.linspace(lon.min() + 0.02, lon.max() - 0.02, n + 1)
+
+def test_sparse_weights():
+    weights = SparseWeights.from_coo([0, 0, 2], [1, 2, 0], [0.25, 0.75, 1.], (3, 3))
+    values = np.array([[1., 2., 4.], [3., 5., 7.]], dtype='float32')
+    result = weights.dot(values)
+    np.testing.assert_allclose(result[:, [0, 2]], [[3.5, 1.], [6.5, 3.]])
+    assert np.isnan(result[:, 1]).all() and result.dtype == np.float32
+
+def test_bilinear_at_grid_points(f):
+    # target points on mass points give the values of the variable
+    proj_info = f.get_projection()
+    index_x, index_y = np.array([2., 7.]), np.array([3., 6.])
+    lat, lon = get_projector(proj_info).to_wgs(index_x, index_y)
+    regridder = Regridder(proj_info, lat, lon)
+    var = f.get_variable('QVAPOR', itime=1)
+    result = regridder(var)
+    assert result.dimensions[-2:] == ('lat', 'lon') and result.data.shape == (var.data.shape[0], 2, 2)
+    for k in range(2):
+        np.testing.assert_allclose(result.data[:, k, k], var.data[:, int(index_y[k]), int(index_x[k])], rtol=1e-4)
+
+@pytest.mark.parametrize('method', ['bilinear', 'conservative'])
+def test_weights_shared_by_grid(f, method):
+    lat, lon = get_target(f)
+    regridder = Regridder(f.get_projection(), lat, lon, method=method)
+    T = regridder(f.get_variable('T', itime=0))
+    regridder(f.get_variable('QVAPOR', itime=1))
+    assert len(regridder._grids) == 1
+    U = regridder(f.get_variable('U', itime=0))
+    assert len(regridder._grids) == 2
+    # constant fields are preserved, and the result is within the range of the source
+    assert np.isfinite(T.data).all() and np.isfinite(U.data).all()
+    ones = regridder.regrid_array(f.get_variable('T', itime=0), np.ones(f.get_shape('T')))
+    np.testing.assert_allclose(ones, 1., rtol=1e-6)
+
+def test_heights_regridded(f):
+    lat, lon = get_target(f)
+    regridder = Regridder(f.get_projection(), lat, lon)
+    T = f.get_variable('T', itime=0, assign_heights=True)
+    result = regridder(T)
+    assert result.attributes['z-levels'].shape == result.data.shape
+    assert 'proj_info' not in result.attributes and 'z-levels' in T.attributes
+    result[0] = 0. # owned, not the data of the cache
+    assert f.get_variable('T', itime=0).data[0].min() > 0.
+
+def test_save_load(f, tmp_path):
+    lat, lon = get_target(f)
+    regridder = Regridder(f.get_projection(), lat, lon, method='conservative')
+    var = f.get_variable('QVAPOR', itime=2)
+    ref = regridder(var).data
+    fname = str(tmp_path / 'weights.npz')
+    regridder.save(fname)
+    loaded = Regridder.load(fname)
+    assert loaded.method == 'conservative' and len(loaded._grids) == 1
+    np.testing.assert_array_equal(loaded(var).data, ref)
+
+def test_invalid_method(f):
+    with pytest.raises(ValueError):
+        Regridder(f.get_projection(), [30.], [120.], method='nearest')
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: a multi-file wrfout series read as one dataset
+'''
+
+import datetime
+import os
+
+import numpy as np
+
+import pyWRF as pw
+from pyWRF.series import open_series
+
+def test_global_time_axis(wrfout_series):
+    series = open_series(os.path.join(os.path.dirname(wrfout_series[0]), 'wrfout_d01_*'))
+    assert series.fnames == wrfout_series
+    # the duplicated frame at 02:00 is counted once
+    assert series.ntimes == 5
+    assert series.times == [datetime.datetime(2013, 10, 6, hour) for hour in range(5)]
+    series.close()
+
+def test_get_variable_across_files(wrfout_series):
+    series = open_series(wrfout_series)
+    first, second = [pw.open_file(fname) for fname in wrfout_series]
+    # the duplicated frame is taken from the first file
+    np.testing.assert_array_equal(series.get_variable('RHO', itime=2).data, first.get_variable('RHO', itime=2).data)
+    np.testing.assert_array_equal(series.get_variable('RHO', itime=4).data, second.get_variable('RHO', itime=2).data)
+    series.close()
+
+def test_iter_frames_across_files(wrfout_series):
+    series = open_series(wrfout_series, max_open=1)
+    itimes = []
+    for itime, dic_var in series.iter_frames(['T', 'QV']):
+        itimes.append(itime)
+        ref = series.get_variable(['T', 'QV'], itime=itime)
+        for name in ref:
+            np.testing.assert_array_equal(dic_var[name].data, ref[name].data)
+    assert itimes == list(range(5))
+    assert len(series._pool) == 1
+    series.close()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: time series at stations, read column by column
+'''
+
+import numpy as np
+import pytest
+
+import pyWRF as pw
+from pyWRF.utilities import get_projector
+
+def get_station(f, i, j):
+    # lat, lon of the mass point (i, j)
+    lat, lon = get_projector(f.get_projection()).to_wgs(np.array([float(i)]), np.array([float(j)]))
+    return lat, lon
+
+@pytest.mark.parametrize('method', ['nearest', 'bilinear'])
+def test_station_on_grid_point(wrfout, method):
+    f = pw.open_file(wrfout)
+    lat, lon = get_station(f, 4, 3)
+    dic_series = f.get_station_series(['QVAPOR', 'RHO', 'T00'], lat, lon, method=method)
+    assert dic_series['QVAPOR'].shape == (1, 3, f.get_shape('QVAPOR')[0])
+    assert dic_series['T00'].shape == (1, 3)
+    for itime in range(3):
+        for name in ['QVAPOR', 'RHO']:
+            np.testing.assert_allclose(dic_series[name][0, itime], f.get_variable(name, itime=itime).data[:, 3, 4],
+                                       rtol=1e-5)
+
+def test_staggered_station(wrfout):
+    f = pw.open_file(wrfout)
+    lat, lon = get_station(f, 4, 3)
+    U = f.get_station_series('U', lat, lon, itimes=[1], method='bilinear')
+    # the mass point is halfway between two U points
+    ref = f.get_variable('U', itime=1).data[:, 3, 4:6].mean(axis=-1)
+    np.testing.assert_allclose(U[0, 0], ref, rtol=1e-5)
+    assert np.isnan(f.get_station_series('QVAPOR', [89.], [0.])).all()
+
+def test_series_stations(wrfout_series):
+    series = pw.open_series(wrfout_series)
+    f = series.get_file(0)[0]
+    lat, lon = get_station(f, 2, 1)
+    QV = series.get_station_series('QVAPOR', lat, lon)
+    assert QV.shape[:2] == (1, series.ntimes)
+    for itime in range(series.ntimes):
+        np.testing.assert_array_equal(QV[0, itime], series.get_variable('QVAPOR', itime=itime).data[:, 1, 2])
+    series.close()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: the subset option of get_variable against slices of the full domain
+'''
+
+import numpy as np
+import pytest
+
+import pyWRF as pw
+
+SUBSET = {'south_north':(2, 7), 'west_east':(3, 9), 'bottom_top':(1, 4)}
+
+def get_slices(dimensions, window):
+    # the slice of each dimension of the full domain inside a window (staggered dimensions get one more point)
+    bounds = dict((dim, (start, stop)) for dim, start, stop in window)
+    slices = []
+    for dim in dimensions:
+        start, stop = bounds.get(dim.replace('_stag', ''), (None, None))
+        if stop is not None and dim.endswith('_stag'):
+            stop += 1
+        slices.append(slice(start, stop))
+    return tuple(slices)
+
+@pytest.mark.parametrize('name', ['QV', 'U', 'V', 'W', 'HGT', 'RHO', 'Zw'])
+def test_index_window(wrfout, name):
+    f = pw.open_file(wrfout)
+    full = f.get_variable(name, itime=1)
+    var = f.get_variable(name, itime=1, subset=SUBSET)
+    index = get_slices(full.dimensions, f.get_window(SUBSET))
+    np.testing.assert_allclose(var.data, full.data[index], rtol=1e-6)
+    assert var.data.shape == f.get_shape(name, subset=SUBSET)
+    for i, dim in enumerate(full.dimensions):
+        np.testing.assert_array_equal(var.coordinates[dim], full.coordinates[dim][index[i]])
+    assert var.attributes['proj_info']['nI'] == full.attributes['proj_info']['nI']
+
+def test_heights_of_a_window(wrfout):
+    f = pw.open_file(wrfout)
+    for name in ['U', 'V', 'T']:
+        full = f.get_variable(name, itime=1, assign_heights=True)
+        var = f.get_variable(name, itime=1, subset=SUBSET, assign_heights=True)
+        index = get_slices(full.dimensions, f.get_window(SUBSET))
+        np.testing.assert_allclose(var.attributes['z-levels'], full.attributes['z-levels'][index], rtol=1e-6)
+        np.testing.assert_allclose(var.attributes['topograph'], full.attributes['topograph'][index[1:]], rtol=1e-6)
+
+def test_latlon_box(wrfout):
+    f = pw.open_file(wrfout)
+    lat, lon = f.get_variable('XLAT').data, f.get_variable('XLONG').data
+    box = {'lat':(float(lat[3, 4]), float(lat[6, 4])), 'lon':(float(lon[4, 3]), float(lon[4, 8]))}
+    window = dict((dim, (start, stop)) for dim, start, stop in f.get_window(box))
+    # the box is inside the window
+    assert window['south_north'][0] <= 3 and window['south_north'][1] >= 7
+    assert window['west_east'][0] <= 3 and window['west_east'][1] >= 9
+    var = f.get_variable('XLAT', subset=box)
+    np.testing.assert_array_equal(var.data, lat[get_slices(('south_north', 'west_east'), f.get_window(box))])
+
+def test_invalid_subsets(wrfout):
+    f = pw.open_file(wrfout)
+    assert f.get_window({'south_north':(0, 100)}) is None
+    with pytest.raises(ValueError):
+        f.get_window({'Time':(0, 1)})
+    with pytest.raises(ValueError):
+        f.get_window({'west_east':(20, 30)})
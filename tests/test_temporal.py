@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: streaming temporal statistics, one frame at a time
+'''
+
+import numpy as np
+import pytest
+
+import pyWRF as pw
+from pyWRF.temporal import StreamingStatistics, P2Quantile, reduce_frames
+
+def test_statistics_of_arrays():
+    rng = np.random.default_rng(0)
+    frames = rng.normal(size=(20, 4, 3))
+    frames[3, 0, 0] = np.nan
+    stats = StreamingStatistics()
+    for frame in frames:
+        stats.update(frame)
+    np.testing.assert_array_equal(stats.count, (~np.isnan(frames)).sum(axis=0))
+    np.testing.assert_allclose(stats.mean, np.nanmean(frames, axis=0))
+    np.testing.assert_allclose(stats.variance, np.nanvar(frames, axis=0, ddof=1))
+    np.testing.assert_allclose(stats.sum, np.nansum(frames, axis=0))
+    np.testing.assert_array_equal(stats.min, np.nanmin(frames, axis=0))
+    np.testing.assert_array_equal(stats.time_of_max, np.nanargmax(frames, axis=0))
+    with pytest.raises(ValueError):
+        stats.update(frames[0, 0])
+
+def test_p2_quantile():
+    rng = np.random.default_rng(1)
+    frames = rng.uniform(size=(2000, 3))
+    quantile = P2Quantile(0.9, (3,))
+    for frame in frames:
+        quantile.update(frame)
+    np.testing.assert_allclose(quantile.get_value(), np.quantile(frames, 0.9, axis=0), atol=0.02)
+    # exact with less than 5 values
+    few = P2Quantile(0.5, (1,))
+    for x in [3., 1., 2.]:
+        few.update(np.array([x]))
+    assert few.get_value()[0] == 2.
+    with pytest.raises(ValueError):
+        P2Quantile(1.5, (1,))
+
+def test_reduce_frames(wrfout):
+    f = pw.open_file(wrfout)
+    stats = reduce_frames(f, 'QV_v', percentiles=[50])
+    assert list(stats.keys()) == ['QV_v']
+    frames = np.stack([f.get_variable('QV_v', itime=itime).data for itime in range(3)]).astype('float64')
+    np.testing.assert_allclose(stats['QV_v'].mean, frames.mean(axis=0), rtol=1e-6)
+    np.testing.assert_allclose(stats['QV_v'].get_percentile(50), np.median(frames, axis=0), rtol=1e-6)
+    var = stats['QV_v'].get_var('max')
+    assert var.data.dtype == np.float32 and var.attributes['statistic'] == 'max'
+    assert var.dimensions == f.get_variable('QV_v', itime=0).dimensions and 'z-levels' not in var.attributes
+
+def test_reduce_series(wrfout_series):
+    series = pw.open_series(wrfout_series)
+    stats = reduce_frames(series, ['T'])['T']
+    assert len(stats.times) == series.ntimes
+    np.testing.assert_array_equal(stats.count, series.ntimes)
+    series.close()
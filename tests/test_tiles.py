@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: tiled evaluation of derived variables against the full-domain variables
+'''
+
+import numpy as np
+import pytest
+
+import pyWRF as pw
+
+NAMES = ['RHO', 'Zm', 'QV_v', 'U', 'HGT']
+
+@pytest.mark.parametrize('tile_size', [4, (3, 5), 100])
+def test_tiles_equal_full_domain(wrfout, tile_size):
+    f = pw.open_file(wrfout)
+    dic_var = f.get_tiled_variable(NAMES, tile_size, itime=1)
+    for name in NAMES:
+        full = f.get_variable(name, itime=1)
+        np.testing.assert_allclose(dic_var[name].data, full.data, rtol=1e-6)
+        assert dic_var[name].dimensions == full.dimensions
+        for dim in full.dimensions:
+            np.testing.assert_array_equal(dic_var[name].coordinates[dim], full.coordinates[dim])
+        assert 'subset' not in dic_var[name].attributes
+
+def test_tiles_of_a_window(wrfout):
+    f = pw.open_file(wrfout)
+    subset = {'south_north':(2, 8), 'west_east':(1, 10)}
+    window = f.get_window(subset)
+    dic_var = f.get_tiled_variable(['RHO', 'V'], 4, itime=1, window=window)
+    for name in ['RHO', 'V']:
+        np.testing.assert_allclose(dic_var[name].data, f.get_variable(name, itime=1, subset=subset).data, rtol=1e-6)
+        assert dic_var[name].attributes['subset'] == window
+
+def test_tiles_into_outputs(wrfout, tmp_path):
+    f = pw.open_file(wrfout)
+    out = {'RHO':np.empty(f.get_shape('RHO'), dtype='float32'), 'Zm':str(tmp_path / 'Zm.npy')}
+    dic_var = f.get_tiled_variable(['RHO', 'Zm'], 5, itime=1, out=out)
+    assert dic_var['RHO'].data is out['RHO']
+    # the results are not cached
+    assert len(f.dic_variables) == 0
+    np.testing.assert_allclose(np.load(out['Zm']), f.get_variable('Zm', itime=1).data, rtol=1e-6)
+
+def test_tiles_invalid_output(wrfout):
+    f = pw.open_file(wrfout)
+    with pytest.raises(ValueError):
+        f.get_tiled_variable(['RHO'], 4, out={'RHO':np.empty((2, 2), dtype='float32')})
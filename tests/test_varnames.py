@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: the resolution of variable names, aliases and derived variables, and missing variables
+'''
+
+import pyWRF as pw
+import pyWRF.WRFio as WRFio
+
+def test_check_varname(wrfout):
+    f = pw.open_file(wrfout)
+    assert f.check_varname('QVAPOR') == 'QVAPOR'
+    assert f.check_varname('QV') == 'QVAPOR'
+    assert f.check_varname('RHO') == 'RHO'
+    assert f.check_varname('NOT_A_VARIABLE') == ''
+    assert f.check_varnames(['QV', 'U', 'X']) == {'QV':'QVAPOR', 'U':'U', 'X':''}
+
+def test_alias_table_read_once(wrfout):
+    assert WRFio.get_alias_dic() is WRFio.get_alias_dic()
+    f = pw.open_file(wrfout)
+    assert f.get_varname_index() is f.get_varname_index()
+
+def test_missing_variables(wrfout):
+    f = pw.open_file(wrfout)
+    assert f.get_missing_variables(['QV', 'RHO', 'N', 'Zm', 'X']) == ['X']
+    assert f.check_if_variables_in_file(['QV', 'RHO'])
+    assert not f.check_if_variables_in_file(['QV', 'X'])
+
+def test_missing_base_fields(wrfout, tmp_path):
+    # derived variables and aliases are missing if their base fields are not in the file
+    fname = pw.open_file(wrfout).to_netcdf(str(tmp_path / 'rho.nc'), ['RHO', 'QV'], itimes=[0])
+    f = pw.open_file(fname)
+    assert f.get_missing_variables(['RHO', 'QV', 'QV_v', 'N', 'Zm', 'T', 'QR']) == ['N', 'Zm', 'T', 'QR']
+    assert f.check_if_variables_in_file(['QV_v'])
+    assert not f.check_if_variables_in_file(['N'])
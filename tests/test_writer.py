@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+'''
+@Description: variables written by NetCDFWriter and read back by FileClass
+'''
+
+import netCDF4 as nc
+import numpy as np
+
+import pyWRF as pw
+from pyWRF.writer import NetCDFWriter, DERIVED_ATTRIBUTE
+
+def test_round_trip(wrfout, tmp_path):
+    f = pw.open_file(wrfout)
+    fname = f.to_netcdf(str(tmp_path / 'derived.nc'), ['RHO', 'U', 'QV'], assign_heights=True)
+    out = pw.open_file(fname)
+    assert out.ntimes == 3
+    for itime in range(3):
+        ref = f.get_variable(['RHO', 'U', 'QV'], itime=itime, assign_heights=True)
+        for name in ['RHO', 'U', 'QV']:
+            var = out.get_variable(name, itime=itime, assign_heights=True)
+            np.testing.assert_array_equal(var.data, ref[name].data)
+            np.testing.assert_array_equal(var.attributes['z-levels'], ref[name].attributes['z-levels'])
+            np.testing.assert_array_equal(var.attributes['topograph'], ref[name].attributes['topograph'])
+            assert var.attributes['time'] == ref[name].attributes['time']
+    # the derived variables written are read, not computed again
+    assert out.get_stored_derived_vars() == ['RHO']
+    assert out.get_plan(['RHO'], {'itime':0, 'get_proj_info':True, 'subset':None})[0] == ['RHO']
+
+def test_single_name(wrfout, tmp_path):
+    f = pw.open_file(wrfout)
+    fname = f.to_netcdf(str(tmp_path / 'rho.nc'), 'RHO', itimes=[1])
+    with nc.Dataset(fname) as out:
+        assert 'RHO' in out.variables and out.variables['RHO'].shape[0] == 1
+        assert out.variables['RHO'].getncattr(DERIVED_ATTRIBUTE) == 1
+        assert out.START_DATE == '2013-10-06_00:00:00'
+        np.testing.assert_array_equal(out.variables['XTIME'][:], [60.])
+
+def test_compression_and_chunks(wrfout, tmp_path):
+    f = pw.open_file(wrfout)
+    fname = str(tmp_path / 'chunked.nc')
+    f.to_netcdf(fname, ['T'], writer_options={'chunksizes':{'bottom_top':2}, 'complevel':1})
+    with nc.Dataset(fname) as out:
+        assert out.variables['T'].chunking() == [1, 2, 10, 12]
+        assert out.variables['T'].filters()['zlib']
+
+def test_append_variable(wrfout, tmp_path):
+    f = pw.open_file(wrfout)
+    fname = str(tmp_path / 'frames.nc')
+    for itime in range(2):
+        f.get_variable('P', itime=itime).to_netcdf(fname, mode='w' if itime == 0 else 'a')
+    with nc.Dataset(fname) as out:
+        assert out.variables['P'].shape[0] == 2
+        np.testing.assert_array_equal(out.variables['P'][1], f.get_variable('P', itime=1).data)
+
+def test_series_to_netcdf(wrfout_series, tmp_path):
+    series = pw.open_series(wrfout_series)
+    fname = series.to_netcdf(str(tmp_path / 'series.nc'), 'T')
+    with nc.Dataset(fname) as out:
+        assert out.variables['T'].shape[0] == series.ntimes
+        np.testing.assert_array_equal(out.variables['XTIME'][:], np.arange(5) * 60.)
+    series.close()